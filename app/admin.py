@@ -2,9 +2,14 @@
 # Afaq Virk 101338854
 # Admin Functions
 
-from datetime import datetime, date
-from models import Equipment, EquipmentStatus, Session, Schedule, Enrollment, Role, User, ScheduleType, Bill, Service, Item, Room
-from app.cli_utils import menu, header, pause, sleep, error
+import json
+from datetime import date, datetime, timedelta
+import services
+from services import ServiceError
+from services.availability import CLOSE_TIME, OPEN_TIME
+from app.cli_utils import (menu, header, pause, sleep, error, warn, read_recurrence, report_series, show_free_slots,
+                           WEEKDAYS)
+from app.profiling import run_action
 
 
 def manage_equipment(session, user):
@@ -19,42 +24,29 @@ def manage_equipment(session, user):
     
     try:
         if choice == '1':
-            # SELECT * FROM equipment
-            equipment_list = session.query(Equipment).all()
             print("\nEquipment List:")
-            for eq in equipment_list:
-                room_name = eq.room.name if eq.room else "N/A"
-                print(f"{eq.id}. {eq.name} - Room: {room_name} - Status: {eq.status.type}")
+            for eq in services.list_equipment(session):
+                print(f"{eq['id']}. {eq['name']} - Room: {eq['room'] or 'N/A'} - Status: {eq['status']}")
         
         elif choice == '2':
             eq_id = int(input("\nEquipment ID: ").strip())
-            # SELECT * FROM equipment WHERE id = ? LIMIT 1
-            equipment = session.query(Equipment).filter_by(id=eq_id).first()
+            equipment = services.get_equipment(session, eq_id)
             
-            if not equipment:
-                error("Equipment not found!")
-                return
-            
-            print(f"\nEquipment: {equipment.name}")
-            print(f"Current Status: {equipment.status.type}")
+            print(f"\nEquipment: {equipment['name']}")
+            print(f"Current Status: {equipment['status']}")
             
-            # SELECT * FROM equipment_status
-            statuses = session.query(EquipmentStatus).all()
             print("\nAvailable Statuses:")
-            for status in statuses:
-                print(f"{status.id}. {status.type}")
+            for status in services.list_equipment_statuses(session):
+                print(f"{status['id']}. {status['type']}")
             
             new_status = int(input("\nNew status ID: ").strip())
-            if not any(s.id == new_status for s in statuses):
-                error("Invalid status ID!")
-                return
-            equipment.status_id = new_status
-            session.commit()
+            services.update_equipment_status(session, eq_id, new_status)
             print("[SUCCESS] Equipment status updated!")
         else:
             error("Invalid choice!")
+    except ServiceError as e:
+        error(str(e))
     except Exception as e:
-        session.rollback()
         error(f"Error: {e}")
 
 def manage_class_schedule(session, user):
@@ -64,52 +56,34 @@ def manage_class_schedule(session, user):
     print("\n1. View All Classes")
     print("2. Create New Class")
     print("3. Cancel Class")
-    print("4. Back")
+    print("4. Auto-Schedule Classes from File")
+    print("5. Back")
     
     choice = input("\nChoice: ").strip()
     
     if choice == '1':
-        today = date.today()
-        # SELECT * FROM session JOIN schedule ON session.schedule_id = schedule.id WHERE schedule.date >= ? ORDER BY schedule.date, schedule.start_time
-        classes = session.query(Session).join(Schedule).filter(
-            Schedule.date >= today
-        ).order_by(Schedule.date, Schedule.start_time).all()
-        
         print("\nUpcoming Classes:")
-        for sess in classes:
-            sched = sess.schedule
-            # SELECT COUNT(*) FROM enrollment WHERE session_id = ?
-            enrolled = session.query(Enrollment).filter_by(session_id=sess.id).count()
-            print(f"{sess.id}. {sess.name} - {sched.date} at {sched.start_time}")
-            print(f"Trainer: {sched.trainer.first_name} {sched.trainer.last_name}")
-            loc = sess.room.name if getattr(sess, "room", None) else (sess.location or "TBA")
-            print(f"Location: {loc} | Enrolled: {enrolled}/{sess.size}")
+        for cls in services.list_classes(session):
+            print(f"{cls['id']}. {cls['name']} - {cls['date']} at {cls['start_time']}")
+            print(f"Trainer: {cls['trainer']}")
+            print(f"Location: {cls['location']} | Enrolled: {cls['enrolled']}/{cls['size']}")
     
     elif choice == '2':
         try:
-            # Get trainers
-            # SELECT * FROM role WHERE name = 'Trainer' LIMIT 1
-            trainer_role = session.query(Role).filter_by(name='Trainer').first()
-            # SELECT * FROM user WHERE role = ?
-            trainers = session.query(User).filter_by(role=trainer_role.id).all()
-            
+            trainers = services.list_trainers(session)
             print("\nTrainers:")
             for i, trainer in enumerate(trainers, 1):
-                print(f"{i}. {trainer.first_name} {trainer.last_name}")
+                print(f"{i}. {trainer['first_name']} {trainer['last_name']}")
             
             trainer_choice = int(input("\nSelect trainer: ").strip())
             selected_trainer = trainers[trainer_choice - 1]
             
-            # Get room
-            rooms = session.query(Room).all()
             print("\nRooms:")
-            for r in rooms:
-                print(f"{r.id}. {r.name} (capacity {r.capacity})")
+            for r in services.list_rooms(session):
+                print(f"{r['id']}. {r['name']} (capacity {r['capacity']})")
             room_id = int(input("\nSelect room (ID): ").strip())
-            selected_room = session.query(Room).filter_by(id=room_id).first()
-            if not selected_room:
-                error("Invalid room selection!")
-                return
+            show_free_slots(services.next_free_slots(session, 60, trainer_id=selected_trainer["id"], room_id=room_id),
+                            "Next free hours for this trainer and room")
             
             # Get class details
             date_str = input("Date (YYYY-MM-DD): ").strip()
@@ -125,64 +99,52 @@ def manage_class_schedule(session, user):
             class_desc = input("Class description: ").strip()
             capacity = int(input("Capacity: ").strip())
             
-            # Room conflict check
-            conflict = (session.query(Session)
-                        .join(Schedule)
-                        .filter(
-                            Session.room_id == selected_room.id,
-                            Schedule.date == class_date,
-                            Schedule.start_time < end_time,
-                            Schedule.end_time > start_time
-                        )
-                        .first())
-            if conflict:
-                error("Room is already booked for an overlapping time slot.")
-                return
-            
-            # Create schedule
-            # SELECT * FROM schedule_type WHERE type = 'Group Class' LIMIT 1
-            group_class_type = session.query(ScheduleType).filter_by(type='Group Class').first()
-            new_schedule = Schedule(
-                trainer_id=selected_trainer.id,
-                date=class_date,
-                start_time=start_time,
-                end_time=end_time,
-                type=group_class_type.id
-            )
-            session.add(new_schedule)
-            session.flush()
-            
-            # Create session
-            new_session = Session(
-                schedule_id=new_schedule.id,
-                size=capacity,
-                name=class_name,
-                desc=class_desc,
-                location=selected_room.name,
-                room_id=selected_room.id,
-                sex_restrict='A'
-            )
-            session.add(new_session)
-            session.commit()
-            print("[SUCCESS] Class created successfully!")
+            recurrence = read_recurrence()
+            if recurrence:
+                dates = services.weekly_dates(class_date, *recurrence)
+                result = services.create_class_series(session, selected_trainer["id"], room_id, dates, start_time,
+                                                      end_time, class_name, class_desc, capacity)
+                report_series(result, "class(es)")
+            else:
+                services.create_class(session, selected_trainer["id"], room_id, class_date, start_time,
+                                      end_time, class_name, class_desc, capacity)
+                print("[SUCCESS] Class created successfully!")
+        except ServiceError as e:
+            error(str(e))
         except Exception as e:
-            session.rollback()
             error(f"Error: {e}")
     
     elif choice == '3':
         try:
             class_id = int(input("\nClass ID to cancel: ").strip())
-            # SELECT * FROM session WHERE id = ? LIMIT 1
-            class_to_cancel = session.query(Session).filter_by(id=class_id).first()
-            
-            if class_to_cancel:
-                session.delete(class_to_cancel)
-                session.commit()
-                print("[SUCCESS] Class cancelled successfully!")
-            else:
-                error("Class not found!")
+            services.cancel_class(session, class_id)
+            print("[SUCCESS] Class cancelled successfully!")
+        except ServiceError as e:
+            error(str(e))
+        except Exception as e:
+            error(f"Error: {e}")
+    
+    elif choice == '4':
+        try:
+            path = input("\nClasses file (JSON list): ").strip()
+            with open(path, encoding="utf-8") as fh:
+                requests = services.class_requests(session, json.load(fh))
+            plan = services.schedule_classes(session, requests, dry_run=True)
+            for placed in plan["placed"]:
+                print(f"{placed['request']}. {placed['name']} - {placed['date']} at {placed['start_time']:%H:%M} "
+                      f"| Trainer {placed['trainer_id']} | {placed['location']}")
+            for unplaced in plan["unplaced"]:
+                warn(f"{unplaced['request']}. {unplaced['name']} - not placed: {unplaced['reason']}")
+            if not plan["placed"]:
+                return
+            if input(f"\nCreate these {len(plan['placed'])} classes? (y/n): ").strip().lower() != 'y':
+                return
+            # Planned again inside the write transaction, so bookings made since the preview are respected
+            plan = services.schedule_classes(session, requests)
+            print(f"[SUCCESS] {len(plan['placed'])} classes created, {len(plan['unplaced'])} not placed.")
+        except ServiceError as e:
+            error(str(e))
         except Exception as e:
-            session.rollback()
             error(f"Error: {e}")
 
 
@@ -193,89 +155,210 @@ def process_billing(session, user):
     print("\n1. Create New Bill")
     print("2. View Unpaid Bills")
     print("3. Process Payment")
-    print("4. Back")
+    print("4. Receivables Report")
+    print("5. Run Monthly Billing")
+    print("6. Back")
     
     choice = input("\nChoice: ").strip()
     
     if choice == '1':
         try:
-            # Get member
-            # SELECT * FROM role WHERE name = 'Member' LIMIT 1
-            member_role = session.query(Role).filter_by(name='Member').first()
-            # SELECT * FROM user WHERE role = ?
-            members = session.query(User).filter_by(role=member_role.id).all()
-            
+            members = services.list_members(session)
             print("\nMembers:")
             for i, member in enumerate(members, 1):
-                print(f"{i}. {member.first_name} {member.last_name} ({member.email})")
+                print(f"{i}. {member['first_name']} {member['last_name']} ({member['email']})")
             
             member_choice = int(input("\nSelect member: ").strip())
             selected_member = members[member_choice - 1]
             
-            # Create bill
-            new_bill = Bill(
-                admin_id=user.id,
-                member_id=selected_member.id,
-                date=date.today(),
-                paid=False
-            )
-            session.add(new_bill)
-            session.flush()
-            
-            # Add items
-            # SELECT * FROM service
-            services = session.query(Service).all()
             print("\nServices:")
-            for service in services:
-                print(f"{service.id}. {service.name} - ${service.price}")
+            for service in services.list_services(session):
+                print(f"{service['id']}. {service['name']} - ${service['price']}")
             
+            # Collect line items, then create the bill in one transaction
+            items = []
             while True:
                 service_id = input("\nService ID (0 to finish): ").strip()
                 if service_id == '0':
                     break
                 
                 quantity = int(input("Quantity: ").strip())
-                
-                item = Item(
-                    bill_id=new_bill.id,
-                    service_id=int(service_id),
-                    quantity=quantity
-                )
-                session.add(item)
+                items.append((int(service_id), quantity))
             
-            session.commit()
+            services.create_bill(session, user.id, selected_member["id"], items)
             print("[SUCCESS] Bill created successfully!")
+        except ServiceError as e:
+            error(str(e))
         except Exception as e:
-            session.rollback()
             error(f"Error: {e}")
     
     elif choice == '2':
-        # SELECT * FROM bill WHERE paid = FALSE
-        unpaid_bills = session.query(Bill).filter_by(paid=False).all()
-        
-        print("\nUnpaid Bills:")
-        for bill in unpaid_bills:
-            total = sum(float(item.service.price) * item.quantity for item in bill.items)
-            print(f"Bill #{bill.id} - {bill.member.first_name} {bill.member.last_name}")
-            print(f"Date: {bill.date}, Amount: ${total:.2f}")
+        after = None
+        while True:
+            page = services.unpaid_bills(session, after=after)
+            print("\nUnpaid Bills (oldest first):")
+            if not page["bills"]:
+                print("No unpaid bills.")
+            for bill in page["bills"]:
+                print(f"Bill #{bill['id']} - {bill['member']}")
+                print(f"Date: {bill['date']}, Amount: ${bill['total']:.2f}")
+            if not page["next"] or input("\nN for more, Enter to stop: ").strip().upper() != 'N':
+                break
+            after = page["next"]
     
     elif choice == '3':
         try:
             bill_id = int(input("\nBill ID to mark as paid: ").strip())
-            # SELECT * FROM bill WHERE id = ? LIMIT 1
-            bill = session.query(Bill).filter_by(id=bill_id).first()
-            
-            if bill:
-                bill.paid = True
-                session.commit()
-                print("[SUCCESS] Payment processed successfully!")
-            else:
-                error("Bill not found!")
+            services.mark_paid(session, bill_id)
+            print("[SUCCESS] Payment processed successfully!")
+        except ServiceError as e:
+            error(str(e))
+        except Exception as e:
+            error(f"Error: {e}")
+
+    elif choice == '4':
+        receivables_report(session, user)
+
+    elif choice == '5':
+        try:
+            cycle_str = input("\nBilling month (YYYY-MM, Enter for this month): ").strip()
+            cycle = datetime.strptime(cycle_str, '%Y-%m').date() if cycle_str else date.today()
+            result = services.run_billing_cycle(session, user.id, cycle)
+            print(f"[SUCCESS] {result['cycle']:%Y-%m}: created {result['bills_created']} bills "
+                  f"({result['items_created']} items); {result['already_billed']} members were already billed.")
+        except ValueError:
+            error("Invalid month!")
+        except ServiceError as e:
+            error(str(e))
         except Exception as e:
-            session.rollback()
             error(f"Error: {e}")
 
 
+RECEIVABLES_SORTS = [("balance", "Largest balance"), ("oldest", "Oldest unpaid bill"),
+                     ("overdue", "Most over 90 days"), ("name", "Member name")]
+
+
+def receivables_report(session, user):
+    """Outstanding balances per member with aging buckets, a page at a time."""
+    print("\nSort by:")
+    for i, (_, label) in enumerate(RECEIVABLES_SORTS, 1):
+        print(f"{i}. {label}")
+    try:
+        sort_choice = input("\nChoice (Enter for largest balance): ").strip()
+        sort = RECEIVABLES_SORTS[int(sort_choice) - 1][0] if sort_choice else "balance"
+    except (ValueError, IndexError):
+        error("Invalid selection!")
+        return
+
+    page_no = 1
+    while True:
+        report = services.receivables(session, sort=sort, page=page_no)
+        if not report["members"]:
+            print("\nNo outstanding balances.")
+            return
+        totals = report["totals"]
+        print(f"\nReceivables as of {report['as_of']} - {report['member_count']} members owe ${totals['balance']:,.2f}")
+        print(f"0-30 days: ${totals['days_0_30']:,.2f} | 31-60: ${totals['days_31_60']:,.2f} | "
+              f"61-90: ${totals['days_61_90']:,.2f} | 90+: ${totals['days_over_90']:,.2f}")
+        print(f"\n{'Member':28} {'Bills':>5} {'Oldest':>10} {'Balance':>11} {'0-30':>10} {'31-60':>10} {'61-90':>10} {'90+':>10}")
+        for row in report["members"]:
+            print(f"{row['member'][:28]:28} {row['bills']:>5} {str(row['oldest']):>10} {row['balance']:>11,.2f} "
+                  f"{row['days_0_30']:>10,.2f} {row['days_31_60']:>10,.2f} {row['days_61_90']:>10,.2f} "
+                  f"{row['days_over_90']:>10,.2f}")
+        print(f"\nPage {report['page']} of {report['pages']}")
+
+        choice = input("N = next page, P = previous page, Enter to stop: ").strip().upper()
+        if choice == 'N' and page_no < report["pages"]:
+            page_no += 1
+        elif choice == 'P' and page_no > 1:
+            page_no -= 1
+        else:
+            return
+
+
+GOAL_REPORT_PAGE = 20
+
+
+def goal_progress_report(session, user):
+    """Every member's goals with latest reading and percent complete, from one bulk query."""
+    header("Member Goal Progress")
+
+    progress = services.club_goal_progress(session)
+    if not progress:
+        print("\nNo member goals set.")
+        return
+
+    measured = [g["percent"] for g in progress if g["percent"] is not None]
+    reached = sum(1 for p in measured if p >= 100)
+    print(f"\n{len(progress)} goals, {len(measured)} measurable"
+          + (f", average progress {sum(measured) / len(measured):.0f}%, {reached} reached" if measured else ""))
+    print(f"\n{'Member':26} {'Metric':12} {'Baseline':>9} {'Latest':>9} {'Target':>9} {'By':>10} {'Progress':>9}")
+    for start in range(0, len(progress), GOAL_REPORT_PAGE):
+        for g in progress[start:start + GOAL_REPORT_PAGE]:
+            baseline = f"{g['baseline_value']:.2f}" if g["baseline_value"] is not None else "-"
+            latest = f"{g['latest_value']:.2f}" if g["latest_value"] is not None else "-"
+            percent = f"{g['percent']:.0f}%" if g["percent"] is not None else "-"
+            print(f"{g['member'][:26]:26} {g['metric'][:12]:12} {baseline:>9} {latest:>9} "
+                  f"{g['target_value']:>9.2f} {str(g['goal_date']):>10} {percent:>9}")
+        if start + GOAL_REPORT_PAGE < len(progress):
+            if input(f"-- {start + GOAL_REPORT_PAGE} of {len(progress)}; Enter for more, Q to stop: ").strip().upper() == 'Q':
+                return
+
+
+def _pct(value) -> str:
+    return f"{value:.0f}%" if value is not None else "-"
+
+
+def room_utilisation_report(session, user):
+    """Booked hours, occupancy and no-shows per room, then one room's (or the club's) hour-of-week grid."""
+    header("Room Utilisation")
+
+    try:
+        last_str = input("\nLast date (YYYY-MM-DD, Enter for today): ").strip()
+        last = datetime.strptime(last_str, '%Y-%m-%d').date() if last_str else date.today()
+        first_str = input("First date (YYYY-MM-DD, Enter for a year before): ").strip()
+        first = datetime.strptime(first_str, '%Y-%m-%d').date() if first_str else last - timedelta(days=364)
+        report = services.room_utilisation(session, first, last)
+    except ValueError:
+        error("Invalid date!")
+        return
+    except ServiceError as e:
+        error(str(e))
+        return
+
+    total = report["total"]
+    print(f"\n{report['first']} to {report['last']} ({report['days']} days): {total['sessions']:,} sessions, "
+          f"{total['club_booked_hours']:,.0f} of {total['open_hours']:,} club room-hours booked ({_pct(total['booked_pct'])}), "
+          f"occupancy {_pct(total['occupancy_pct'])}, no-shows {_pct(total['no_show_pct'])}")
+    print(f"\n{'#':>3} {'Room':26} {'Cap':>4} {'Sessions':>8} {'Hours':>7} {'Booked':>7} {'Fill':>5} "
+          f"{'Occup':>6} {'Size':>5} {'No-show':>8}")
+    for i, room in enumerate(report["rooms"], 1):
+        print(f"{i:>3} {room['room'][:26]:26} {room['capacity']:>4} {room['sessions']:>8,} {room['booked_hours']:>7,.0f} "
+              f"{_pct(room['booked_pct']):>7} {_pct(room['fill_pct']):>5} {_pct(room['occupancy_pct']):>6} "
+              f"{_pct(room['size_pct']):>5} {_pct(room['no_show_pct']):>8}")
+    print("\nFill = enrolled / class size, Occup = enrolled / room capacity, Size = class size / room capacity")
+
+    choice = input("\nRoom # for its hour-of-week grid (Enter for all rooms, Q to stop): ").strip().upper()
+    if choice == 'Q':
+        return
+    if not choice:
+        target = report["total"]
+    elif choice.isdigit() and 1 <= int(choice) <= len(report["rooms"]):
+        target = report["rooms"][int(choice) - 1]
+    else:
+        error("Invalid selection!")
+        return
+
+    # Share of each hour of the week that was booked, over club hours
+    booked = {(c["dow"], c["hour"]): c["booked_pct"] for c in target["hours"]}
+    hours = range(OPEN_TIME.hour, CLOSE_TIME.hour)
+    print(f"\n% booked by hour of the week - {target.get('room', 'all rooms')}")
+    print("     " + "".join(f"{h:>4}" for h in hours))
+    for dow, name in enumerate(WEEKDAYS, 1):
+        print(f"{name.title():5}" + "".join(f"{booked[(dow, h)]:>4.0f}" if (dow, h) in booked else f"{'.':>4}"
+                                           for h in hours))
+
+
 def admin_menu(session, user):
     """Admin main menu"""
     while True:
@@ -283,16 +366,22 @@ def admin_menu(session, user):
             "Manage Equipment",
             "Manage Class Schedule",
             "Process Billing",
+            "Member Goal Progress",
+            "Room Utilisation",
             "Logout",
         ])
         
         if choice == '1':
-            manage_equipment(session, user)
+            run_action(manage_equipment, session, user)
         elif choice == '2':
-            manage_class_schedule(session, user)
+            run_action(manage_class_schedule, session, user)
         elif choice == '3':
-            process_billing(session, user)
+            run_action(process_billing, session, user)
         elif choice == '4':
+            run_action(goal_progress_report, session, user)
+        elif choice == '5':
+            run_action(room_utilisation_report, session, user)
+        elif choice == '6':
             print("\nLogging out...")
             sleep(0.8)
             break
@@ -5,7 +5,8 @@
 
 import os
 import time
-from typing import List
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
 
 try:
     from colorama import init as colorama_init, Fore, Style
@@ -76,6 +77,55 @@ def info(msg: str) -> None:
     print(color_text(msg, Fore.CYAN))
 
 
+# Weekday abbreviations accepted by read_recurrence, Monday first like date.weekday()
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def read_recurrence() -> Optional[Tuple[List[int], int, List[date]]]:
+    """Ask whether a booking repeats weekly; returns (weekdays, weeks, skip dates), or None for a one-off."""
+    days = input("Repeat weekly on (e.g. Mon,Wed,Fri; Enter for once): ").strip()
+    if not days:
+        return None
+    weekdays = [WEEKDAYS.index(d.strip().lower()[:3]) for d in days.split(",") if d.strip()]
+    weeks = int(input("For how many weeks: ").strip())
+    skip = input("Skip dates (YYYY-MM-DD, comma separated; Enter for none): ").strip()
+    skip_dates = [datetime.strptime(d.strip(), '%Y-%m-%d').date() for d in skip.split(",") if d.strip()]
+    return weekdays, weeks, skip_dates
+
+
+def report_series(result: Dict[str, object], what: str) -> None:
+    """Print how many bookings a series created and each date it skipped."""
+    success(f"[SUCCESS] {len(result['ids'])} {what} created.")
+    if result["skipped"]:
+        warn(f"Skipped {len(result['skipped'])} conflicting date(s):")
+        for skipped in result["skipped"]:
+            print(f"  {skipped['date']}: {skipped['reason']}")
+
+
+def show_free_slots(slots: List[Dict[str, object]], title: str) -> None:
+    """List free slots from services.next_free_slots under a title (nothing if there are none)."""
+    if not slots:
+        return
+    print(f"\n{title}:")
+    for slot in slots:
+        print(f"  {slot['date']} {slot['start_time']:%H:%M}-{slot['end_time']:%H:%M}")
+
+
+# Sparkline levels, lowest to highest (plain ASCII so it renders in any console)
+SPARK_LEVELS = "_.-~=+*#"
+
+
+def sparkline(values: Sequence[Optional[float]]) -> str:
+    """One character per value scaled between the min and max; None renders as a gap."""
+    present = [v for v in values if v is not None]
+    if not present:
+        return " " * len(values)
+    low, high = min(present), max(present)
+    top = len(SPARK_LEVELS) - 1
+    return "".join(" " if v is None else SPARK_LEVELS[round((v - low) / (high - low) * top) if high > low else top // 2]
+                   for v in values)
+
+
 def sleep(seconds: float) -> None:
     try:
         time.sleep(seconds)
@@ -0,0 +1,270 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Engine registry + connection pooling
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.auth import build_database_url
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_settings() -> Dict[str, object]:
+    """Read pool configuration from PG* environment variables."""
+    return {
+        "pool_size": _env_int("PGPOOL_SIZE", 5),
+        "max_overflow": _env_int("PGPOOL_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("PGPOOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("PGPOOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("PGPOOL_PRE_PING", True),
+        # Milliseconds; 0 disables the server-side timeout
+        "statement_timeout": _env_int("PGSTATEMENT_TIMEOUT", 0),
+    }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # Keep counters across dispose()/recreate() so stats cover the process lifetime
+        new_pool = super().recreate()
+        new_pool.checkouts = self.checkouts
+        new_pool.checkins = self.checkins
+        new_pool.connects = self.connects
+        new_pool.wait_total = self.wait_total
+        new_pool.wait_max = self.wait_max
+        new_pool.timeouts = self.timeouts
+        return new_pool
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """TimedQueuePool with the asyncio-aware queue used by async engines."""
+
+
+_lock = threading.RLock()
+_engines: Dict[str, Engine] = {}
+_session_factories: Dict[str, sessionmaker] = {}
+_async_engines: Dict[str, AsyncEngine] = {}
+_async_session_factories: Dict[str, async_sessionmaker] = {}
+
+
+def _resolve_url(database_url: Optional[str]) -> str:
+    url = database_url or build_database_url()
+    if not url:
+        raise RuntimeError(
+            "Database configuration not found. Provide "
+            "PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD in your environment/.env."
+        )
+    return url
+
+
+def _install_pool_counters(engine: Engine) -> None:
+    # engine.pool is looked up on each event because dispose() swaps in a new pool
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        with engine.pool.stats_lock:
+            engine.pool.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        with engine.pool.stats_lock:
+            engine.pool.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        with engine.pool.stats_lock:
+            engine.pool.checkins += 1
+
+
+def get_engine(database_url: Optional[str] = None) -> Engine:
+    """Return the process-wide pooled engine for a URL, creating it on first use."""
+    url = _resolve_url(database_url)
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            settings = pool_settings()
+            connect_args = {}
+            if settings["statement_timeout"] > 0:
+                connect_args["options"] = f"-c statement_timeout={settings['statement_timeout']}"
+            engine = create_engine(
+                url,
+                echo=False,
+                poolclass=TimedQueuePool,
+                pool_size=settings["pool_size"],
+                max_overflow=settings["max_overflow"],
+                pool_timeout=settings["pool_timeout"],
+                pool_recycle=settings["pool_recycle"],
+                pool_pre_ping=settings["pool_pre_ping"],
+                connect_args=connect_args,
+            )
+            _install_pool_counters(engine)
+            _engines[url] = engine
+    return engine
+
+
+def get_sessionmaker(database_url: Optional[str] = None) -> sessionmaker:
+    """Return the shared session factory bound to the pooled engine."""
+    url = _resolve_url(database_url)
+    factory = _session_factories.get(url)
+    if factory is None:
+        with _lock:
+            factory = _session_factories.get(url)
+            if factory is None:
+                factory = sessionmaker(bind=get_engine(url))
+                _session_factories[url] = factory
+    return factory
+
+
+def get_session(database_url: Optional[str] = None) -> Session:
+    """Create a new ORM session that draws connections from the shared pool."""
+    return get_sessionmaker(database_url)()
+
+
+def async_url(database_url: Optional[str] = None) -> str:
+    """Rewrite a PostgreSQL URL to use the asyncpg driver."""
+    url = make_url(_resolve_url(database_url))
+    return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def get_async_engine(database_url: Optional[str] = None) -> AsyncEngine:
+    """Return the process-wide asyncio engine (asyncpg) for a URL, creating it on first use.
+
+    Uses the same PGPOOL_* settings as get_engine(); call it from the event loop that will use it.
+    """
+    url = async_url(database_url)
+    engine = _async_engines.get(url)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        engine = _async_engines.get(url)
+        if engine is None:
+            settings = pool_settings()
+            connect_args = {}
+            if settings["statement_timeout"] > 0:
+                connect_args["server_settings"] = {"statement_timeout": str(settings["statement_timeout"])}
+            engine = create_async_engine(
+                url,
+                echo=False,
+                poolclass=TimedAsyncQueuePool,
+                pool_size=settings["pool_size"],
+                max_overflow=settings["max_overflow"],
+                pool_timeout=settings["pool_timeout"],
+                pool_recycle=settings["pool_recycle"],
+                pool_pre_ping=settings["pool_pre_ping"],
+                connect_args=connect_args,
+            )
+            _install_pool_counters(engine.sync_engine)
+            _async_engines[url] = engine
+    return engine
+
+
+def get_async_sessionmaker(database_url: Optional[str] = None) -> async_sessionmaker:
+    """Return the shared AsyncSession factory bound to the asyncio engine."""
+    url = async_url(database_url)
+    factory = _async_session_factories.get(url)
+    if factory is None:
+        with _lock:
+            factory = _async_session_factories.get(url)
+            if factory is None:
+                factory = async_sessionmaker(bind=get_async_engine(url), expire_on_commit=False)
+                _async_session_factories[url] = factory
+    return factory
+
+
+def get_async_session(database_url: Optional[str] = None) -> AsyncSession:
+    """Create a new AsyncSession that draws connections from the shared asyncio pool."""
+    return get_async_sessionmaker(database_url)()
+
+
+def _pool_stats(pool: TimedQueuePool) -> Dict[str, object]:
+    with pool.stats_lock:
+        checkouts = pool.checkouts
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checked_in": pool.checkedin(),
+            "connects": pool.connects,
+            "checkouts": checkouts,
+            "checkins": pool.checkins,
+            "timeouts": pool.timeouts,
+            "wait_total_ms": round(pool.wait_total * 1000.0, 3),
+            "wait_avg_ms": round(pool.wait_total * 1000.0 / checkouts, 3) if checkouts else 0.0,
+            "wait_max_ms": round(pool.wait_max * 1000.0, 3),
+        }
+
+
+def pool_stats(database_url: Optional[str] = None) -> Dict[str, object]:
+    """Return checkout/wait statistics for the pooled engine of a URL."""
+    return _pool_stats(get_engine(database_url).pool)
+
+
+def async_pool_stats(database_url: Optional[str] = None) -> Dict[str, object]:
+    """Return checkout/wait statistics for the asyncio engine of a URL."""
+    return _pool_stats(get_async_engine(database_url).sync_engine.pool)
+
+
+def dispose_engines() -> None:
+    """Close every pooled connection (e.g. after fork or on shutdown)."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+
+async def dispose_async_engines() -> None:
+    """Close every asyncio pooled connection; await before the event loop shuts down."""
+    with _lock:
+        engines = list(_async_engines.values())
+        _async_engines.clear()
+        _async_session_factories.clear()
+    for engine in engines:
+        await engine.dispose()
@@ -0,0 +1,183 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Bulk extracts for analytics: metrics, enrollments and billing streamed with COPY TO STDOUT into gzip files
+
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.engine import Engine
+
+FORMATS = ("csv", "ndjson")
+# File in the output directory holding the last id exported per dataset
+WATERMARK_FILE = "watermarks.json"
+# Trades a little ratio for speed; the exports are usually CPU bound on compression
+COMPRESS_LEVEL = 5
+# Bytes handed from COPY to gzip per write
+COPY_BUFFER = 1 << 16
+# How long an export waits for transactions that may still commit ids below its watermark
+FENCE_TIMEOUT = 60.0
+FENCE_POLL = 0.05
+
+# name -> the table whose id is the watermark, the query, and its id and time columns.
+# {where} takes the incremental conditions. Incremental runs only pick up new ids: later changes to
+# exported rows (bill.paid, enrollment.attended) reach the extracts with the next full export.
+DATASETS: Dict[str, Dict[str, str]] = {
+    "metrics": {
+        "table": "metric",
+        "id": "m.id",
+        "time": "m.logged_date",
+        "sql": """
+            SELECT m.id, m.user_id, mt.metric_name AS metric, m.value, m.logged_date
+            FROM metric m JOIN metric_type mt ON mt.id = m.metric_type
+            {where}""",
+    },
+    "enrollments": {
+        "table": "enrollment",
+        "id": "e.id",
+        "time": "sc.date",
+        "sql": """
+            SELECT e.id, e.member_id, e.session_id, e.attended, s.name AS session_name, st.type AS schedule_type,
+                   sc.trainer_id, s.room_id, sc.date, sc.start_time, sc.end_time, s.size, s.enrolled_count
+            FROM enrollment e
+            JOIN session s ON s.id = e.session_id
+            JOIN schedule sc ON sc.id = s.schedule_id
+            JOIN schedule_type st ON st.id = sc.type
+            {where}""",
+    },
+    "bills": {
+        "table": "bill",
+        "id": "b.id",
+        "time": "b.date",
+        "sql": """
+            SELECT b.id AS bill_id, b.member_id, b.admin_id, b.date, b.cycle, b.paid, i.id AS item_id,
+                   sv.name AS service, i.quantity, sv.price, i.quantity * sv.price AS amount
+            FROM bill b
+            LEFT JOIN item i ON i.bill_id = b.id
+            LEFT JOIN service sv ON sv.id = i.service_id
+            {where}""",
+    },
+}
+
+
+def load_watermarks(out_dir: str) -> Dict[str, Dict[str, object]]:
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_watermarks(out_dir: str, watermarks: Dict[str, Dict[str, object]]) -> None:
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(watermarks, fh, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _copy_sql(query: str, fmt: str) -> str:
+    if fmt == "csv":
+        return f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    # One JSON object per line. CSV mode with quote and delimiter characters that never occur in
+    # row_to_json output passes the JSON through unescaped (text mode would double its backslashes).
+    return (f"COPY (SELECT row_to_json(r) FROM ({query}) r) TO STDOUT "
+            f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+
+
+def _settled_high_id(cur, table: str) -> Optional[int]:
+    """The highest committed id, returned once no transaction can still commit an id below it.
+
+    Ids are handed out at insert, not at commit, so a transaction still open when max(id) is read
+    may hold a lower id and commit later. Only the transactions in flight at that moment can, so
+    this waits for them to finish (commit or roll back); anything that starts later gets higher ids.
+    """
+    # SELECT max(id), pg_current_snapshot() FROM <table>
+    cur.execute(f"SELECT max(id), pg_current_snapshot()::text FROM {table}")
+    high, fence = cur.fetchone()
+    deadline = time.monotonic() + FENCE_TIMEOUT
+    while True:
+        # SELECT count(*) FROM pg_snapshot_xip(<fence>) WHERE pg_xact_status(xid) = 'in progress'
+        cur.execute("SELECT count(*) FROM pg_snapshot_xip(%s::pg_snapshot) AS x "
+                    "WHERE pg_xact_status(x) = 'in progress'", (fence,))
+        if cur.fetchone()[0] == 0:
+            return high
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"transactions open since before the export kept writing to {table} "
+                               f"for over {FENCE_TIMEOUT:.0f}s; watermark not advanced")
+        time.sleep(FENCE_POLL)
+
+
+def export_dataset(engine: Engine, name: str, out_dir: str, fmt: str = "csv", after_id: Optional[int] = None,
+                   since: Optional[datetime] = None, stamp: Optional[str] = None) -> Dict[str, object]:
+    """Stream one dataset into a gzip file on its own connection; returns its row count and new watermark.
+
+    Rows with an id above `after_id` and a time at or after `since` are exported. The file is written
+    under a temporary name and only renamed into place once the COPY has finished. Only inserts are
+    tracked: rows updated after they were exported are not exported again.
+    """
+    spec = DATASETS[name]
+    stamp = stamp or datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(out_dir, f"{name}_{stamp}.{fmt}.gz")
+    started = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        high = _settled_high_id(cur, spec["table"])
+        raw.commit()
+        # The rows come from one snapshot taken after every id up to the watermark has settled
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        conditions, params = [f"{spec['id']} <= %(high)s"], {"high": high or 0}
+        if after_id is not None:
+            conditions.append(f"{spec['id']} > %(after_id)s")
+            params["after_id"] = after_id
+        if since is not None:
+            conditions.append(f"{spec['time']} >= %(since)s")
+            params["since"] = since
+        query = cur.mogrify(spec["sql"].format(where="WHERE " + " AND ".join(conditions)), params).decode()
+        with gzip.open(path + ".tmp", "wb", compresslevel=COMPRESS_LEVEL) as fh:
+            cur.copy_expert(_copy_sql(query, fmt), fh, size=COPY_BUFFER)
+        rows = cur.rowcount
+        raw.commit()
+    finally:
+        raw.close()
+    os.replace(path + ".tmp", path)
+    return {"dataset": name, "path": path, "rows": rows, "bytes": os.path.getsize(path),
+            "seconds": time.perf_counter() - started,
+            "last_id": high if high is not None else after_id}
+
+
+def run_exports(engine: Engine, names: List[str], out_dir: str, fmt: str = "csv", incremental: bool = False,
+                since: Optional[datetime] = None, workers: int = 3,
+                log: Callable[[str], None] = print) -> List[Dict[str, object]]:
+    """Export several datasets in parallel, one worker and connection per dataset.
+
+    With `incremental`, each dataset continues after the id recorded by its last export. The
+    watermarks are updated only for datasets whose export finished.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    watermarks = load_watermarks(out_dir)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names)))) as pool:
+        futures = {
+            pool.submit(export_dataset, engine, name, out_dir, fmt,
+                        watermarks.get(name, {}).get("last_id") if incremental else None, since, stamp): name
+            for name in names
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                log(f"  {name:<12} FAILED: {e}")
+                continue
+            results.append(result)
+            watermarks[name] = {"last_id": result["last_id"], "exported_at": stamp, "file": os.path.basename(result["path"])}
+            log(f"  {name:<12} {result['rows']:>11,} rows {result['bytes'] / 2 ** 20:>8.1f} MB "
+                f"in {result['seconds']:6.2f}s  -> {result['path']}")
+    save_watermarks(out_dir, watermarks)
+    return results
@@ -8,17 +8,19 @@ from pathlib import Path
 # Add parent directory to path so we can import models
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+import argparse
 from datetime import datetime
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 import os
-from models import User, Role
+from models import User
+import services
 from app.member import member_menu
 from app.trainer import trainer_menu
 from app.admin import admin_menu
 from app.cli_utils import init_console, menu, header, pause, clear_screen, sleep, error
 from app.auth import ensure_database_exists, build_database_url
+from app.db import get_session
 from app.seed import reset_and_seed
+from app.datagen import generate
 
 # Database Configuration (supports DATABASE_URL or PG* variables)
 ensure_database_exists()
@@ -31,10 +33,8 @@ if not DATABASE_URL:
 
 
 def get_db_session():
-    """Create and return a database session"""
-    engine = create_engine(DATABASE_URL, echo=False)
-    SessionFactory = sessionmaker(bind=engine)
-    return SessionFactory()
+    """Create and return a database session from the shared connection pool"""
+    return get_session(DATABASE_URL)
 
 
 def login(session):
@@ -44,8 +44,9 @@ def login(session):
     email = input("Email: ").strip()
     password = input("Password: ").strip()
     
-    # SELECT * FROM user WHERE email = ? AND password = ? LIMIT 1
-    user = session.query(User).filter_by(email=email, password=password).first()
+    account = services.authenticate(session, email, password)
+    # Already in the identity map after authenticate(), so no extra query
+    user = session.get(User, account["id"]) if account else None
     
     if user:
         print(f"\nWelcome, {user.first_name} {user.last_name}!")
@@ -73,38 +74,54 @@ def register_member(session):
         sex = input("Sex (M/F/O): ").strip().upper()
         phone = input("Phone: ").strip()
         
-        # Get Member role
-        # SELECT * FROM role WHERE name = 'Member' LIMIT 1
-        member_role = session.query(Role).filter_by(name='Member').first()
-        
-        new_user = User(
-            email=email,
-            password=password,
-            first_name=first_name,
-            last_name=last_name,
-            date_of_birth=dob,
-            sex=sex,
-            phone=phone,
-            role=member_role.id
-        )
-        
-        session.add(new_user)
-        session.commit()
+        services.register_member(session, email, password, first_name, last_name, dob, sex, phone)
         print("\n[SUCCESS] Registration successful! You can now login.")
         pause()
     except Exception as e:
-        session.rollback()
         error(f"Registration failed: {e}")
         pause()
 
 
+def parse_args(argv=None):
+    """Parse command line flags"""
+    parser = argparse.ArgumentParser(description="Health and Fitness Club Management System")
+    parser.add_argument("-r", "--reset", action="store_true",
+                        help="drop, recreate and seed the database, then exit")
+    parser.add_argument("--scale", type=int, default=0,
+                        help="with --reset: bulk-generate a synthetic dataset of this scale factor")
+    parser.add_argument("--seed", type=int, default=3005,
+                        help="random seed for --scale (same seed + scale + --today = same data)")
+    parser.add_argument("--today", type=lambda s: datetime.strptime(s, "%Y-%m-%d").date(),
+                        help="with --scale: date the generated history and schedule are placed around "
+                             "(YYYY-MM-DD, default: today)")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the async HTTP/JSON API instead of the console menus")
+    parser.add_argument("--host", default="127.0.0.1", help="with --serve: interface to bind")
+    parser.add_argument("--port", type=int, default=8080, help="with --serve: port to listen on")
+    return parser.parse_args(argv)
+
+
 def main():
     """Main application entry point"""
+    args = parse_args()
+
     # Support reset flag for test setup used for our video demo
-    if any(arg in ("--reset", "-r") for arg in sys.argv[1:]):
-        print("Resetting and seeding the database...")
-        reset_and_seed(DATABASE_URL)
-        print("[SUCCESS] Database reset and seed complete.")
+    if args.reset:
+        if args.scale > 0:
+            print(f"Resetting and generating scale {args.scale} dataset (seed {args.seed})...")
+            started = datetime.now()
+            counts = generate(DATABASE_URL, args.scale, seed=args.seed, today=args.today)
+            elapsed = (datetime.now() - started).total_seconds()
+            print(f"[SUCCESS] Loaded {sum(counts.values()):,} rows in {elapsed:.1f}s.")
+        else:
+            print("Resetting and seeding the database...")
+            reset_and_seed(DATABASE_URL)
+            print("[SUCCESS] Database reset and seed complete.")
+        return
+
+    if args.serve:
+        from app.server import serve
+        serve(DATABASE_URL, host=args.host, port=args.port)
         return
 
     init_console()
@@ -112,8 +129,9 @@ def main():
     header("Health and Fitness Club Management System")
     sleep(1)
     
-    # Create database session
+    # Create database session and load the lookup tables once
     db_session = get_db_session()
+    services.lookups.warm(db_session)
     
     try:
         while True:
@@ -0,0 +1,262 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Operational commands (run from cron or by hand)
+#
+# Usage (from the repo root):
+#   python app/manage.py billing-run                    # bill the current month's subscriptions
+#   python app/manage.py billing-run --cycle 2026-11 --admin lebron.james@dagoat.com
+#   python app/manage.py partitions list
+#   python app/manage.py partitions create --ahead 6          # pre-create metric months (run monthly)
+#   python app/manage.py partitions detach --before 2024-01 --drop
+#   python app/manage.py rollups                         # rebuild every member's metric trend rollups
+#   python app/manage.py rollups --member 42
+#   python app/manage.py import-metrics scale.csv --member max.ver@dudududu.com
+#   python app/manage.py import-metrics hr.ndjson.gz --member 42 --map bpm="Heart Rate"
+#   python app/manage.py export --out exports/                # metrics, enrollments and bills as .csv.gz
+#   python app/manage.py export --out exports/ --incremental --format ndjson   # only rows added since last time
+#   python app/manage.py schedule-classes week.json --dry-run   # preview room/trainer assignments
+#   python app/manage.py schedule-classes week.json             # create every class that fits
+#   python app/manage.py migrate                         # bring a database from an older version up to date
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import argparse
+import gzip
+import json
+import time
+from datetime import date, datetime
+
+import services
+from models import User
+from app.auth import ensure_database_exists, build_database_url
+from app.db import get_engine, get_session
+from app.exports import DATASETS, FORMATS as EXPORT_FORMATS, run_exports
+from app.migrations import migrate as apply_migrations
+from app.partitions import (MONTHS_AHEAD, ensure_metric_partitions, detach_metric_partitions,
+                            list_metric_partitions)
+
+
+def _parse_cycle(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _member_id(session, member: str) -> int:
+    """A member given by numeric id or by email."""
+    query = session.query(User.id).filter_by(role=services.lookups.require_id(session, "role", "Member"))
+    # SELECT id FROM user WHERE role = <Member> AND (id = ? | email = ?)
+    member_id = query.filter_by(**({"id": int(member)} if member.isdigit() else {"email": member})).scalar()
+    if member_id is None:
+        raise services.ServiceError(f"No member {member}.")
+    return member_id
+
+
+def _admin_id(session, email=None) -> int:
+    """The admin recorded on generated bills: the given email, or the first admin account."""
+    query = session.query(User.id).filter_by(role=services.lookups.require_id(session, "role", "Admin"))
+    if email:
+        query = query.filter_by(email=email)
+    # SELECT id FROM user WHERE role = <Admin> [AND email = ?] ORDER BY id LIMIT 1
+    admin_id = query.order_by(User.id).limit(1).scalar()
+    if admin_id is None:
+        raise services.ServiceError(f"No admin account {email or ''}".strip() + ".")
+    return admin_id
+
+
+def billing_run(session, args) -> int:
+    started = time.perf_counter()
+    result = services.run_billing_cycle(session, _admin_id(session, args.admin), args.cycle, bill_date=args.date)
+    elapsed = time.perf_counter() - started
+    print(f"Billing cycle {result['cycle']:%Y-%m}: {result['members_due']:,} members with active subscriptions")
+    print(f"  created {result['bills_created']:,} bills and {result['items_created']:,} items, "
+          f"skipped {result['already_billed']:,} already billed, in {elapsed:.2f}s")
+    return 0
+
+
+def partitions(session, args) -> int:
+    conn = session.connection()
+    if args.action == "create":
+        created = ensure_metric_partitions(conn, first_month=args.first, months_ahead=args.ahead)
+        session.commit()
+        print(f"Created {len(created)} metric partitions" + (f": {', '.join(created)}" if created else "."))
+    elif args.action == "detach":
+        if not args.before:
+            print("Error: detach needs --before YYYY-MM.")
+            return 1
+        removed = detach_metric_partitions(conn, args.before, drop=args.drop)
+        session.commit()
+        verb = "Dropped" if args.drop else "Detached and archived"
+        print(f"{verb} {len(removed)} metric partitions" + (f": {', '.join(removed)}" if removed else "."))
+    else:
+        for part in list_metric_partitions(conn):
+            print(f"{part['name']:<18} {str(part['month'] or 'default'):>10}  ~{part['rows_estimate']:,} rows")
+    return 0
+
+
+def rollups(session, args) -> int:
+    started = time.perf_counter()
+    buckets = services.rebuild_metric_rollups(session, member_id=args.member)
+    who = f"member {args.member}" if args.member else "all members"
+    print(f"Rebuilt {buckets:,} metric rollup buckets for {who} in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+def import_metrics(session, args) -> int:
+    mapping = {}
+    for pair in args.map:
+        column, sep, name = pair.partition("=")
+        if not sep:
+            print(f"Error: --map takes column=Metric Name, got '{pair}'.")
+            return 1
+        mapping[column] = name
+    member_id = _member_id(session, args.member)
+    fmt = args.format or services.detect_format(args.file)
+    opener = gzip.open if args.file.endswith(".gz") else open
+
+    def make_partitions(first, last):
+        # New readings from before the oldest partition would otherwise land in metric_default
+        ensure_metric_partitions(session.connection(), first_month=first.date())
+
+    started = time.perf_counter()
+    if args.file == "-":
+        result = services.import_metrics(session, member_id, sys.stdin, fmt, mapping, make_partitions)
+    else:
+        with opener(args.file, "rt", encoding="utf-8", newline="") as fh:
+            result = services.import_metrics(session, member_id, fh, fmt, mapping, make_partitions)
+    elapsed = time.perf_counter() - started
+    print(f"Read {result['rows_read']:,} lines ({result['readings']:,} readings), "
+          f"rejected {result['rejected']:,}, skipped {result['duplicates']:,} duplicates")
+    for message in result["errors"]:
+        print(f"  {message}")
+    span = (f" from {result['first_logged']:%Y-%m-%d} to {result['last_logged']:%Y-%m-%d}"
+            if result["imported"] else "")
+    print(f"Imported {result['imported']:,} readings{span} in {elapsed:.2f}s "
+          f"({result['readings'] / max(elapsed, 1e-9):,.0f} readings/s)")
+    return 0
+
+
+def export(session, args) -> int:
+    names = args.datasets or list(DATASETS)
+    print(f"Exporting {', '.join(names)} to {args.out} ({args.format}.gz, {args.workers} workers)")
+    started = time.perf_counter()
+    results = run_exports(get_engine(), names, args.out, fmt=args.format, incremental=args.incremental,
+                          since=args.since, workers=args.workers)
+    elapsed = time.perf_counter() - started
+    rows = sum(r["rows"] for r in results)
+    print(f"Exported {rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0 if len(results) == len(names) else 1
+
+
+def schedule_classes(session, args) -> int:
+    with open(args.file, encoding="utf-8") as fh:
+        records = json.load(fh)
+    if not isinstance(records, list):
+        print("Error: the file must hold a JSON list of classes.")
+        return 1
+    requests = services.class_requests(session, records)
+    started = time.perf_counter()
+    plan = services.schedule_classes(session, requests, dry_run=args.dry_run, step_minutes=args.step)
+    elapsed = time.perf_counter() - started
+    for placed in plan["placed"]:
+        print(f"  {placed['request']:>5}. {placed['name'][:30]:<30} {placed['date']} "
+              f"{placed['start_time']:%H:%M}-{placed['end_time']:%H:%M}  trainer {placed['trainer_id']:<6} "
+              f"{placed['location']}")
+    for unplaced in plan["unplaced"]:
+        print(f"  {unplaced['request']:>5}. {unplaced['name'][:30]:<30} NOT PLACED: {unplaced['reason']}")
+    verb = "Planned" if args.dry_run else "Created"
+    print(f"{verb} {len(plan['placed']):,} of {len(requests):,} classes in {elapsed:.2f}s; "
+          f"{len(plan['unplaced']):,} could not be placed")
+    return 0
+
+
+def migrate(session, args) -> int:
+    applied = apply_migrations(session.connection())
+    session.commit()
+    print(f"Applied {len(applied)} migrations" + (f": {', '.join(applied)}" if applied else "; already up to date."))
+    return 0
+
+
+COMMANDS = {
+    "billing-run": billing_run,
+    "partitions": partitions,
+    "rollups": rollups,
+    "import-metrics": import_metrics,
+    "export": export,
+    "schedule-classes": schedule_classes,
+    "migrate": migrate,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Health and Fitness Club operational commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    billing = commands.add_parser("billing-run", help="bill every active subscription for a cycle (idempotent)")
+    billing.add_argument("--cycle", type=_parse_cycle, default=date.today(),
+                         help="billing month as YYYY-MM (default: this month)")
+    billing.add_argument("--admin", help="email of the admin recorded on the bills (default: first admin)")
+    billing.add_argument("--date", type=_parse_date, help="bill date as YYYY-MM-DD (default: today)")
+
+    parts = commands.add_parser("partitions", help="list, pre-create or retire monthly metric partitions")
+    parts.add_argument("action", choices=["list", "create", "detach"])
+    parts.add_argument("--ahead", type=int, default=MONTHS_AHEAD,
+                       help="create: months past the current one to have ready")
+    parts.add_argument("--from", dest="first", type=_parse_cycle,
+                       help="create: first month YYYY-MM (default: this month)")
+    parts.add_argument("--before", type=_parse_cycle, help="detach: retire months before YYYY-MM")
+    parts.add_argument("--drop", action="store_true", help="detach: drop the tables instead of keeping them")
+
+    rebuild = commands.add_parser("rollups", help="rebuild metric trend rollups from the raw readings")
+    rebuild.add_argument("--member", type=int, help="only this member's rollups (default: everyone)")
+
+    importer = commands.add_parser("import-metrics", help="bulk import a member's readings from a device export")
+    importer.add_argument("file", help="CSV or NDJSON file, optionally .gz ('-' reads stdin)")
+    importer.add_argument("--member", required=True, help="member id or email")
+    importer.add_argument("--format", choices=services.imports.FORMATS,
+                          help="file format (default: from the extension, else csv)")
+    importer.add_argument("--map", action="append", default=[], metavar="COLUMN=METRIC",
+                          help="read a column as a metric type, e.g. kg=Weight (repeatable)")
+
+    exporter = commands.add_parser("export", help="stream metrics, enrollments and billing to gzip files")
+    exporter.add_argument("--out", required=True, help="output directory (also holds the watermarks)")
+    exporter.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    exporter.add_argument("--dataset", dest="datasets", action="append", choices=list(DATASETS),
+                          help="export only this dataset (repeatable; default: all)")
+    exporter.add_argument("--incremental", action="store_true",
+                          help="only rows added since the last export to this directory")
+    exporter.add_argument("--since", type=datetime.fromisoformat,
+                          help="only rows at or after this time, e.g. 2026-10-01 (metric time, class date, bill date)")
+    exporter.add_argument("--workers", type=int, default=len(DATASETS), help="datasets exported in parallel")
+
+    planner = commands.add_parser("schedule-classes", help="assign rooms, trainers and times to requested classes")
+    planner.add_argument("file", help="JSON list of classes: name, size, duration (minutes), windows "
+                                      "('YYYY-MM-DD HH:MM-HH:MM'), optional trainers (ids or emails)")
+    planner.add_argument("--dry-run", action="store_true", help="print the assignments without creating anything")
+    planner.add_argument("--step", type=int, default=services.planner.STEP_MINUTES,
+                         help="minutes between candidate start times")
+
+    commands.add_parser("migrate", help="apply pending schema migrations to an existing database")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    ensure_database_exists()
+    session = get_session(build_database_url())
+    try:
+        return COMMANDS[args.command](session, args)
+    except services.ServiceError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
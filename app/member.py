@@ -2,66 +2,41 @@
 # Afaq Virk 101338854
 # Member Functions
 
-from datetime import datetime, date
-from decimal import Decimal
-from models import Metric, MetricType, Goal, Enrollment, Session, Schedule
-from app.cli_utils import menu, header, pause, sleep, error
+from datetime import datetime
+import services
+from services import ServiceError
+from app.cli_utils import menu, header, pause, sleep, error, sparkline
+from app.profiling import run_action
 
 
 def member_dashboard(session, user):
     """Display member's personalized dashboard"""
     header("Member Dashboard")
-    
-    # Recent health metrics
-    # SELECT * FROM metric WHERE user_id = ? ORDER BY logged_date DESC LIMIT 5
-    recent_metrics = session.query(Metric).filter_by(user_id=user.id)\
-        .order_by(Metric.logged_date.desc()).limit(5).all()
-    
-    if recent_metrics:
+
+    data = services.dashboard(session, user.id)
+
+    if data["recent_metrics"]:
         print("\nRecent Health Metrics:")
-        for metric in recent_metrics:
-            print(f"- {metric.metric_type_obj.metric_name}: {metric.value} "
-                  f"({metric.logged_date.strftime('%Y-%m-%d %H:%M')})")
+        for metric in data["recent_metrics"]:
+            print(f"- {metric['metric']}: {metric['value']} "
+                  f"({metric['logged_date'].strftime('%Y-%m-%d %H:%M')})")
     else:
         print("\nNo health metrics recorded yet.")
-    
+
     # Active goals
-    # SELECT * FROM goal JOIN metric ON goal.metric_id = metric.id WHERE metric.user_id = ?
-    goals = (session.query(Goal)
-             .join(Metric, Goal.metric_id == Metric.id)
-             .filter(Metric.user_id == user.id)
-             .all())
-    if goals:
-        print(f"\nActive Fitness Goals: {len(goals)}")
-        for goal in goals:
-            metric = goal.target_metric
-            print(f"- Target: {metric.metric_type_obj.metric_name} = {metric.value} by {goal.goal_date}")
+    if data["goals"]:
+        print(f"\nActive Fitness Goals: {len(data['goals'])}")
+        for goal in data["goals"]:
+            print(f"- Target: {goal['metric']} = {goal['target_value']} by {goal['goal_date']}")
     else:
         print("\nNo fitness goals set yet.")
-    
-    # Upcoming enrollments
-    today = date.today()
-
-    # Past classes attended count
-    past_count = (session.query(Enrollment)
-                  .join(Session)
-                  .join(Schedule)
-                  .filter(Enrollment.member_id == user.id,
-                          Schedule.date < today,
-                          Enrollment.attended == True)
-                  .count())
-    print(f"\nPast Classes Attended: {past_count}")
-
-    # SELECT * FROM enrollment JOIN session ON enrollment.session_id = session.id JOIN schedule ON session.schedule_id = schedule.id WHERE enrollment.member_id = ? AND schedule.date >= ? ORDER BY schedule.date, schedule.start_time LIMIT 5
-    upcoming = session.query(Enrollment).join(Session).join(Schedule)\
-        .filter(Enrollment.member_id == user.id, Schedule.date >= today)\
-        .order_by(Schedule.date, Schedule.start_time).limit(5).all()
-    
-    if upcoming:
+
+    print(f"\nPast Classes Attended: {data['past_attended']}")
+
+    if data["upcoming"]:
         print("\nUpcoming Sessions:")
-        for enrollment in upcoming:
-            sched = enrollment.session.schedule
-            print(f"- {enrollment.session.name} - {sched.date} at {sched.start_time}")
+        for enrollment in data["upcoming"]:
+            print(f"- {enrollment['name']} - {enrollment['date']} at {enrollment['start_time']}")
     else:
         print("\nNo upcoming sessions scheduled.")
 
@@ -69,113 +44,126 @@ def member_dashboard(session, user):
 def manage_profile(session, user):
     """Update member profile information"""
     header("Manage Profile")
-    
+
     print("\nCurrent Information:")
     print(f"Name: {user.first_name} {user.last_name}")
     print(f"Email: {user.email}")
     print(f"Phone: {user.phone or 'Not set'}")
     print(f"Date of Birth: {user.date_of_birth or 'Not set'}")
     print(f"Sex: {user.sex or 'Not set'}")
-    
+
     print("\nWhat would you like to update?")
     print("1. Phone Number")
     print("2. Password")
     print("3. Back")
-    
+
     choice = input("\nChoice: ").strip()
-    
-    if choice == '1':
-        new_phone = input("New phone number: ").strip()
-        user.phone = new_phone
-        session.commit()
-        print("[SUCCESS] Phone number updated successfully!")
-    elif choice == '2':
-        new_password = input("New password: ").strip()
-        confirm = input("Confirm password: ").strip()
-        if new_password == confirm:
-            user.password = new_password
-            session.commit()
-            print("[SUCCESS] Password updated successfully!")
-        else:
-            error("Passwords don't match!")
+
+    try:
+        if choice == '1':
+            new_phone = input("New phone number: ").strip()
+            services.update_phone(session, user.id, new_phone)
+            print("[SUCCESS] Phone number updated successfully!")
+        elif choice == '2':
+            new_password = input("New password: ").strip()
+            confirm = input("Confirm password: ").strip()
+            if new_password == confirm:
+                services.change_password(session, user.id, new_password)
+                print("[SUCCESS] Password updated successfully!")
+            else:
+                error("Passwords don't match!")
+    except ServiceError as e:
+        error(str(e))
 
 
 def log_health_metrics(session, user):
     """Log new health metrics"""
     header("Log Health Metrics")
-    
+
     # Display available metric types
-    # SELECT * FROM metric_type
-    metric_types = session.query(MetricType).all()
     print("\nAvailable Metrics:")
-    for mt in metric_types:
-        print(f"{mt.id}. {mt.metric_name} - {mt.metric_desc}")
-    
+    for mt in services.list_metric_types(session):
+        print(f"{mt['id']}. {mt['name']} - {mt['desc']}")
+
     try:
         metric_type_id = int(input("\nSelect metric type (number): ").strip())
         value = float(input("Enter value: ").strip())
-        
-        new_metric = Metric(
-            user_id=user.id,
-            metric_type=metric_type_id,
-            value=Decimal(str(value)),
-            logged_date=datetime.now()
-        )
-        
-        session.add(new_metric)
-        session.commit()
+        services.log_metric(session, user.id, metric_type_id, value)
         print("[SUCCESS] Health metric logged successfully!")
     except ValueError:
         error("Invalid input!")
     except Exception as e:
-        session.rollback()
         error(f"Error: {e}")
 
 
+def _trend_line(label, buckets, fmt):
+    """Sparkline of bucket averages plus the first and last bucket shown."""
+    averages = [float(b["average"]) if b else None for b in buckets]
+    shown = [b for b in buckets if b]
+    print(f"  {label:<7} [{sparkline(averages)}]  "
+          f"{fmt(shown[0]['start'])} avg {shown[0]['average']:.2f} -> "
+          f"{fmt(shown[-1]['start'])} avg {shown[-1]['average']:.2f}")
+
+
 def view_health_metrics(session, user):
     """View health metrics history with trend analysis"""
     header("Health Metrics History")
-    
-    # Get all metrics grouped by type
-    # SELECT * FROM metric_type
-    metric_types = session.query(MetricType).all()
-    
-    for mt in metric_types:
-        # SELECT * FROM metric WHERE user_id = ? AND metric_type = ? ORDER BY logged_date
-        metrics = session.query(Metric).filter_by(
-            user_id=user.id, 
-            metric_type=mt.id
-        ).order_by(Metric.logged_date).all()
-        
-        if metrics:
-            print(f"\n{mt.metric_name}:")
-            for metric in metrics:
-                print(f"- {metric.logged_date.strftime('%Y-%m-%d')}: {metric.value}")
-            
-            # Simple trend analysis
-            if len(metrics) >= 2:
-                first_val = float(metrics[0].value)
-                last_val = float(metrics[-1].value)
-                change = last_val - first_val
-                if change > 0:
-                    print(f"Trend: +{change:.2f} (increased)")
-                elif change < 0:
-                    print(f"Trend: {change:.2f} (decreased)")
-                else:
-                    print("Trend: No change")
+
+    trends = services.metric_trends(session, user.id)
+    if not trends:
+        print("\nNo health metrics recorded yet.")
+    for entry in trends:
+        print(f"\n{entry['metric']}: {entry['count']} readings from "
+              f"{entry['first_logged'].strftime('%Y-%m-%d')} to {entry['last_logged'].strftime('%Y-%m-%d')}")
+        print(f"  Latest: {entry['last_value']}  Average: {entry['average']:.2f}  "
+              f"Range: {entry['min']} - {entry['max']}")
+
+        # Simple trend analysis
+        if entry["change"] is not None:
+            change = float(entry["change"])
+            if change > 0:
+                print(f"  Trend: +{change:.2f} (increased)")
+            elif change < 0:
+                print(f"  Trend: {change:.2f} (decreased)")
+            else:
+                print("  Trend: No change")
+        _trend_line("Months", entry["months"], lambda d: d.strftime('%Y-%m'))
+        _trend_line("Weeks", entry["weeks"], lambda d: d.strftime('%m-%d'))
+        _trend_line("Days", entry["days"], lambda d: d.strftime('%m-%d'))
+
+    if trends and input("\nShow every reading? (y/n): ").strip().lower() == "y":
+        print_all_readings(session, user)
+
+
+def print_all_readings(session, user):
+    """Stream every reading per type, with its trend, without loading the whole history."""
+    for entry in services.stream_metric_history(session, user.id):
+        print(f"\n{entry['metric']}:")
+        for reading in entry["readings"]:
+            print(f"- {reading['logged_date'].strftime('%Y-%m-%d')}: {reading['value']}")
+
+        # Statistics are complete once the readings have been consumed
+        print(f"{entry['count']} readings, average {entry['average']:.2f}, "
+              f"range {entry['min']} - {entry['max']}")
+        if entry["change"] is not None:
+            change = float(entry["change"])
+            if change > 0:
+                print(f"Trend: +{change:.2f} (increased)")
+            elif change < 0:
+                print(f"Trend: {change:.2f} (decreased)")
+            else:
+                print("Trend: No change")
 
 
 def set_fitness_goals(session, user):
     """Set new fitness goals"""
     print("\n SET FITNESS GOALS \n")
-    
+
     # Display available metrics
-    # SELECT * FROM metric_type
-    metric_types = session.query(MetricType).all()
     print("\nSelect metric type for your goal:")
-    for mt in metric_types:
-        print(f"{mt.id}. {mt.metric_name}")
-    
+    for mt in services.list_metric_types(session):
+        print(f"{mt['id']}. {mt['name']}")
+
     try:
         metric_type_id = int(input("\nMetric type: ").strip())
         target_value = float(input("Target value: ").strip())
@@ -183,54 +171,20 @@ def set_fitness_goals(session, user):
         goal_date = datetime.strptime(goal_date_str, '%Y-%m-%d').date()
 
         # Check if an existing goal for this metric type exists
-        existing_goal = (session.query(Goal)
-                         .join(Metric, Goal.metric_id == Metric.id)
-                         .filter(Metric.user_id == user.id, Metric.metric_type == metric_type_id)
-                         .first())
-
+        existing_goal = services.find_goal(session, user.id, metric_type_id)
         if existing_goal:
             print("\nA goal for this metric already exists:")
-            print(f"- Current target: {existing_goal.target_metric.value} by {existing_goal.goal_date}")
+            print(f"- Current target: {existing_goal['target_value']} by {existing_goal['goal_date']}")
             overwrite = input("Overwrite existing goal? (y/N): ").strip().lower()
             if overwrite != 'y':
                 print("Keeping existing goal unchanged.")
                 return
 
-        # Create a metric entry representing the target value (used to tie goal to type/value)
-        goal_metric = Metric(
-            user_id=user.id,
-            metric_type=metric_type_id,
-            value=Decimal(str(target_value)),
-            logged_date=datetime.now()
-        )
-        session.add(goal_metric)
-        session.flush()
-
-        if existing_goal:
-            # Replace existing goal's target and date
-            old_metric = existing_goal.target_metric
-            existing_goal.metric_id = goal_metric.id
-            existing_goal.goal_date = goal_date
-            session.flush()
-            # Remove the previously attached target metric row to avoid clutter
-            try:
-                session.delete(old_metric)
-            except Exception:
-                pass
-        else:
-            # Create a new goal
-            new_goal = Goal(
-                metric_id=goal_metric.id,
-                goal_date=goal_date
-            )
-            session.add(new_goal)
-
-        session.commit()
+        services.set_goal(session, user.id, metric_type_id, target_value, goal_date)
         print("[SUCCESS] Fitness goal saved!")
     except ValueError:
         print("[ERROR] Invalid input format!")
     except Exception as e:
-        session.rollback()
         print(f"[ERROR] Error: {e}")
 
 
@@ -238,162 +192,157 @@ def view_goal_progress(session, user):
     """Display progress towards each fitness goal with latest metrics."""
     header("Goal Progress")
 
-    goals = (session.query(Goal)
-             .join(Metric, Goal.metric_id == Metric.id)
-             .filter(Metric.user_id == user.id)
-             .all())
-    if not goals:
+    progress = services.goal_progress(session, user.id)
+    if not progress:
         print("\nNo fitness goals set yet.")
         return
 
-    for goal in goals:
-        target_metric = goal.target_metric
-        metric_type_id = target_metric.metric_type
-        metric_name = target_metric.metric_type_obj.metric_name
-        target_val = float(target_metric.value)
-
-        # Latest actual metric EXCLUDING the target metric row
-        latest_actual = (session.query(Metric)
-                         .filter(Metric.user_id == user.id,
-                                 Metric.metric_type == metric_type_id,
-                                 Metric.id != goal.metric_id)
-                         .order_by(Metric.logged_date.desc())
-                         .first())
-
-        # Baseline value at or before goal creation (excluding the goal target row)
-        baseline = (session.query(Metric)
-                    .filter(Metric.user_id == user.id,
-                            Metric.metric_type == metric_type_id,
-                            Metric.id != goal.metric_id,
-                            Metric.logged_date <= target_metric.logged_date)
-                    .order_by(Metric.logged_date.desc())
-                    .first())
-
-        print(f"\n- {metric_name}")
-        print(f"  Target: {target_val:.2f} by {goal.goal_date}")
-
-        if latest_actual:
-            current_val = float(latest_actual.value)
+    for goal in progress:
+        target_val = float(goal["target_value"])
+        print(f"\n- {goal['metric']}")
+        print(f"  Target: {target_val:.2f} by {goal['goal_date']}")
+
+        if goal["latest_value"] is not None:
+            current_val = float(goal["latest_value"])
             delta = target_val - current_val
             status = "increase" if delta > 0 else ("decrease" if delta < 0 else "reach")
-            print(f"  Latest: {current_val:.2f} ({latest_actual.logged_date.strftime('%Y-%m-%d')})")
+            print(f"  Latest: {current_val:.2f} ({goal['latest_date'].strftime('%Y-%m-%d')})")
             if delta != 0:
                 print(f"  Remaining to {status}: {abs(delta):.2f}")
             else:
                 print("  Goal value reached.")
 
-            # Progress percentage relative to baseline, if available/meaningful
-            if baseline and float(baseline.value) != target_val:
-                baseline_val = float(baseline.value)
-                total_needed = target_val - baseline_val
-                progressed = current_val - baseline_val
-                if total_needed != 0:
-                    pct = max(0.0, min(1.0, progressed / total_needed)) * 100.0
-                    print(f"  Progress: {pct:.0f}% since goal set (baseline {baseline_val:.2f})")
+            if goal["percent"] is not None:
+                print(f"  Progress: {goal['percent']:.0f}% since goal set "
+                      f"(baseline {float(goal['baseline_value']):.2f})")
         else:
             print("  No logged metrics yet to measure progress.")
 
 
-def browse_and_enroll_sessions(session, user):
-    """Browse upcoming sessions and enroll if space is available."""
-    header("Browse & Enroll in Sessions")
+def _session_filters(session, user):
+    """Ask for optional browse filters; blank answers leave a filter off."""
+    filters = {"sex": user.sex}
+    date_from = input("\nFrom date (YYYY-MM-DD, Enter for today): ").strip()
+    if date_from:
+        filters["date_from"] = datetime.strptime(date_from, '%Y-%m-%d').date()
+    date_to = input("To date (YYYY-MM-DD, Enter for no limit): ").strip()
+    if date_to:
+        filters["date_to"] = datetime.strptime(date_to, '%Y-%m-%d').date()
+
+    print("\nTrainers:")
+    for t in services.list_trainers(session):
+        print(f"  {t['id']}. {t['first_name']} {t['last_name']}")
+    trainer_id = input("Trainer ID (Enter for any): ").strip()
+    if trainer_id:
+        filters["trainer_id"] = int(trainer_id)
+
+    print("\nRooms:")
+    for r in services.list_rooms(session):
+        print(f"  {r['id']}. {r['name']}")
+    room_id = input("Room ID (Enter for any): ").strip()
+    if room_id:
+        filters["room_id"] = int(room_id)
+
+    print("\nSession Types:")
+    for st in services.list_schedule_types(session):
+        print(f"  {st['id']}. {st['type']}")
+    sched_type = input("Type ID (Enter for any): ").strip()
+    if sched_type:
+        filters["schedule_type"] = int(sched_type)
+
+    filters["open_only"] = input("Only sessions with spots left? (y/N): ").strip().lower() == 'y'
+    return filters
 
-    today = date.today()
-    # Upcoming sessions with schedule info
-    sessions = (session.query(Session)
-                .join(Schedule)
-                .filter(Schedule.date >= today)
-                .order_by(Schedule.date, Schedule.start_time)
-                .all())
 
-    if not sessions:
-        print("\nNo upcoming sessions are available at the moment.")
-        return
-
-    print("\nAvailable Sessions:")
-    rows = []
-    for i, sess in enumerate(sessions, 1):
-        sched = sess.schedule
-        trainer = sched.trainer
-        enrolled_count = len(sess.enrollments)
-        spots_left = max(0, sess.size - enrolled_count)
-        room_name = sess.room.name if getattr(sess, "room", None) else (sess.location or "TBA")
-        print(f"{i}. {sess.name} | {sched.date} {sched.start_time}-{sched.end_time} | "
-              f"Trainer: {trainer.first_name} {trainer.last_name} | "
-              f"Location: {room_name} | "
-              f"Capacity: {enrolled_count}/{sess.size} (Left: {spots_left})")
+def browse_and_enroll_sessions(session, user):
+    """Browse upcoming sessions a page at a time and enroll if space is available."""
+    header("Browse & Enroll in Sessions")
 
+    filters = {"sex": user.sex}
+    filtered = False
+    # Cursor that starts each page seen so far, so P can step back
+    page_starts = [None]
     try:
-        choice = int(input("\nSelect a session to enroll (0 to go back): ").strip())
-        if choice == 0:
-            return
-        if not (1 <= choice <= len(sessions)):
-            error("Invalid selection!")
-            return
+        while True:
+            page = services.browse_sessions(session, after=page_starts[-1], **filters)
+            sessions = page["sessions"]
+            if not sessions and len(page_starts) == 1 and not filtered:
+                print("\nNo upcoming sessions are available at the moment.")
+                return
 
-        selected = sessions[choice - 1]
-        # Duplicate enrollment check
-        existing = (session.query(Enrollment)
-                    .filter(Enrollment.session_id == selected.id,
-                            Enrollment.member_id == user.id)
-                    .first())
-        if existing:
-            error("You are already enrolled in this session.")
-            return
+            print(f"\nAvailable Sessions (page {len(page_starts)}):")
+            if not sessions:
+                print("No sessions match these filters.")
+            for i, sess in enumerate(sessions, 1):
+                print(f"{i}. {sess['name']} | {sess['date']} {sess['start_time']}-{sess['end_time']} | "
+                      f"Trainer: {sess['trainer']} | "
+                      f"Location: {sess['location']} | "
+                      f"Capacity: {sess['enrolled']}/{sess['size']} (Left: {sess['spots_left']})")
+
+            options = []
+            if page["next"]:
+                options.append("N = next page")
+            if len(page_starts) > 1:
+                options.append("P = previous page")
+            options.append("F = filter")
+            choice = input(f"\nSelect a session to enroll ({', '.join(options)}, 0 to go back): ").strip().upper()
+            if choice == "0":
+                return
+            if choice == "N" and page["next"]:
+                page_starts.append(page["next"])
+                continue
+            if choice == "P" and len(page_starts) > 1:
+                page_starts.pop()
+                continue
+            if choice == "F":
+                filters = _session_filters(session, user)
+                filtered = True
+                page_starts = [None]
+                continue
+
+            choice = int(choice)
+            if not (1 <= choice <= len(sessions)):
+                error("Invalid selection!")
+                return
 
-        # Capacity check
-        current = len(selected.enrollments)
-        if current >= selected.size:
-            error("This session is full.")
+            services.enroll(session, user.id, sessions[choice - 1]["id"])
+            print("[SUCCESS] You have been enrolled in the session!")
             return
-
-        enrollment = Enrollment(session_id=selected.id, member_id=user.id, attended=False)
-        session.add(enrollment)
-        session.commit()
-        print("[SUCCESS] You have been enrolled in the session!")
     except ValueError:
         error("Invalid input!")
+    except ServiceError as e:
+        error(str(e))
     except Exception as e:
-        session.rollback()
         error(f"Error: {e}")
 
 def cancel_session(session, user):
     """Cancel a scheduled session"""
     header("Cancel Session")
-    
+
     # Get user's upcoming enrollments
-    today = date.today()
-    # SELECT * FROM enrollment JOIN session ON enrollment.session_id = session.id JOIN schedule ON session.schedule_id = schedule.id WHERE enrollment.member_id = ? AND schedule.date >= ? ORDER BY schedule.date, schedule.start_time
-    enrollments = session.query(Enrollment).join(Session).join(Schedule).filter(
-        Enrollment.member_id == user.id,
-        Schedule.date >= today
-    ).order_by(Schedule.date, Schedule.start_time).all()
-    
+    enrollments = services.upcoming_enrollments(session, user.id)
     if not enrollments:
         print("\nYou have no upcoming sessions to cancel.")
         return
-    
+
     print("\nYour Upcoming Sessions:")
     for i, enrollment in enumerate(enrollments, 1):
-        sess = enrollment.session
-        sched = sess.schedule
-        print(f"{i}. {sess.name} - {sched.date} at {sched.start_time}")
-    
+        print(f"{i}. {enrollment['name']} - {enrollment['date']} at {enrollment['start_time']}")
+
     try:
         choice = int(input("\nSelect session to cancel (0 to go back): ").strip())
         if choice == 0:
             return
         if 1 <= choice <= len(enrollments):
-            selected = enrollments[choice - 1]
-            session.delete(selected)
-            session.commit()
+            services.cancel_enrollment(session, user.id, enrollments[choice - 1]["id"])
             print("[SUCCESS] Session cancelled successfully!")
         else:
             error("Invalid selection!")
     except ValueError:
         error("Invalid input!")
+    except ServiceError as e:
+        error(str(e))
     except Exception as e:
-        session.rollback()
         error(f"Error: {e}")
 
 
@@ -411,29 +360,28 @@ def member_menu(session, user):
             "Cancel Session",
             "Logout",
         ])
-        
+
         if choice == '1':
-            member_dashboard(session, user)
+            run_action(member_dashboard, session, user)
         elif choice == '2':
-            manage_profile(session, user)
+            run_action(manage_profile, session, user)
         elif choice == '3':
-            log_health_metrics(session, user)
+            run_action(log_health_metrics, session, user)
         elif choice == '4':
-            view_health_metrics(session, user)
+            run_action(view_health_metrics, session, user)
         elif choice == '5':
-            set_fitness_goals(session, user)
+            run_action(set_fitness_goals, session, user)
         elif choice == '6':
-            view_goal_progress(session, user)
+            run_action(view_goal_progress, session, user)
         elif choice == '7':
-            browse_and_enroll_sessions(session, user)
+            run_action(browse_and_enroll_sessions, session, user)
         elif choice == '8':
-            cancel_session(session, user)
+            run_action(cancel_session, session, user)
         elif choice == '9':
             print("\nLogging out...")
             sleep(0.8)
             break
         else:
             error("Invalid choice!")
-        
-        pause()
 
+        pause()
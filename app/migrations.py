@@ -0,0 +1,188 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# In-place schema migrations for databases created by older versions (each step is idempotent)
+
+from typing import Callable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from models.models import (BUSY_BITMAP_DDL, ROOM_BOOKED_SQL, SCHEDULE_SLOT_SQL, SESSION_SLOT_DDL, USER_ROLLUP_DDL,
+                           BusyBitmap)
+from services.availability import rebuild_busy_bitmaps
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    # SELECT 1 FROM information_schema.columns WHERE table_name = ? AND column_name = ?
+    return conn.execute(text("""
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column)
+    """), {"table": table, "column": column}).scalar()
+
+
+def goal_targets_on_goal(conn: Connection) -> bool:
+    """Move goal targets out of metric: goals used to point at a fake reading holding the target.
+
+    The target's member, type, value and timestamp become columns of goal, the fake readings are
+    deleted, and older duplicate goals for the same member and type are dropped (newest wins).
+    """
+    if not _has_column(conn, "goal", "metric_id"):
+        return False
+    conn.execute(text("""
+        ALTER TABLE goal ADD COLUMN IF NOT EXISTS user_id integer,
+                         ADD COLUMN IF NOT EXISTS metric_type integer,
+                         ADD COLUMN IF NOT EXISTS target_value numeric(10, 2),
+                         ADD COLUMN IF NOT EXISTS created_at timestamp
+    """))
+    # UPDATE goal SET user_id, metric_type, target_value, created_at FROM metric WHERE metric.id = goal.metric_id
+    conn.execute(text("""
+        UPDATE goal g SET user_id = m.user_id, metric_type = m.metric_type,
+                          target_value = m.value, created_at = m.logged_date
+        FROM metric m WHERE m.id = g.metric_id
+    """))
+    # Goals whose target row is already gone cannot be recovered
+    conn.execute(text("DELETE FROM goal WHERE user_id IS NULL"))
+    # DELETE the target rows; matching on member and time as well keeps the partition lookups exact
+    conn.execute(text("""
+        DELETE FROM metric m USING goal g
+        WHERE m.id = g.metric_id AND m.user_id = g.user_id AND m.logged_date = g.created_at
+    """))
+    conn.execute(text("""
+        DELETE FROM goal g USING goal newer
+        WHERE newer.user_id = g.user_id AND newer.metric_type = g.metric_type
+          AND (newer.created_at, newer.id) > (g.created_at, g.id)
+    """))
+    conn.execute(text("""
+        ALTER TABLE goal DROP COLUMN metric_id,
+                         ALTER COLUMN user_id SET NOT NULL,
+                         ALTER COLUMN metric_type SET NOT NULL,
+                         ALTER COLUMN target_value SET NOT NULL,
+                         ALTER COLUMN created_at SET NOT NULL,
+                         ALTER COLUMN created_at SET DEFAULT now(),
+                         ADD CONSTRAINT goal_user_id_fkey FOREIGN KEY (user_id) REFERENCES "user" (id) ON DELETE CASCADE,
+                         ADD CONSTRAINT goal_metric_type_fkey FOREIGN KEY (metric_type) REFERENCES metric_type (id),
+                         ADD CONSTRAINT uq_goal_user_type UNIQUE (user_id, metric_type)
+    """))
+    return True
+
+
+def metric_index_covers_value(conn: Connection) -> bool:
+    """Rebuild ix_metric_user_type_logged with INCLUDE (value) so history and goal lookups skip the heap."""
+    # SELECT indexdef FROM pg_indexes WHERE indexname = 'ix_metric_user_type_logged'
+    definition = conn.execute(text("""
+        SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND indexname = 'ix_metric_user_type_logged'
+    """)).scalar()
+    if definition and "INCLUDE" in definition:
+        return False
+    conn.execute(text("DROP INDEX IF EXISTS ix_metric_user_type_logged"))
+    conn.execute(text("""
+        CREATE INDEX ix_metric_user_type_logged ON metric (user_id, metric_type, logged_date) INCLUDE (value)
+    """))
+    return True
+
+
+# Sessions without a room are left out: int4range(NULL, NULL) is unbounded and overlaps every room
+_ROOM_EXCLUSION_DDL = text(f"""
+    ALTER TABLE session ADD CONSTRAINT ex_session_room_slot
+    EXCLUDE USING gist (int4range(room_id, room_id, '[]') WITH &&, slot WITH &&) WHERE ({ROOM_BOOKED_SQL})
+""")
+
+
+def booking_exclusion_constraints(conn: Connection) -> bool:
+    """Add the slot ranges and the exclusion constraints that keep trainer and room bookings apart.
+
+    Fails, changing nothing, if the existing schedule already holds overlapping bookings.
+    """
+    if _has_column(conn, "schedule", "slot"):
+        return False
+    conn.execute(text(f"ALTER TABLE schedule ADD COLUMN slot tsrange GENERATED ALWAYS AS ({SCHEDULE_SLOT_SQL}) STORED"))
+    conn.execute(text("ALTER TABLE session ADD COLUMN slot tsrange"))
+    # UPDATE session SET slot = schedule.slot FROM schedule WHERE schedule.id = session.schedule_id
+    conn.execute(text("UPDATE session s SET slot = sc.slot FROM schedule sc WHERE sc.id = s.schedule_id"))
+    conn.execute(text("ALTER TABLE session ALTER COLUMN slot SET NOT NULL"))
+    for statement in SESSION_SLOT_DDL:
+        conn.execute(text(statement))
+    conn.execute(text("""
+        ALTER TABLE schedule ADD CONSTRAINT ex_schedule_trainer_slot
+        EXCLUDE USING gist (int4range(trainer_id, trainer_id, '[]') WITH &&, slot WITH &&)
+    """))
+    conn.execute(_ROOM_EXCLUSION_DDL)
+    return True
+
+
+def room_exclusion_skips_roomless(conn: Connection) -> bool:
+    """Rebuild ex_session_room_slot as a partial constraint over sessions that have a room.
+
+    The first version also covered room_id NULL, whose int4range is unbounded and clashed with
+    every room.
+    """
+    # SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = 'ex_session_room_slot'
+    definition = conn.execute(text(
+        "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = 'ex_session_room_slot'")).scalar()
+    if definition is None or "WHERE" in definition:
+        return False
+    conn.execute(text("ALTER TABLE session DROP CONSTRAINT ex_session_room_slot"))
+    conn.execute(_ROOM_EXCLUSION_DDL)
+    return True
+
+
+def busy_bitmaps(conn: Connection) -> bool:
+    """Add the per-day trainer and room busy bitmaps, their triggers, and fill them from the bookings."""
+    # SELECT to_regclass('busy_bitmap')
+    if conn.execute(text("SELECT to_regclass('busy_bitmap')")).scalar() is not None:
+        return False
+    BusyBitmap.__table__.create(conn)
+    for statement in BUSY_BITMAP_DDL:
+        conn.execute(text(statement))
+    rebuild_busy_bitmaps(conn)
+    return True
+
+
+def room_bitmaps_skip_roomless(conn: Connection) -> bool:
+    """Replace refresh_busy_bitmaps and rebuild every bitmap.
+
+    Its first version let sessions without a room, whose int4range is unbounded, set bits in
+    every room's bitmap.
+    """
+    # SELECT pg_get_functiondef('refresh_busy_bitmaps'::regproc)
+    definition = conn.execute(text("""
+        SELECT pg_get_functiondef(p.oid) FROM pg_proc p WHERE p.proname = 'refresh_busy_bitmaps'
+    """)).scalar()
+    if definition is None or "s.room_id IS NOT NULL" in definition:
+        return False
+    for statement in BUSY_BITMAP_DDL:
+        if statement.lstrip().startswith("CREATE OR REPLACE FUNCTION refresh_busy_bitmaps"):
+            conn.execute(text(statement))
+    rebuild_busy_bitmaps(conn)
+    return True
+
+
+def user_delete_drops_rollups(conn: Connection) -> bool:
+    """Add the trigger that deletes a member's metric rollups with the member, and drop orphaned ones."""
+    # SELECT 1 FROM pg_trigger WHERE tgname = 'tg_user_drop_rollups'
+    if conn.execute(text("SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'tg_user_drop_rollups')")).scalar():
+        return False
+    for statement in USER_ROLLUP_DDL:
+        conn.execute(text(statement))
+    # DELETE FROM metric_rollup WHERE user_id NOT IN (SELECT id FROM "user")
+    conn.execute(text("""
+        DELETE FROM metric_rollup r WHERE NOT EXISTS (SELECT 1 FROM "user" u WHERE u.id = r.user_id)
+    """))
+    return True
+
+
+# Applied in order; each returns True if it changed anything
+MIGRATIONS: List[Tuple[str, Callable[[Connection], bool]]] = [
+    ("goal targets stored on goal", goal_targets_on_goal),
+    ("metric history index covers value", metric_index_covers_value),
+    ("booking exclusion constraints", booking_exclusion_constraints),
+    ("room exclusion skips sessions without a room", room_exclusion_skips_roomless),
+    ("trainer and room busy bitmaps", busy_bitmaps),
+    ("room bitmaps skip sessions without a room", room_bitmaps_skip_roomless),
+    ("user delete drops metric rollups", user_delete_drops_rollups),
+]
+
+
+def migrate(conn: Connection) -> List[str]:
+    """Apply every pending migration in the caller's transaction; returns the names of those applied."""
+    return [name for name, step in MIGRATIONS if step(conn)]
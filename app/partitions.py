@@ -0,0 +1,120 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Monthly range partitions of the metric table (create ahead, detach/drop old)
+
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from services.rollups import forget_metric_ranges
+
+PARENT = "metric"
+DEFAULT_PARTITION = "metric_default"
+# Months created ahead of the current one by ensure_metric_partitions()
+MONTHS_AHEAD = 3
+_NAME = re.compile(r"^metric_(\d{4})_(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def archive_name(month: date) -> str:
+    """Name a detached partition is kept under (a plain table, no longer part of metric)."""
+    return f"{PARENT}_archive_{month:%Y_%m}"
+
+
+def list_metric_partitions(conn: Connection) -> List[Dict[str, object]]:
+    """Partitions of metric, oldest first, with their month (None for the default) and estimated rows."""
+    # SELECT child name, reltuples FROM pg_inherits JOIN pg_class WHERE parent = 'metric'
+    rows = conn.execute(text("""
+        SELECT c.relname, greatest(c.reltuples, 0)::bigint
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'metric'::regclass
+    """)).all()
+    partitions = []
+    for name, estimate in rows:
+        match = _NAME.match(name)
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append({"name": name, "month": month, "rows_estimate": estimate})
+    return sorted(partitions, key=lambda p: (p["month"] is None, p["month"] or date.min))
+
+
+def create_metric_partition(conn: Connection, month: date) -> Optional[str]:
+    """Create the partition for one month; returns its name, or None if it already exists.
+
+    Rows for that month already sitting in the default partition are moved into the new one.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+        return None
+    bounds = {"lo": datetime.combine(month, datetime.min.time()),
+              "hi": datetime.combine(add_months(month, 1), datetime.min.time())}
+    strays = conn.execute(text(f"""
+        SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE logged_date >= :lo AND logged_date < :hi)
+    """), bounds).scalar()
+    lo, hi = (f"'{bounds['lo']:%Y-%m-%d}'", f"'{bounds['hi']:%Y-%m-%d}'")
+    if not strays:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ({lo}) TO ({hi})"))
+        return name
+    # Attaching would fail while the default partition still holds rows for the range, so build the
+    # partition as a plain table, move the rows over, then attach it (all in the caller's transaction)
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE logged_date >= :lo AND logged_date < :hi RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds)
+    conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ({lo}) TO ({hi})"))
+    return name
+
+
+def ensure_metric_partitions(conn: Connection, first_month: Optional[date] = None,
+                             months_ahead: int = MONTHS_AHEAD, today: Optional[date] = None) -> List[str]:
+    """Create any missing monthly partitions from first_month (default: this month) to months_ahead out."""
+    current = month_start(today or date.today())
+    month = month_start(first_month) if first_month else current
+    created = []
+    while month <= add_months(current, months_ahead):
+        name = create_metric_partition(conn, month)
+        if name:
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def detach_metric_partitions(conn: Connection, before: date, drop: bool = False) -> List[str]:
+    """Detach (and archive or drop) every monthly partition for months before `before`'s month.
+
+    Their readings are taken out of the metric rollups in the same transaction.
+    """
+    cutoff = month_start(before)
+    removed, months = [], []
+    for part in list_metric_partitions(conn):
+        if part["month"] is None or part["month"] >= cutoff:
+            continue
+        name = part["name"]
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        months.append((part["month"], add_months(part["month"], 1)))
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+            removed.append(name)
+        else:
+            # Renamed so the month can be partitioned again later without clashing with the archive
+            archive = archive_name(part["month"])
+            conn.execute(text(f"ALTER TABLE {name} RENAME TO {archive}"))
+            removed.append(archive)
+    forget_metric_ranges(conn, months)
+    return removed
@@ -0,0 +1,141 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Per-action SQL profiling
+
+import atexit
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Set APP_PROFILE=1 (or to a file path) to profile every menu action
+PROFILE_ENV = "APP_PROFILE"
+DEFAULT_REPORT_PATH = "profile_report.json"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("profile_action", default=None)
+_results: Dict[str, List[Dict[str, float]]] = {}
+_results_lock = threading.Lock()
+_installed = False
+_report_path: Optional[str] = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    starts = conn.info.get("profile_start")
+    if stats is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats["statements"] += 1
+    stats["db_ms"] += elapsed * 1000.0
+    # rowcount is the number of rows returned for SELECTs on psycopg2 (-1 when unknown)
+    if cursor.description is not None and cursor.rowcount and cursor.rowcount > 0:
+        stats["rows"] += cursor.rowcount
+
+
+def install() -> None:
+    """Attach statement counters to every engine (idempotent)."""
+    global _installed
+    if _installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _installed = True
+
+
+@contextmanager
+def track(action: str, record: bool = True) -> Iterator[Dict[str, float]]:
+    """Count statements, DB time, rows and wall time for the enclosed block."""
+    install()
+    stats = {"statements": 0, "db_ms": 0.0, "rows": 0, "wall_ms": 0.0}
+    token = _current.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats["wall_ms"] = (time.perf_counter() - start) * 1000.0
+        _current.reset(token)
+        if record:
+            with _results_lock:
+                _results.setdefault(action, []).append(stats)
+
+
+def is_enabled() -> bool:
+    return _report_path is not None
+
+
+def run_action(handler: Callable, *args, **kwargs):
+    """Dispatch a menu handler, profiling it when APP_PROFILE is set."""
+    if not is_enabled():
+        return handler(*args, **kwargs)
+    with track(handler.__name__):
+        return handler(*args, **kwargs)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize() -> Dict[str, Dict[str, object]]:
+    """Aggregate recorded invocations into per-action p50/p95/max figures."""
+    with _results_lock:
+        snapshot = {action: list(runs) for action, runs in _results.items()}
+
+    report = {}
+    for action, runs in sorted(snapshot.items()):
+        summary = {"calls": len(runs)}
+        for key in ("statements", "db_ms", "rows", "wall_ms"):
+            values = [run[key] for run in runs]
+            summary[key] = {
+                "p50": round(_percentile(values, 50), 3),
+                "p95": round(_percentile(values, 95), 3),
+                "max": round(max(values), 3),
+                "total": round(sum(values), 3),
+            }
+        report[action] = summary
+    return report
+
+
+def write_report(path: Optional[str] = None) -> Optional[str]:
+    """Write the aggregated report as JSON; returns the path written (if any)."""
+    path = path or _report_path or DEFAULT_REPORT_PATH
+    report = summarize()
+    if not report:
+        return None
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    return path
+
+
+def enable(path: Optional[str] = None) -> None:
+    """Turn on profiling for menu actions and dump the report at exit."""
+    global _report_path
+    if _report_path is not None:
+        return
+    _report_path = path or DEFAULT_REPORT_PATH
+    install()
+    atexit.register(write_report)
+
+
+def enable_from_env() -> None:
+    value = os.getenv(PROFILE_ENV, "").strip()
+    if not value or value.lower() in ("0", "false", "no", "off"):
+        return
+    enable(None if value.lower() in ("1", "true", "yes", "on") else value)
+
+
+enable_from_env()
@@ -7,8 +7,7 @@ from datetime import date, time, datetime
 from decimal import Decimal
 from typing import Dict
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 
 from models import (
     Base,
@@ -16,6 +15,7 @@ from models import (
     User,
     Service,
     Bill,
+    Subscription,
     Item,
     MetricType,
     Metric,
@@ -27,18 +27,27 @@ from models import (
     Session as TrainingSession,
     Enrollment,
 )
+from app.db import get_engine, get_session
+from app.partitions import ensure_metric_partitions
+from services import lookups, rebuild_metric_rollups
 
 
 def reset_and_seed(database_url: str) -> None:
     """Drop and recreate all tables, then seed sample data via ORM."""
-    engine = create_engine(database_url, echo=False)
+    engine = get_engine(database_url)
 
     # Drop and recreate schema
-    Base.metadata.drop_all(bind=engine)
+    # CASCADE so constraints left by older versions of the schema cannot block the drop
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(text(f'DROP TABLE IF EXISTS "{table.name}" CASCADE'))
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # Monthly metric partitions from the oldest seeded reading through a few months ahead
+        ensure_metric_partitions(conn, first_month=date(2024, 11, 1))
+    lookups.invalidate()
 
-    SessionFactory = sessionmaker(bind=engine)
-    db = SessionFactory()
+    db = get_session(database_url)
 
     try:
         # Roles
@@ -187,6 +196,7 @@ def reset_and_seed(database_url: str) -> None:
         sess_pt = TrainingSession(
             schedule_id=sched_pt.id,
             size=1,
+            enrolled_count=1,
             name="Personal Training",
             desc="One-on-one strength training session",
             location="Personal Training Room 1",
@@ -195,6 +205,7 @@ def reset_and_seed(database_url: str) -> None:
         sess_group = TrainingSession(
             schedule_id=sched_group.id,
             size=20,
+            enrolled_count=1,
             name="Basketball Skills Training",
             desc="Improve your basketball fundamentals",
             location="Multi-Purpose Room",
@@ -220,6 +231,14 @@ def reset_and_seed(database_url: str) -> None:
             Item(bill_id=bill.id, service_id=service_lookup["Personal Training Session (60 min)"].id, quantity=2),
         ])
 
+        # Recurring services billed by the monthly billing run
+        db.add_all([
+            Subscription(member_id=member_user.id, service_id=service_lookup["Monthly Membership"].id,
+                         quantity=1, start_date=date(2024, 11, 1)),
+            Subscription(member_id=member_user.id, service_id=service_lookup["Locker Rental (Monthly)"].id,
+                         quantity=1, start_date=date(2024, 11, 1)),
+        ])
+
         # Metrics for member
         db.add_all([
             Metric(user_id=member_user.id, metric_type=metric_types["Height"].id, value=Decimal("75"), logged_date=datetime(2024, 11, 20, 9, 0, 0)),
@@ -229,6 +248,8 @@ def reset_and_seed(database_url: str) -> None:
         ])
 
         db.commit()
+        # Seeded readings were added directly, so build their trend rollups in one pass
+        rebuild_metric_rollups(db)
     except Exception:
         db.rollback()
         raise
@@ -0,0 +1,517 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Async HTTP/JSON server (aiohttp + SQLAlchemy asyncio) over the service layer
+#
+# Usage (from the repo root):
+#   python app/main.py --serve --port 8080
+#   curl -u max.ver@dudududu.com:member123 localhost:8080/api/member/dashboard
+
+import argparse
+import base64
+import binascii
+import json
+import sys
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiohttp import web
+
+import services
+from services import ServiceError
+from app.db import get_async_sessionmaker, async_pool_stats, dispose_async_engines
+
+SESSION_FACTORY = web.AppKey("session_factory", object)
+DATABASE_URL = web.AppKey("database_url", str)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_response(data, status: int = 200) -> web.Response:
+    return web.json_response(data, status=status, dumps=partial(json.dumps, default=_json_default))
+
+
+class HTTPError(Exception):
+    """Short-circuit a handler with an HTTP status and message."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# Request parsing -----------------------------------------------------------
+
+async def _body(request: web.Request) -> Dict[str, object]:
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise HTTPError(400, "Request body must be JSON.")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Request body must be a JSON object.")
+    return data
+
+
+def _field(data: Dict[str, object], name: str, parse: Callable = str, required: bool = True):
+    value = data.get(name)
+    if value in (None, ""):
+        if required:
+            raise HTTPError(400, f"'{name}' is required.")
+        return None
+    try:
+        return parse(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{name}' is invalid.")
+
+
+def _parse_date(value) -> date:
+    return datetime.strptime(str(value), '%Y-%m-%d').date()
+
+
+def _parse_time(value) -> time:
+    return datetime.strptime(str(value), '%H:%M').time()
+
+
+def _path_int(request: web.Request, name: str) -> int:
+    try:
+        return int(request.match_info[name])
+    except ValueError:
+        raise HTTPError(404, "Not found.")
+
+
+# Sessions and auth -----------------------------------------------------------
+
+async def _call(request: web.Request, fn: Callable, *args, **kwargs):
+    """Run a synchronous service function on the request's AsyncSession."""
+    return await request["db"].run_sync(fn, *args, **kwargs)
+
+
+def _credentials(request: web.Request) -> Optional[tuple]:
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Basic "):
+        return None
+    try:
+        email, _, password = base64.b64decode(header[6:]).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return email, password
+
+
+async def current_user(request: web.Request, role: Optional[str] = None) -> Dict[str, object]:
+    """Authenticate the request with HTTP Basic credentials and check the role."""
+    creds = _credentials(request)
+    if not creds:
+        raise HTTPError(401, "Authentication required.")
+    user = await _call(request, services.authenticate, *creds)
+    if not user:
+        raise HTTPError(401, "Invalid credentials.")
+    if role and user["role"] != role:
+        raise HTTPError(403, f"{role} access required.")
+    return user
+
+
+@web.middleware
+async def session_middleware(request: web.Request, handler):
+    # One AsyncSession per request; it only checks out a pooled connection once it runs a query
+    async with request.app[SESSION_FACTORY]() as session:
+        request["db"] = session
+        return await handler(request)
+
+
+@web.middleware
+async def error_middleware(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except HTTPError as e:
+        response = json_response({"error": str(e)}, status=e.status)
+        if e.status == 401:
+            response.headers["WWW-Authenticate"] = 'Basic realm="fitness"'
+        return response
+    except ServiceError as e:
+        return json_response({"error": str(e)}, status=400)
+
+
+# Accounts ----------------------------------------------------------------
+
+async def register(request: web.Request) -> web.Response:
+    data = await _body(request)
+    user = await _call(
+        request, services.register_member,
+        _field(data, "email"), _field(data, "password"),
+        _field(data, "first_name"), _field(data, "last_name"),
+        _field(data, "date_of_birth", _parse_date, required=False),
+        _field(data, "sex", lambda v: str(v).upper(), required=False),
+        _field(data, "phone", required=False),
+    )
+    return json_response(user, status=201)
+
+
+async def me(request: web.Request) -> web.Response:
+    return json_response(await current_user(request))
+
+
+async def update_me(request: web.Request) -> web.Response:
+    user = await current_user(request)
+    data = await _body(request)
+    if "phone" in data:
+        await _call(request, services.update_phone, user["id"], _field(data, "phone"))
+    if "password" in data:
+        await _call(request, services.change_password, user["id"], _field(data, "password"))
+    return json_response(await _call(request, services.get_account, user["id"]))
+
+
+# Member --------------------------------------------------------------------
+
+async def metric_types(request: web.Request) -> web.Response:
+    await current_user(request)
+    return json_response(await _call(request, services.list_metric_types))
+
+
+async def member_dashboard(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    return json_response(await _call(request, services.dashboard, user["id"]))
+
+
+# NDJSON lines written per chunk of GET /api/member/metrics (one service call each)
+HISTORY_CHUNK_LINES = 2000
+
+
+def _history_lines(session, member_id: int):
+    """Each reading of the member's history, then its type's summary, as NDJSON lines."""
+    for entry in services.stream_metric_history(session, member_id):
+        readings = entry.pop("readings")
+        for reading in readings:
+            yield json.dumps({"kind": "reading", "metric_type": entry["metric_type"], **reading},
+                             default=_json_default) + "\n"
+        yield json.dumps({"kind": "summary", **entry}, default=_json_default) + "\n"
+
+
+async def member_metrics(request: web.Request) -> web.StreamResponse:
+    """Stream the member's whole history as NDJSON, one cursor batch per chunk, so memory stays flat."""
+    user = await current_user(request, "Member")
+    lines = await _call(request, _history_lines, user["id"])
+    batch = await _call(request, lambda _: list(islice(lines, HISTORY_CHUNK_LINES)))
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    while batch:
+        await response.write("".join(batch).encode())
+        batch = await _call(request, lambda _: list(islice(lines, HISTORY_CHUNK_LINES)))
+    await response.write_eof()
+    return response
+
+
+async def member_trends(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    return json_response(await _call(request, services.metric_trends, user["id"]))
+
+
+async def log_metric(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    data = await _body(request)
+    metric = await _call(request, services.log_metric, user["id"],
+                         _field(data, "metric_type", int), _field(data, "value", float))
+    return json_response(metric, status=201)
+
+
+async def member_goals(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    return json_response(await _call(request, services.goal_progress, user["id"]))
+
+
+async def set_goal(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    data = await _body(request)
+    goal = await _call(request, services.set_goal, user["id"], _field(data, "metric_type", int),
+                       _field(data, "target_value", float), _field(data, "goal_date", _parse_date))
+    return json_response(goal)
+
+
+MAX_PAGE_SIZE = 100
+
+
+async def upcoming_sessions(request: web.Request) -> web.Response:
+    user = await current_user(request)
+    query = request.query
+    limit = _field(query, "limit", int, required=False) or services.members.SESSION_PAGE_SIZE
+    page = await _call(
+        request, services.browse_sessions,
+        after=_field(query, "after", required=False),
+        limit=max(1, min(limit, MAX_PAGE_SIZE)),
+        date_from=_field(query, "from", _parse_date, required=False),
+        date_to=_field(query, "to", _parse_date, required=False),
+        trainer_id=_field(query, "trainer", int, required=False),
+        room_id=_field(query, "room", int, required=False),
+        schedule_type=_field(query, "type", int, required=False),
+        # Members only see sessions open to them; staff see everything
+        sex=user["sex"] if user["role"] == "Member" else None,
+        open_only=query.get("open", "").lower() in ("1", "true", "yes"),
+    )
+    return json_response(page)
+
+
+async def enroll(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    enrollment = await _call(request, services.enroll, user["id"], _path_int(request, "session_id"))
+    return json_response(enrollment, status=201)
+
+
+async def member_enrollments(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    return json_response(await _call(request, services.upcoming_enrollments, user["id"]))
+
+
+async def cancel_enrollment(request: web.Request) -> web.Response:
+    user = await current_user(request, "Member")
+    await _call(request, services.cancel_enrollment, user["id"], _path_int(request, "enrollment_id"))
+    return web.Response(status=204)
+
+
+# Trainer -------------------------------------------------------------------
+
+async def trainer_schedule(request: web.Request) -> web.Response:
+    user = await current_user(request, "Trainer")
+    return json_response(await _call(request, services.trainer_schedule, user["id"]))
+
+
+async def add_availability(request: web.Request) -> web.Response:
+    user = await current_user(request, "Trainer")
+    data = await _body(request)
+    entry = await _call(request, services.add_availability, user["id"],
+                        _field(data, "date", _parse_date), _field(data, "start_time", _parse_time),
+                        _field(data, "end_time", _parse_time), _field(data, "schedule_type", int))
+    return json_response(entry, status=201)
+
+
+def _free_slot_query(request: web.Request) -> Dict[str, object]:
+    """length (minutes, default 60), count (default 5) and from (YYYY-MM-DD) query parameters."""
+    try:
+        return {"length_minutes": int(request.query.get("length", 60)), "count": int(request.query.get("count", 5)),
+                "after": max(datetime.combine(_parse_date(request.query["from"]), time()), datetime.now())
+                         if "from" in request.query else None}
+    except ValueError:
+        raise HTTPError(400, "length and count must be numbers and from a date (YYYY-MM-DD).")
+
+
+async def trainer_free_slots(request: web.Request) -> web.Response:
+    user = await current_user(request, "Trainer")
+    return json_response(await _call(request, services.next_free_slots, trainer_id=user["id"],
+                                     **_free_slot_query(request)))
+
+
+async def schedule_types(request: web.Request) -> web.Response:
+    await current_user(request, "Trainer")
+    return json_response(await _call(request, services.list_schedule_types))
+
+
+async def trainer_members(request: web.Request) -> web.Response:
+    user = await current_user(request, "Trainer")
+    search = request.query.get("search", "").strip() or None
+    return json_response(await _call(request, services.assigned_members, user["id"], search))
+
+
+# Admin ---------------------------------------------------------------------
+
+async def equipment(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    return json_response(await _call(request, services.list_equipment))
+
+
+async def update_equipment(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    data = await _body(request)
+    equipment_id = _path_int(request, "equipment_id")
+    await _call(request, services.update_equipment_status, equipment_id, _field(data, "status_id", int))
+    return json_response(await _call(request, services.get_equipment, equipment_id))
+
+
+async def equipment_statuses(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    return json_response(await _call(request, services.list_equipment_statuses))
+
+
+async def classes(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    return json_response(await _call(request, services.list_classes))
+
+
+async def create_class(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    data = await _body(request)
+    created = await _call(
+        request, services.create_class,
+        _field(data, "trainer_id", int), _field(data, "room_id", int),
+        _field(data, "date", _parse_date), _field(data, "start_time", _parse_time),
+        _field(data, "end_time", _parse_time), _field(data, "name"),
+        _field(data, "desc", required=False) or "", _field(data, "capacity", int),
+        _field(data, "sex_restrict", required=False) or 'A',
+    )
+    return json_response(created, status=201)
+
+
+async def cancel_class(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    await _call(request, services.cancel_class, _path_int(request, "class_id"))
+    return web.Response(status=204)
+
+
+async def free_slots(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    try:
+        trainer_id, room_id = (int(request.query[k]) if k in request.query else None for k in ("trainer", "room"))
+    except ValueError:
+        raise HTTPError(400, "trainer and room must be IDs.")
+    return json_response(await _call(request, services.next_free_slots, trainer_id=trainer_id, room_id=room_id,
+                                     **_free_slot_query(request)))
+
+
+async def admin_lookup(fn: Callable, request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    return json_response(await _call(request, fn))
+
+
+async def bills(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    query = request.query
+    limit = _field(query, "limit", int, required=False) or services.admin.BILL_PAGE_SIZE
+    return json_response(await _call(
+        request, services.unpaid_bills,
+        member_id=_field(query, "member", int, required=False),
+        after=_field(query, "after", required=False),
+        limit=max(1, min(limit, MAX_PAGE_SIZE)),
+    ))
+
+
+async def receivables(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    query = request.query
+    limit = _field(query, "limit", int, required=False) or services.admin.RECEIVABLES_PAGE_SIZE
+    return json_response(await _call(
+        request, services.receivables,
+        sort=query.get("sort", "balance"),
+        page=_field(query, "page", int, required=False) or 1,
+        limit=max(1, min(limit, MAX_PAGE_SIZE)),
+        as_of=_field(query, "as_of", _parse_date, required=False),
+    ))
+
+
+async def room_utilisation(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    last = _field(request.query, "to", _parse_date, required=False) or date.today()
+    first = _field(request.query, "from", _parse_date, required=False) or last - timedelta(days=364)
+    return json_response(await _call(request, services.room_utilisation, first, last))
+
+
+async def create_bill(request: web.Request) -> web.Response:
+    user = await current_user(request, "Admin")
+    data = await _body(request)
+    raw_items = data.get("items") or []
+    if not isinstance(raw_items, list):
+        raise HTTPError(400, "'items' must be a list.")
+    items = [(_field(item, "service_id", int), _field(item, "quantity", int)) for item in raw_items
+             if isinstance(item, dict)]
+    bill = await _call(request, services.create_bill, user["id"], _field(data, "member_id", int), items)
+    return json_response(bill, status=201)
+
+
+async def pay_bill(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    await _call(request, services.mark_paid, _path_int(request, "bill_id"))
+    return web.Response(status=204)
+
+
+async def goal_progress_report(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    return json_response(await _call(request, services.club_goal_progress))
+
+
+async def stats(request: web.Request) -> web.Response:
+    await current_user(request, "Admin")
+    return json_response({"pool": async_pool_stats(request.app[DATABASE_URL]),
+                          "lookups": services.lookups.stats()})
+
+
+# App -----------------------------------------------------------------------
+
+def create_app(database_url: Optional[str] = None) -> web.Application:
+    """Build the aiohttp application; one shared asyncio pool serves every request."""
+    app = web.Application(middlewares=[error_middleware, session_middleware])
+    app[DATABASE_URL] = database_url or ""
+    app[SESSION_FACTORY] = get_async_sessionmaker(database_url)
+
+    async def _warm_lookups(app: web.Application) -> None:
+        async with app[SESSION_FACTORY]() as session:
+            await session.run_sync(services.lookups.warm)
+
+    async def _close_pool(app: web.Application) -> None:
+        await dispose_async_engines()
+
+    app.on_startup.append(_warm_lookups)
+    app.on_cleanup.append(_close_pool)
+    app.add_routes([
+        web.post("/api/register", register),
+        web.get("/api/me", me),
+        web.patch("/api/me", update_me),
+        web.get("/api/metric-types", metric_types),
+        web.get("/api/sessions", upcoming_sessions),
+        web.get("/api/member/dashboard", member_dashboard),
+        web.get("/api/member/metrics", member_metrics),
+        web.post("/api/member/metrics", log_metric),
+        web.get("/api/member/trends", member_trends),
+        web.get("/api/member/goals", member_goals),
+        web.put("/api/member/goals", set_goal),
+        web.get("/api/member/enrollments", member_enrollments),
+        web.post("/api/sessions/{session_id}/enroll", enroll),
+        web.delete("/api/member/enrollments/{enrollment_id}", cancel_enrollment),
+        web.get("/api/trainer/schedule", trainer_schedule),
+        web.post("/api/trainer/availability", add_availability),
+        web.get("/api/trainer/schedule-types", schedule_types),
+        web.get("/api/trainer/free-slots", trainer_free_slots),
+        web.get("/api/trainer/members", trainer_members),
+        web.get("/api/admin/equipment", equipment),
+        web.patch("/api/admin/equipment/{equipment_id}", update_equipment),
+        web.get("/api/admin/equipment-statuses", equipment_statuses),
+        web.get("/api/admin/classes", classes),
+        web.post("/api/admin/classes", create_class),
+        web.delete("/api/admin/classes/{class_id}", cancel_class),
+        web.get("/api/admin/free-slots", free_slots),
+        web.get("/api/admin/trainers", partial(admin_lookup, services.list_trainers)),
+        web.get("/api/admin/rooms", partial(admin_lookup, services.list_rooms)),
+        web.get("/api/admin/members", partial(admin_lookup, services.list_members)),
+        web.get("/api/admin/services", partial(admin_lookup, services.list_services)),
+        web.get("/api/admin/bills", bills),
+        web.post("/api/admin/bills", create_bill),
+        web.post("/api/admin/bills/{bill_id}/pay", pay_bill),
+        web.get("/api/admin/receivables", receivables),
+        web.get("/api/admin/room-utilisation", room_utilisation),
+        web.get("/api/admin/goal-progress", goal_progress_report),
+        web.get("/api/admin/stats", stats),
+    ])
+    return app
+
+
+def serve(database_url: Optional[str] = None, host: str = "127.0.0.1", port: int = 8080) -> None:
+    web.run_app(create_app(database_url), host=host, port=port)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the fitness club API over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+    serve(host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# API contract check: bad client input must come back as a 4xx with an error message, never a 500
+#
+# Every request here is rejected by the server, so nothing is written. The exit code is non-zero
+# when any response has another status or no {"error": ...} body.
+#
+# Usage (from the repo root):
+#   python -m bench.api_contract                           # spawn a server on a free port
+#   python -m bench.api_contract --url http://127.0.0.1:8080
+
+import argparse
+import asyncio
+import sys
+from typing import Dict, List, Optional
+
+import aiohttp
+from sqlalchemy import text
+
+from app.db import get_engine
+from bench.load import _free_port, spawn_server
+
+# name -> (role, method, path, body, expected status); None as the role sends no credentials.
+# Bodies may refer to {member_email} and {member_id}.
+CASES: Dict[str, tuple] = {
+    "register.duplicate_email": (None, "POST", "/api/register",
+                                 {"email": "{member_email}", "password": "x", "first_name": "Dup",
+                                  "last_name": "Licate"}, 400),
+    "metrics.unknown_type": ("member", "POST", "/api/member/metrics", {"metric_type": 99999, "value": 80}, 400),
+    "metrics.value_overflow": ("member", "POST", "/api/member/metrics", {"metric_type": 1, "value": 1e12}, 400),
+    "goals.unknown_type": ("member", "PUT", "/api/member/goals",
+                           {"metric_type": 99999, "target_value": 80, "goal_date": "2030-01-01"}, 400),
+    "goals.target_overflow": ("member", "PUT", "/api/member/goals",
+                              {"metric_type": 1, "target_value": 1e12, "goal_date": "2030-01-01"}, 400),
+    "bills.unknown_member": ("admin", "POST", "/api/admin/bills",
+                             {"member_id": 999999999, "items": [{"service_id": 1, "quantity": 1}]}, 400),
+    "bills.quantity_overflow": ("admin", "POST", "/api/admin/bills",
+                                {"member_id": "{member_id}", "items": [{"service_id": 1, "quantity": 10 ** 12}]}, 400),
+}
+
+
+def pick_accounts() -> Dict[str, object]:
+    """Credentials for one member and one admin."""
+    engine = get_engine()
+    with engine.connect() as conn:
+        one = lambda role: conn.execute(text("""
+            SELECT u.id, u.email, u.password FROM "user" u JOIN role r ON r.id = u.role
+            WHERE r.name = :role ORDER BY u.id LIMIT 1
+        """), {"role": role}).one()
+        return {"member": one("Member"), "admin": one("Admin")}
+
+
+def _fill(value, params: Dict[str, object]):
+    if isinstance(value, dict):
+        return {k: _fill(v, params) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, params) for v in value]
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return params[value[1:-1]]
+    return value
+
+
+async def run_cases(base_url: str, accounts: Dict[str, object], only: Optional[List[str]] = None) -> List[str]:
+    """Send every case; returns the failures."""
+    member_id, member_email, _ = accounts["member"]
+    params = {"member_id": member_id, "member_email": member_email}
+    failures = []
+    async with aiohttp.ClientSession() as http:
+        for name, (role, method, path, body, expected) in CASES.items():
+            if only and name not in only:
+                continue
+            auth = aiohttp.BasicAuth(*accounts[role][1:]) if role else None
+            async with http.request(method, base_url + path, json=_fill(body, params), auth=auth) as resp:
+                status = resp.status
+                payload = await resp.json(content_type=None) if resp.content_type == "application/json" else None
+            message = payload.get("error") if isinstance(payload, dict) else None
+            print(f"{name:28} {status:>4}  {message or ''}")
+            if status != expected or not message:
+                failures.append(f"{name}: expected {expected} with an error message, got {status}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that bad client input gets a 4xx, never a 500.")
+    parser.add_argument("--url", help="base URL of a running server (default: spawn one)")
+    parser.add_argument("--only", help="comma-separated case names to run")
+    args = parser.parse_args(argv)
+
+    accounts = pick_accounts()
+    proc = None
+    base_url = args.url
+    if not base_url:
+        port = _free_port()
+        proc = spawn_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        failures = asyncio.run(run_cases(base_url.rstrip("/"), accounts, args.only.split(",") if args.only else None))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    if failures:
+        print("\nContract violations:")
+        for line in failures:
+            print(f"- {line}")
+        return 1
+    print("\nEvery bad request was rejected with a 4xx.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Billing run benchmark: bill N subscribed members for a cycle, then rerun it to check idempotency
+#
+# Usage (from the repo root):
+#   python -m bench.billing_run                         # 100k synthetic members, rolled back afterwards
+#   python -m bench.billing_run --members 20000 --addons 2
+
+import argparse
+import sys
+import time
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session as OrmSession
+
+import services
+from services import lookups
+from app.db import get_engine
+
+# Synthetic members and their subscriptions, created inside the benchmark's transaction
+_MEMBERS_SQL = text("""
+    INSERT INTO "user" (email, password, first_name, last_name, sex, role)
+    SELECT 'billing.bench.' || n || '@club.test', 'x', 'Bench', 'Member ' || n, 'O', :role
+    FROM generate_series(1, :members) AS n
+    RETURNING id
+""")
+_SUBSCRIPTIONS_SQL = text("""
+    INSERT INTO subscription (member_id, service_id, quantity, start_date)
+    SELECT u.id, s.service_id, 1, :start
+    FROM "user" u
+    CROSS JOIN LATERAL (
+        SELECT :monthly AS service_id
+        UNION ALL
+        (SELECT id FROM service WHERE id <> :monthly ORDER BY (id + u.id) % 7 LIMIT :addons)
+    ) s
+    WHERE u.email LIKE 'billing.bench.%'
+""")
+
+
+def run(members: int, addons: int, cycle: date) -> int:
+    engine = get_engine()
+    with engine.connect() as conn:
+        outer = conn.begin()
+        # The run's commit becomes a savepoint release; the outer rollback removes everything again
+        session = OrmSession(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            role = lookups.require_id(session, "role", "Member")
+            admin = lookups.require_id(session, "role", "Admin")
+            monthly = lookups.require_id(session, "service", "Monthly Membership")
+            admin_id = session.execute(text('SELECT min(id) FROM "user" WHERE role = :r'), {"r": admin}).scalar()
+
+            started = time.perf_counter()
+            session.execute(_MEMBERS_SQL, {"role": role, "members": members})
+            session.execute(_SUBSCRIPTIONS_SQL, {"monthly": monthly, "addons": addons, "start": cycle})
+            session.execute(text("ANALYZE subscription"))
+            print(f"setup: {members:,} members with subscriptions in {time.perf_counter() - started:.2f}s")
+
+            timings = []
+            for label in ("first run", "rerun"):
+                started = time.perf_counter()
+                result = services.run_billing_cycle(session, admin_id, cycle)
+                timings.append(time.perf_counter() - started)
+                print(f"{label:>9}: {result['members_due']:,} due, {result['bills_created']:,} bills, "
+                      f"{result['items_created']:,} items, {result['already_billed']:,} skipped "
+                      f"in {timings[-1]:.2f}s")
+        finally:
+            session.close()
+            outer.rollback()
+
+    ok = result["bills_created"] == 0 and result["items_created"] == 0
+    print(f"\nrerun created nothing: {'yes' if ok else 'NO'}; "
+          f"{members / timings[0]:,.0f} members billed per second")
+    return 0 if ok else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time a set-based billing run over many synthetic members.")
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--addons", type=int, default=1, help="recurring add-on services per member")
+    parser.add_argument("--cycle", type=lambda v: date.fromisoformat(v + "-01"), default=date(2099, 1, 1),
+                        help="billing month YYYY-MM (default far in the future so real bills never collide)")
+    args = parser.parse_args(argv)
+    return run(args.members, args.addons, args.cycle)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
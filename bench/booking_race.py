@@ -0,0 +1,151 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Concurrency check: many admins/trainers booking overlapping slots for one trainer or one room at once
+#
+# Usage (from the repo root):
+#   python -m bench.booking_race                        # 24 bookers race for one trainer, 20 rounds
+#   python -m bench.booking_race --target room          # 24 trainers race for one room
+#   python -m bench.booking_race --legacy               # the old check-then-insert flow, for comparison
+
+import argparse
+import sys
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Callable, Dict
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import services
+from services import ServiceError, lookups
+from models import Schedule, Session as TrainingSession
+from app.auth import build_database_url
+
+# Rounds book days this far out, well clear of generated schedules
+DAYS_AHEAD = 3650
+
+
+def legacy_add_availability(session, trainer_id: int, day: date, start: dtime, end: dtime, type_id: int) -> None:
+    """The old trainer flow: look for an overlap, then insert (the constraint now catches what slips through)."""
+    overlapping = session.query(Schedule).filter(Schedule.trainer_id == trainer_id, Schedule.date == day,
+                                                 Schedule.start_time < end, Schedule.end_time > start).first()
+    if overlapping:
+        session.rollback()
+        raise ServiceError("This time slot overlaps with an existing schedule!")
+    session.add(Schedule(trainer_id=trainer_id, date=day, start_time=start, end_time=end, type=type_id))
+    session.commit()
+
+
+def legacy_create_class(session, trainer_id: int, room_id: int, day: date, start: dtime, end: dtime) -> None:
+    """The old admin flow: look for a session in the room at an overlapping time, then insert."""
+    conflict = (session.query(TrainingSession).join(Schedule)
+                .filter(TrainingSession.room_id == room_id, Schedule.date == day,
+                        Schedule.start_time < end, Schedule.end_time > start).first())
+    if conflict:
+        session.rollback()
+        raise ServiceError("Room is already booked for an overlapping time slot.")
+    sched = Schedule(trainer_id=trainer_id, date=day, start_time=start, end_time=end,
+                     type=lookups.require_id(session, "schedule_type", "Group Class"))
+    session.add(sched)
+    session.flush()
+    session.add(TrainingSession(schedule_id=sched.id, size=10, name="Race Test", room_id=room_id, sex_restrict='A'))
+    session.commit()
+
+
+def run_round(factory: sessionmaker, book: Callable, bookers: int, day: date) -> Dict[str, object]:
+    """Release every booker at once; each asks for a one-hour slot starting within the same hour."""
+    barrier = threading.Barrier(bookers)
+    outcomes: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def attempt(n: int) -> None:
+        start = datetime.combine(day, dtime(10, 0)) + timedelta(minutes=n * 7 % 60)
+        session = factory()
+        try:
+            barrier.wait()
+            try:
+                book(session, n, day, start.time(), (start + timedelta(hours=1)).time())
+                outcome = "booked"
+            except ServiceError as e:
+                outcome = str(e)
+            except Exception as e:
+                session.rollback()
+                outcome = f"error: {type(e).__name__}"
+        finally:
+            session.close()
+        with lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=attempt, args=(n,)) for n in range(bookers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {"outcomes": outcomes, "seconds": elapsed}
+
+
+def _stored(engine, target: str, target_id: int, day: date) -> int:
+    sql = ("SELECT count(*) FROM schedule WHERE trainer_id = :id AND date = :day" if target == "trainer" else
+           "SELECT count(*) FROM session s JOIN schedule sc ON sc.id = s.schedule_id "
+           "WHERE s.room_id = :id AND sc.date = :day")
+    with engine.connect() as conn:
+        return conn.execute(text(sql), {"id": target_id, "day": day}).scalar()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Race concurrent bookings of overlapping slots.")
+    parser.add_argument("--target", choices=["trainer", "room"], default="trainer",
+                        help="what the bookers contend for: one trainer's time or one room")
+    parser.add_argument("--bookers", type=int, default=24)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--legacy", action="store_true", help="use the old check-then-insert flows instead")
+    args = parser.parse_args(argv)
+
+    # Every booker needs its own connection for the race to be real, so size a private pool for them
+    engine = create_engine(build_database_url(), pool_size=args.bookers + 1, max_overflow=0)
+    factory = sessionmaker(bind=engine)
+    with engine.connect() as conn:
+        trainer_ids = [r[0] for r in conn.execute(text("""
+            SELECT u.id FROM "user" u JOIN role r ON r.id = u.role
+            WHERE r.name = 'Trainer' ORDER BY u.id LIMIT :n"""), {"n": args.bookers})]
+        room_id = conn.execute(text("SELECT min(id) FROM room")).scalar()
+        pt_type = conn.execute(text("SELECT id FROM schedule_type WHERE type = 'Personal Training'")).scalar()
+    if args.target == "room" and len(trainer_ids) < args.bookers:
+        print(f"Only {len(trainer_ids)} trainers available; generate a larger dataset.")
+        return 1
+
+    target_id = trainer_ids[0] if args.target == "trainer" else room_id
+
+    def book(session, n: int, day: date, start: dtime, end: dtime) -> None:
+        if args.target == "trainer":
+            add = legacy_add_availability if args.legacy else services.add_availability
+            add(session, target_id, day, start, end, pt_type)
+        elif args.legacy:
+            legacy_create_class(session, trainer_ids[n], room_id, day, start, end)
+        else:
+            services.create_class(session, trainer_ids[n], room_id, day, start, end, "Race Test", "bench.booking_race", 10)
+
+    label = "legacy check-then-insert" if args.legacy else "exclusion constraints"
+    print(f"{label}: {args.rounds} rounds x {args.bookers} overlapping bookings for one {args.target}")
+    failures = 0
+    for n in range(1, args.rounds + 1):
+        day = date.today() + timedelta(days=DAYS_AHEAD + n)
+        result = run_round(factory, book, args.bookers, day)
+        stored = _stored(engine, args.target, target_id, day)
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM schedule WHERE date = :day"), {"day": day})
+        ok = stored == 1
+        failures += 0 if ok else 1
+        outcomes = ", ".join(f"{k}: {v}" for k, v in sorted(result["outcomes"].items()))
+        print(f"round {n:>3}: {'ok  ' if ok else 'FAIL'} stored={stored} in {result['seconds'] * 1000:.0f}ms  [{outcomes}]")
+
+    engine.dispose()
+    print(f"\n{args.rounds - failures}/{args.rounds} rounds stored exactly one booking.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
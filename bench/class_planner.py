@@ -0,0 +1,139 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Class planner benchmark: assign rooms, trainers and times to a week of requested classes and write them
+#
+# Requests get a random size, length, two time windows and sometimes preferred trainers. The plan is
+# written in one transaction against the real bookings of that week, checked, then rolled back.
+#
+# Usage (from the repo root):
+#   python -m bench.class_planner                       # 1,000 classes over next week
+#   python -m bench.class_planner --classes 2000 --start 2027-01-04 --step 30
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session as OrmSession
+
+import services
+from app.db import get_engine
+
+NAMES = ["Spin", "Yoga", "HIIT", "Pilates", "Boxing", "Zumba", "Core", "Mobility", "Barre", "Circuit"]
+
+
+def _next_monday() -> date:
+    today = date.today()
+    return today + timedelta(days=7 - today.weekday())
+
+
+def make_requests(trainer_ids, classes: int, start: date, seed: int):
+    """JSON-style class records spread over the week starting at `start`."""
+    rnd = random.Random(seed)
+    records = []
+    for n in range(classes):
+        windows = []
+        for _ in range(2):
+            day = start + timedelta(days=rnd.randrange(7))
+            opens = rnd.randrange(6, 18)
+            windows.append(f"{day} {opens:02d}:00-{opens + 4:02d}:00")
+        record = {"name": f"{rnd.choice(NAMES)} {n + 1}", "size": rnd.choice([4, 8, 10, 12, 15, 20, 25, 30]),
+                  "duration": rnd.choice([45, 60, 60, 90]), "windows": windows}
+        if rnd.random() < 0.4:
+            record["trainers"] = rnd.sample(trainer_ids, 2)
+            record["any_trainer"] = rnd.random() < 0.75
+        records.append(record)
+    return records
+
+
+def check(plan, requests, rooms) -> list:
+    """Problems with a plan: classes outside their windows, in rooms too small, or double-booked."""
+    problems = []
+    by_trainer, by_room = {}, {}
+    for placed in plan["placed"]:
+        r = requests[placed["request"] - 1]
+        start = datetime.combine(placed["date"], placed["start_time"])
+        end = datetime.combine(placed["date"], placed["end_time"])
+        if end - start != r["duration"] or not any(lo <= start and end <= hi for lo, hi in r["windows"]):
+            problems.append(f"class {placed['request']} is outside its windows")
+        if rooms[placed["room_id"]] < r["size"]:
+            problems.append(f"class {placed['request']} does not fit room {placed['room_id']}")
+        if r["trainers"] and not r["any_trainer"] and placed["trainer_id"] not in r["trainers"]:
+            problems.append(f"class {placed['request']} has a trainer it did not allow")
+        by_trainer.setdefault(placed["trainer_id"], []).append((start, end))
+        by_room.setdefault(placed["room_id"], []).append((start, end))
+    for label, groups in (("trainer", by_trainer), ("room", by_room)):
+        for key, slots in groups.items():
+            slots.sort()
+            if any(b[0] < a[1] for a, b in zip(slots, slots[1:])):
+                problems.append(f"{label} {key} is double-booked")
+    return problems
+
+
+def run(classes: int, start: date, step: int, seed: int) -> int:
+    engine = get_engine()
+    with engine.connect() as conn:
+        outer = conn.begin()
+        session = OrmSession(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            rooms = {r["id"]: r["capacity"] for r in services.list_rooms(session)}
+            trainer_ids = [t["id"] for t in services.list_trainers(session)]
+            records = make_requests(trainer_ids, classes, start, seed)
+
+            started = time.perf_counter()
+            requests = services.class_requests(session, records)
+            parse_s = time.perf_counter() - started
+            started = time.perf_counter()
+            preview = services.plan_classes(session, requests, step)
+            plan_s = time.perf_counter() - started
+            started = time.perf_counter()
+            plan = services.schedule_classes(session, requests, step_minutes=step)
+            write_s = time.perf_counter() - started
+            # SELECT count(*) FROM session WHERE id IN (<new ids>)
+            stored = session.execute(text("SELECT count(*) FROM session WHERE id = ANY(:ids)"),
+                                     {"ids": [p["id"] for p in plan["placed"]]}).scalar()
+        finally:
+            session.close()
+            outer.rollback()
+
+    problems = check(plan, requests, rooms)
+    preferred = [p for p in plan["placed"] if requests[p["request"] - 1]["trainers"]]
+    honoured = sum(1 for p in preferred if p["trainer_id"] in requests[p["request"] - 1]["trainers"])
+    reasons = {}
+    for unplaced in plan["unplaced"]:
+        reasons[unplaced["reason"]] = reasons.get(unplaced["reason"], 0) + 1
+    print(f"{classes:,} requested classes in the week of {start}, {len(rooms)} rooms, {len(trainer_ids)} trainers, "
+          f"{step}-minute start grid")
+    print(f"  validate {parse_s * 1000:8.1f} ms")
+    print(f"  plan     {plan_s * 1000:8.1f} ms   (preview, nothing written)")
+    print(f"  write    {write_s * 1000:8.1f} ms   (plan again + insert, one transaction)")
+    print(f"placed {len(plan['placed']):,}, stored {stored:,}, not placed {len(plan['unplaced']):,}"
+          f"; preferred trainer given to {honoured:,} of {len(preferred):,} classes that named one")
+    for reason, count in sorted(reasons.items()):
+        print(f"  {count:>5}  {reason}")
+    # Nothing else books meanwhile, so planning again inside the write must give the same answer
+    same = preview["placed"] == [{k: v for k, v in p.items() if k != "id"} for p in plan["placed"]]
+    print(f"preview matches the written plan: {'yes' if same else 'NO'}")
+    for problem in problems[:10]:
+        print(f"  PROBLEM: {problem}")
+    ok = not problems and same and stored == len(plan["placed"])
+    print(f"plan valid: {'yes' if ok else 'NO'}")
+    return 0 if ok else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time the class planner on a week of requested classes.")
+    parser.add_argument("--classes", type=int, default=1000)
+    parser.add_argument("--start", type=lambda v: datetime.strptime(v, "%Y-%m-%d").date(), default=_next_monday(),
+                        help="first day of the week (default: next Monday)")
+    parser.add_argument("--step", type=int, default=services.planner.STEP_MINUTES,
+                        help="minutes between candidate start times")
+    parser.add_argument("--seed", type=int, default=3005)
+    args = parser.parse_args(argv)
+    return run(args.classes, args.start, args.step, args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Concurrency check: many members booking the last seats of one session at the same moment
+#
+# Usage (from the repo root):
+#   python -m bench.enroll_race                         # 64 bookers, 1 seat, 20 rounds
+#   python -m bench.enroll_race --bookers 200 --seats 5
+#   python -m bench.enroll_race --legacy                # show the old count-then-insert race for comparison
+
+import argparse
+import sys
+import threading
+import time
+from datetime import date, time as dtime, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+
+import services
+from services import ServiceError, lookups
+from models import Enrollment, Schedule, Session as TrainingSession, User
+from app.auth import build_database_url
+
+
+def legacy_enroll(session, member_id: int, session_id: int) -> None:
+    """The pre-service check-then-insert flow (count, compare, insert) kept only to demonstrate the race."""
+    selected = session.get(TrainingSession, session_id)
+    current = session.query(func.count(Enrollment.id)).filter(Enrollment.session_id == session_id).scalar()
+    if current >= selected.size:
+        session.rollback()
+        raise ServiceError("This session is full.")
+    session.add(Enrollment(session_id=session_id, member_id=member_id, attended=False))
+    session.commit()
+
+
+def _make_session(factory: sessionmaker, seats: int) -> int:
+    """Create a throwaway far-future class with the given number of seats."""
+    session = factory()
+    try:
+        # SELECT id FROM user WHERE role = <Trainer> ORDER BY id LIMIT 1
+        trainer_id = (session.query(User.id).filter_by(role=lookups.require_id(session, "role", "Trainer"))
+                      .order_by(User.id).limit(1).scalar())
+        sched = Schedule(trainer_id=trainer_id, date=date.today() + timedelta(days=3650),
+                         start_time=dtime(5, 0), end_time=dtime(6, 0),
+                         type=lookups.require_id(session, "schedule_type", "Group Class"))
+        session.add(sched)
+        session.flush()
+        sess = TrainingSession(schedule_id=sched.id, size=seats, name="Race Test", desc="bench.enroll_race",
+                               sex_restrict='A')
+        session.add(sess)
+        session.commit()
+        return sess.id
+    finally:
+        session.close()
+
+
+def _drop_session(factory: sessionmaker, session_id: int) -> None:
+    with factory.kw["bind"].begin() as conn:
+        conn.execute(text("DELETE FROM schedule WHERE id = (SELECT schedule_id FROM session WHERE id = :id)"),
+                     {"id": session_id})
+
+
+def run_round(factory: sessionmaker, enroll: Callable, member_ids: List[int], seats: int) -> Dict[str, object]:
+    """Release every booker at once against a fresh session and report what was stored."""
+    session_id = _make_session(factory, seats)
+    barrier = threading.Barrier(len(member_ids))
+    outcomes: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def book(member_id: int) -> None:
+        session = factory()
+        try:
+            barrier.wait()
+            try:
+                enroll(session, member_id, session_id)
+                outcome = "enrolled"
+            except ServiceError as e:
+                outcome = str(e)
+            except Exception as e:
+                session.rollback()
+                outcome = f"error: {type(e).__name__}"
+        finally:
+            session.close()
+        with lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=book, args=(mid,)) for mid in member_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with factory.kw["bind"].connect() as conn:
+        rows, counter = conn.execute(text("""
+            SELECT (SELECT count(*) FROM enrollment WHERE session_id = :id), enrolled_count
+            FROM session WHERE id = :id
+        """), {"id": session_id}).one()
+    _drop_session(factory, session_id)
+    return {"outcomes": outcomes, "rows": rows, "enrolled_count": counter, "seconds": elapsed}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Race many concurrent bookers for the last seats of a session.")
+    parser.add_argument("--bookers", type=int, default=64, help="concurrent members per round")
+    parser.add_argument("--seats", type=int, default=1, help="capacity of the contested session")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--same-member", action="store_true",
+                        help="every booker is the same member (tests duplicate-enrollment races)")
+    parser.add_argument("--legacy", action="store_true", help="use the old check-then-insert flow instead")
+    args = parser.parse_args(argv)
+
+    # Every booker needs its own connection for the race to be real, so size a private pool for them
+    engine = create_engine(build_database_url(), pool_size=args.bookers + 1, max_overflow=0)
+    factory = sessionmaker(bind=engine)
+
+    with engine.connect() as conn:
+        member_ids = [r[0] for r in conn.execute(text("""
+            SELECT u.id FROM "user" u JOIN role r ON r.id = u.role
+            WHERE r.name = 'Member' ORDER BY u.id LIMIT :n"""), {"n": args.bookers})]
+    if args.same_member:
+        member_ids = member_ids[:1] * args.bookers
+    if len(member_ids) < args.bookers:
+        print(f"Only {len(member_ids)} members available; generate a larger dataset.")
+        return 1
+
+    enroll = legacy_enroll if args.legacy else services.enroll
+    label = "legacy check-then-insert" if args.legacy else "services.enroll"
+    print(f"{label}: {args.rounds} rounds x {args.bookers} bookers for {args.seats} seat(s)"
+          f"{' (same member)' if args.same_member else ''}")
+    expected = 1 if args.same_member else min(args.seats, args.bookers)
+    failures = 0
+    for n in range(1, args.rounds + 1):
+        result = run_round(factory, enroll, member_ids, args.seats)
+        # The legacy flow never maintained enrolled_count, so only the row count is checked for it
+        ok = result["rows"] == expected and (args.legacy or result["enrolled_count"] == expected)
+        failures += 0 if ok else 1
+        outcomes = ", ".join(f"{k}: {v}" for k, v in sorted(result["outcomes"].items()))
+        print(f"round {n:>3}: {'ok  ' if ok else 'FAIL'} rows={result['rows']} enrolled_count={result['enrolled_count']} "
+              f"in {result['seconds'] * 1000:.0f}ms  [{outcomes}]")
+
+    engine.dispose()
+    print(f"\n{args.rounds - failures}/{args.rounds} rounds kept exactly {expected} enrollment(s).")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Free-slot search benchmark: busy bitmaps vs overlap queries, plus what the bitmap triggers cost writes
+#
+# Each search asks for the next N free slots of one length for a random trainer and room. It is
+# answered three ways, which must agree:
+#   bitmap  - services.next_free_slots: one keyed read of the day bitmaps, then bitwise operations
+#   probe   - trial and error: one GiST overlap query for the trainer and one for the room per candidate start
+#   ranges  - one range scan of the trainer's and the room's bookings, then an in-memory interval check
+#
+# Usage (from the repo root):
+#   python -m bench.free_slots                        # 200 searches for 5 one-hour slots
+#   python -m bench.free_slots --length 90 --count 10 --searches 500
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+
+import services
+from services import bookings
+from services.availability import CLOSE_TIME, OPEN_TIME, SEARCH_DAYS
+from models.models import BITMAP_SLOT_MINUTES
+from app.db import get_engine
+
+STEP = timedelta(minutes=BITMAP_SLOT_MINUTES)
+# SELECT EXISTS (...) for the trainer's schedule and the room's sessions, as the exclusion constraints probe
+_PROBE_SQL = text("""
+    SELECT EXISTS (SELECT 1 FROM schedule WHERE int4range(trainer_id, trainer_id, '[]') && int4range(:t, :t, '[]')
+                                            AND slot && tsrange(:start, :end)),
+           EXISTS (SELECT 1 FROM session WHERE room_id IS NOT NULL
+                                           AND int4range(room_id, room_id, '[]') && int4range(:r, :r, '[]')
+                                           AND slot && tsrange(:start, :end))
+""")
+
+
+def _candidates(after: datetime, length: timedelta):
+    """Start times on the slot grid inside club hours, from `after` for SEARCH_DAYS days."""
+    midnight = datetime.combine(after.date(), dtime())
+    start = midnight + STEP * -(-(after - midnight) // STEP)
+    last = datetime.combine(after.date() + timedelta(days=SEARCH_DAYS), dtime())
+    while start < last:
+        if start.time() >= OPEN_TIME and start + length <= datetime.combine(start.date(), CLOSE_TIME):
+            yield start
+        start += STEP
+
+
+def search_probe(session, trainer_id, room_id, length, count, after):
+    slots, blocked_until = [], None
+    for start in _candidates(after, length):
+        if blocked_until and start < blocked_until:
+            continue
+        trainer_busy, room_busy = session.execute(_PROBE_SQL, {"t": trainer_id, "r": room_id, "start": start,
+                                                               "end": start + length}).one()
+        if not (trainer_busy or room_busy):
+            slots.append({"date": start.date(), "start_time": start.time(), "end_time": (start + length).time()})
+            blocked_until = start + length
+            if len(slots) == count:
+                break
+    return slots
+
+
+def search_ranges(session, trainer_id, room_id, length, count, after):
+    lo, hi = after, datetime.combine(after.date() + timedelta(days=SEARCH_DAYS), dtime())
+    checks = [bookings._bookings(session, bookings._TRAINER_BOOKINGS_SQL, trainer_id, lo, hi),
+              bookings._bookings(session, bookings._ROOM_BOOKINGS_SQL, room_id, lo, hi)]
+    slots, blocked_until = [], None
+    for start in _candidates(after, length):
+        if blocked_until and start < blocked_until:
+            continue
+        if not any(c.overlaps(start, start + length) for c in checks):
+            slots.append({"date": start.date(), "start_time": start.time(), "end_time": (start + length).time()})
+            blocked_until = start + length
+            if len(slots) == count:
+                break
+    return slots
+
+
+def search_bitmap(session, trainer_id, room_id, length, count, after):
+    return services.next_free_slots(session, length // timedelta(minutes=1), count, trainer_id=trainer_id,
+                                    room_id=room_id, after=after)
+
+
+def time_searches(engine, pairs, length, count, after):
+    results, answers = {}, {}
+    with engine.connect() as conn:
+        session = OrmSession(bind=conn)
+        statements = [0]
+        event.listen(conn, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+        for name, fn in (("bitmap", search_bitmap), ("probe", search_probe), ("ranges", search_ranges)):
+            timings, statements[0] = [], 0
+            answers[name] = []
+            for trainer_id, room_id in pairs:
+                started = time.perf_counter()
+                answers[name].append(fn(session, trainer_id, room_id, length, count, after))
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results[name] = {"p50": statistics.median(timings), "p95": timings[int(len(timings) * 0.95) - 1],
+                             "statements": statements[0] / len(pairs)}
+        session.close()
+    return results, answers
+
+
+def time_writes(engine, trainer_ids, bookings_count: int):
+    """Seconds to add `bookings_count` availability slots one by one, with and without the bitmap triggers."""
+    seconds = {}
+    for label, toggle in (("with triggers", None), ("without", "DISABLE")):
+        with engine.connect() as conn:
+            outer = conn.begin()
+            session = OrmSession(bind=conn, join_transaction_mode="create_savepoint")
+            try:
+                if toggle:
+                    for trigger in ("tg_schedule_busy_insert", "tg_schedule_busy_update", "tg_schedule_busy_delete"):
+                        session.execute(text(f"ALTER TABLE schedule {toggle} TRIGGER {trigger}"))
+                pt_type = services.lookups.require_id(session, "schedule_type", "Personal Training")
+                day = date.today() + timedelta(days=3650)
+                started = time.perf_counter()
+                for n in range(bookings_count):
+                    start = datetime.combine(day + timedelta(days=n // 64), OPEN_TIME) + STEP * (n % 64)
+                    services.add_availability(session, trainer_ids[n % len(trainer_ids)], start.date(), start.time(),
+                                              (start + STEP).time(), pt_type)
+                seconds[label] = time.perf_counter() - started
+            finally:
+                session.close()
+                outer.rollback()
+    return seconds
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare free-slot search on busy bitmaps with overlap queries.")
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--length", type=int, default=60, help="slot length in minutes")
+    parser.add_argument("--count", type=int, default=5, help="free slots asked for per search")
+    parser.add_argument("--writes", type=int, default=1000, help="bookings timed for the trigger overhead")
+    parser.add_argument("--seed", type=int, default=3005)
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        session = OrmSession(bind=conn)
+        trainer_ids = [t["id"] for t in services.list_trainers(session)]
+        room_ids = [r["id"] for r in services.list_rooms(session)]
+        session.close()
+    rnd = random.Random(args.seed)
+    pairs = [(rnd.choice(trainer_ids), rnd.choice(room_ids)) for _ in range(args.searches)]
+    # Start of tomorrow's club hours: a full day of bookings to search around
+    after = datetime.combine(date.today() + timedelta(days=1), OPEN_TIME)
+    length = timedelta(minutes=-(-args.length // BITMAP_SLOT_MINUTES) * BITMAP_SLOT_MINUTES)
+
+    results, answers = time_searches(engine, pairs, length, args.count, after)
+    print(f"{args.searches} searches for the next {args.count} free {args.length}-minute slots "
+          f"(trainer + room, from {after:%Y-%m-%d %H:%M})")
+    print(f"{'method':8} {'p50 ms':>9} {'p95 ms':>9} {'stmts/search':>13}")
+    for name, r in results.items():
+        print(f"{name:8} {r['p50']:9.3f} {r['p95']:9.3f} {r['statements']:13.1f}")
+    agree = answers["bitmap"] == answers["probe"] == answers["ranges"]
+    print(f"all three agree: {'yes' if agree else 'NO'}")
+
+    writes = time_writes(engine, trainer_ids, args.writes)
+    per = {label: s / args.writes * 1000 for label, s in writes.items()}
+    print(f"\nadd_availability x {args.writes}: {per['with triggers']:.3f} ms each with the bitmap triggers, "
+          f"{per['without']:.3f} ms without")
+    return 0 if agree else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Index benchmark: query plans and latency with and without the model indexes
+#
+# Usage (from the repo root, against a loaded database):
+#   python -m bench.indexes [--runs 5] [--json results.json]
+
+import argparse
+import json
+import statistics
+import sys
+from datetime import date
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from models import Base
+from app.db import get_engine
+
+# Hot queries issued by member.py, trainer.py and admin.py (SQL equivalents of the ORM calls)
+QUERIES: Dict[str, str] = {
+    "member.dashboard_recent_metrics": """
+        SELECT * FROM metric WHERE user_id = :member_id
+        ORDER BY logged_date DESC LIMIT 5""",
+    "member.dashboard_goals": """
+        SELECT * FROM goal WHERE user_id = :member_id ORDER BY id""",
+    "member.dashboard_past_attended": """
+        SELECT count(*) FROM enrollment
+        JOIN session ON enrollment.session_id = session.id
+        JOIN schedule ON session.schedule_id = schedule.id
+        WHERE enrollment.member_id = :member_id AND schedule.date < :today AND enrollment.attended""",
+    "member.upcoming_enrollments": """
+        SELECT enrollment.*, session.*, schedule.* FROM enrollment
+        JOIN session ON enrollment.session_id = session.id
+        JOIN schedule ON session.schedule_id = schedule.id
+        WHERE enrollment.member_id = :member_id AND schedule.date >= :today
+        ORDER BY schedule.date, schedule.start_time""",
+    "member.metric_history": """
+        SELECT * FROM metric WHERE user_id = :member_id AND metric_type = :metric_type
+        ORDER BY logged_date""",
+    "member.goal_latest_actual": """
+        SELECT * FROM metric WHERE user_id = :member_id AND metric_type = :metric_type
+        ORDER BY logged_date DESC LIMIT 1""",
+    "member.browse_sessions": """
+        SELECT session.*, schedule.date, schedule.start_time, schedule.end_time, "user".first_name, room.name
+        FROM session JOIN schedule ON schedule.id = session.schedule_id
+        JOIN "user" ON "user".id = schedule.trainer_id LEFT JOIN room ON room.id = session.room_id
+        WHERE schedule.date >= :today AND session.enrolled_count < session.size
+          AND (schedule.date, schedule.start_time, session.id) > (:today + 30, '12:00', 0)
+        ORDER BY schedule.date, schedule.start_time, session.id LIMIT 21""",
+    "trainer.schedule": """
+        SELECT * FROM schedule LEFT JOIN session ON session.schedule_id = schedule.id
+        WHERE schedule.trainer_id = :trainer_id AND schedule.date >= :today
+        ORDER BY schedule.date, schedule.start_time""",
+    "trainer.overlap_check": """
+        SELECT * FROM schedule WHERE int4range(trainer_id, trainer_id, '[]') && int4range(:trainer_id, :trainer_id, '[]')
+        AND slot && tsrange(:today + time '11:00', :today + time '12:00') LIMIT 1""",
+    "trainer.member_lookup": """
+        SELECT DISTINCT "user".* FROM "user"
+        JOIN enrollment ON "user".id = enrollment.member_id
+        JOIN session ON enrollment.session_id = session.id
+        JOIN schedule ON session.schedule_id = schedule.id
+        WHERE schedule.trainer_id = :trainer_id""",
+    "trainer.member_last_metric": """
+        SELECT DISTINCT ON (user_id) * FROM metric WHERE user_id = ANY(:member_ids)
+        ORDER BY user_id, logged_date DESC""",
+    "admin.class_list": """
+        SELECT session.*, schedule.* FROM session JOIN schedule ON schedule.id = session.schedule_id
+        WHERE schedule.date >= :today ORDER BY schedule.date, schedule.start_time LIMIT 50""",
+    "admin.room_conflict": """
+        SELECT session.* FROM session JOIN schedule ON schedule.id = session.schedule_id
+        WHERE session.room_id = :room_id AND schedule.date = :today
+        AND schedule.start_time < '12:00' AND schedule.end_time > '11:00' LIMIT 1""",
+    "admin.unpaid_bills_for_member": """
+        SELECT * FROM bill WHERE paid = false AND member_id = :member_id""",
+    "admin.bill_items": """
+        SELECT item.* FROM item WHERE item.bill_id = ANY(:bill_ids)""",
+    "admin.users_by_role": """
+        SELECT * FROM "user" WHERE role = :role_id""",
+}
+
+
+def _sample_params(conn) -> Dict[str, object]:
+    """Pick representative IDs from the loaded data (busiest member/trainer/room)."""
+    one = lambda sql: conn.execute(text(sql)).scalar()
+    member_id = one("SELECT user_id FROM metric GROUP BY user_id ORDER BY count(*) DESC LIMIT 1")
+    trainer_id = one("SELECT trainer_id FROM schedule GROUP BY trainer_id ORDER BY count(*) DESC LIMIT 1")
+    room_id = one("SELECT room_id FROM session WHERE room_id IS NOT NULL GROUP BY room_id ORDER BY count(*) DESC LIMIT 1")
+    metric_type = one(f"SELECT metric_type FROM metric WHERE user_id = {int(member_id or 0)} LIMIT 1")
+    role_id = one("SELECT id FROM role WHERE name = 'Trainer'")
+    member_ids = [r[0] for r in conn.execute(text("SELECT id FROM \"user\" ORDER BY id DESC LIMIT 50"))]
+    bill_ids = [r[0] for r in conn.execute(text("SELECT id FROM bill ORDER BY id DESC LIMIT 50"))]
+    return {
+        "member_id": member_id or 0,
+        "trainer_id": trainer_id or 0,
+        "room_id": room_id or 0,
+        "metric_type": metric_type or 0,
+        "role_id": role_id or 0,
+        "member_ids": member_ids,
+        "bill_ids": bill_ids,
+        "today": date.today(),
+    }
+
+
+def _plan_nodes(plan: dict) -> List[str]:
+    """Flatten a JSON plan into 'Node Type (relation/index)' labels for scans."""
+    labels = []
+    node_type = plan.get("Node Type", "")
+    if "Scan" in node_type:
+        target = plan.get("Index Name") or plan.get("Relation Name") or ""
+        labels.append(f"{node_type}({target})")
+    for child in plan.get("Plans", []):
+        labels.extend(_plan_nodes(child))
+    return labels
+
+
+def _explain(conn, sql: str, params: Dict[str, object], runs: int) -> Dict[str, object]:
+    timings = []
+    nodes: List[str] = []
+    for _ in range(runs):
+        result = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()
+        doc = result[0] if isinstance(result, list) else json.loads(result)[0]
+        timings.append(doc["Execution Time"])
+        nodes = _plan_nodes(doc["Plan"])
+    return {"ms": round(statistics.median(timings), 3), "plan": nodes}
+
+
+def _measure(conn, params: Dict[str, object], runs: int) -> Dict[str, Dict[str, object]]:
+    return {name: _explain(conn, sql, params, runs) for name, sql in QUERIES.items()}
+
+
+def declared_indexes() -> List[str]:
+    """Names of the indexes declared on the ORM models (excludes PK/unique constraints)."""
+    return sorted(idx.name for table in Base.metadata.sorted_tables for idx in table.indexes)
+
+
+def run(runs: int = 5) -> Dict[str, Dict[str, object]]:
+    engine = get_engine()
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+        conn.commit()
+        params = _sample_params(conn)
+        with_indexes = _measure(conn, params, runs)
+        conn.rollback()
+
+        # DDL is transactional in PostgreSQL: drop the indexes, measure, then roll back
+        try:
+            for name in declared_indexes():
+                conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            without_indexes = _measure(conn, params, runs)
+        finally:
+            conn.rollback()
+
+    results = {}
+    for name in QUERIES:
+        before, after = without_indexes[name], with_indexes[name]
+        results[name] = {
+            "without_ms": before["ms"],
+            "with_ms": after["ms"],
+            "speedup": round(before["ms"] / after["ms"], 1) if after["ms"] else None,
+            "plan_without": before["plan"],
+            "plan_with": after["plan"],
+        }
+    return results
+
+
+def print_report(results: Dict[str, Dict[str, object]]) -> None:
+    print(f"{'query':36} {'no index ms':>12} {'indexed ms':>11} {'speedup':>8}")
+    for name, row in results.items():
+        print(f"{name:36} {row['without_ms']:>12.3f} {row['with_ms']:>11.3f} {str(row['speedup']) + 'x':>8}")
+        if row["plan_without"] != row["plan_with"]:
+            print(f"    plan: {', '.join(row['plan_without'])}")
+            print(f"       -> {', '.join(row['plan_with'])}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare hot query plans with and without the model indexes.")
+    parser.add_argument("--runs", type=int, default=5, help="EXPLAIN ANALYZE runs per query (median reported)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args.runs)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
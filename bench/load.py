@@ -0,0 +1,231 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# HTTP load test for the async API server (throughput + tail latency)
+#
+# Usage (from the repo root):
+#   python -m bench.load                                   # spawn a server, 200 clients for 20s, read-only mix
+#   python -m bench.load --concurrency 500 --duration 60
+#   python -m bench.load --mix mixed                       # also logs metrics and enrolls (writes persist!)
+#   python -m bench.load --url http://127.0.0.1:8080       # target an already running server
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from sqlalchemy import text
+
+from app.db import get_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (role, method, path, weight); paths may refer to {session_id}
+SCENARIOS: Dict[str, Dict[str, tuple]] = {
+    "read": {
+        "me": ("member", "GET", "/api/me", 10),
+        "member.dashboard": ("member", "GET", "/api/member/dashboard", 30),
+        "member.goals": ("member", "GET", "/api/member/goals", 15),
+        "member.enrollments": ("member", "GET", "/api/member/enrollments", 20),
+        "metric_types": ("member", "GET", "/api/metric-types", 10),
+        "trainer.schedule": ("trainer", "GET", "/api/trainer/schedule", 10),
+        "admin.equipment": ("admin", "GET", "/api/admin/equipment", 5),
+    },
+}
+SCENARIOS["mixed"] = dict(SCENARIOS["read"], **{
+    "member.log_metric": ("member", "POST", "/api/member/metrics", 10),
+    "member.enroll": ("member", "POST", "/api/sessions/{session_id}/enroll", 5),
+})
+
+
+def pick_accounts(users: int) -> Dict[str, List[tuple]]:
+    """Credentials for the busiest members/trainers plus an admin, and enrollable session IDs."""
+    engine = get_engine()
+    with engine.connect() as conn:
+        rows = lambda sql, **params: [tuple(r) for r in conn.execute(text(sql), params)]
+        return {
+            "member": rows("""SELECT u.email, u.password FROM "user" u JOIN role r ON r.id = u.role
+                              WHERE r.name = 'Member' ORDER BY u.id LIMIT :n""", n=users),
+            "trainer": rows("""SELECT u.email, u.password FROM "user" u JOIN role r ON r.id = u.role
+                               WHERE r.name = 'Trainer' ORDER BY u.id LIMIT :n""", n=max(1, users // 10)),
+            "admin": rows("""SELECT u.email, u.password FROM "user" u JOIN role r ON r.id = u.role
+                             WHERE r.name = 'Admin' ORDER BY u.id LIMIT 1"""),
+            "session_id": [r[0] for r in rows("""SELECT s.id FROM session s JOIN schedule sc ON sc.id = s.schedule_id
+                                                 WHERE sc.date >= CURRENT_DATE ORDER BY sc.date LIMIT 500""")],
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """Start `app/main.py --serve` in a child process and wait until it accepts connections."""
+    # stderr goes to a file: a pipe nobody reads fills up with request tracebacks and stalls the server
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "app", "main.py"), "--serve", "--port", str(port)],
+                            stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"server exited: {log.read().decode(errors='replace')[-2000:]}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not start within 30s")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def _worker(http: aiohttp.ClientSession, base_url: str, scenario: Dict[str, tuple],
+                  accounts: Dict[str, List[tuple]], deadline: float, rng: random.Random,
+                  samples: Dict[str, List[float]], errors: Dict[str, int], rejected: Dict[str, int]) -> None:
+    names = list(scenario)
+    weights = [scenario[name][3] for name in names]
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        role, method, path, _ = scenario[name]
+        email, password = rng.choice(accounts[role])
+        body = None
+        if name == "member.log_metric":
+            body = {"metric_type": rng.randint(1, 4), "value": round(rng.uniform(50, 200), 2)}
+        if "{session_id}" in path:
+            path = path.format(session_id=rng.choice(accounts["session_id"]))
+
+        started = time.perf_counter()
+        try:
+            async with http.request(method, base_url + path, json=body,
+                                    auth=aiohttp.BasicAuth(email, password)) as resp:
+                await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = None
+        elapsed = (time.perf_counter() - started) * 1000.0
+
+        if status is None or status >= 500:
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        # 4xx here are business-rule rejections (already enrolled, session full), not failures
+        if status >= 400:
+            rejected[name] = rejected.get(name, 0) + 1
+        samples.setdefault(name, []).append(elapsed)
+
+
+async def run_load(base_url: str, scenario: Dict[str, tuple], accounts: Dict[str, List[tuple]],
+                   concurrency: int, duration: float, seed: int) -> Dict[str, object]:
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    rejected: Dict[str, int] = {}
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency), timeout=timeout) as http:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            _worker(http, base_url, scenario, accounts, deadline, random.Random(seed + i), samples, errors, rejected)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+        admin_email, admin_password = accounts["admin"][0]
+        async with http.get(base_url + "/api/admin/stats", auth=aiohttp.BasicAuth(admin_email, admin_password)) as resp:
+            pool = (await resp.json()).get("pool") if resp.status == 200 else None
+
+    every = [ms for values in samples.values() for ms in values]
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        endpoints[name] = {
+            "requests": len(values),
+            "p50_ms": round(_percentile(values, 50), 2),
+            "p95_ms": round(_percentile(values, 95), 2),
+            "p99_ms": round(_percentile(values, 99), 2),
+            "max_ms": round(max(values), 2),
+            "rejected": rejected.get(name, 0),
+            "errors": errors.get(name, 0),
+        }
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(every),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(every) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(every, 50), 2) if every else None,
+        "p95_ms": round(_percentile(every, 95), 2) if every else None,
+        "p99_ms": round(_percentile(every, 99), 2) if every else None,
+        "max_ms": round(max(every), 2) if every else None,
+        "endpoints": endpoints,
+        "pool": pool,
+    }
+
+
+def print_report(result: Dict[str, object]) -> None:
+    print(f"\n{result['requests']:,} requests in {result['duration_s']}s with {result['concurrency']} clients "
+          f"-> {result['throughput_rps']:,.1f} req/s, {result['errors']} errors")
+    print(f"latency p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  max {result['max_ms']}ms")
+    print(f"\n{'endpoint':22} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'4xx':>6} {'errors':>7}")
+    for name, row in result["endpoints"].items():
+        print(f"{name:22} {row['requests']:>9} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{row['max_ms']:>9.2f} {row['rejected']:>6} {row['errors']:>7}")
+    pool = result.get("pool")
+    if pool:
+        print(f"\npool: size {pool['size']}, {pool['connects']} connects, {pool['checkouts']:,} checkouts, "
+              f"wait avg {pool['wait_avg_ms']}ms / max {pool['wait_max_ms']}ms, {pool['timeouts']} timeouts")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the async HTTP/JSON API.")
+    parser.add_argument("--url", help="base URL of a running server; default spawns one on a free port")
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--users", type=int, default=100, help="distinct member accounts to log in as")
+    parser.add_argument("--mix", choices=sorted(SCENARIOS), default="read",
+                        help="'read' is side-effect free; 'mixed' also logs metrics and enrolls")
+    parser.add_argument("--seed", type=int, default=3005)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    accounts = pick_accounts(args.users)
+    if not accounts["member"] or not accounts["admin"]:
+        print("No member/admin accounts found; seed or generate the database first.")
+        return 1
+
+    server: Optional[subprocess.Popen] = None
+    base_url = args.url
+    if not base_url:
+        port = _free_port()
+        server = spawn_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+    try:
+        result = asyncio.run(run_load(base_url.rstrip("/"), SCENARIOS[args.mix], accounts,
+                                      args.concurrency, args.duration, args.seed))
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
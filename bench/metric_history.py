@@ -0,0 +1,142 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Metric history benchmark: per-type .all() queries vs one streamed query, for a member with a huge history
+#
+# Usage (from the repo root):
+#   python -m bench.metric_history                     # synthetic member with 1M readings, rolled back afterwards
+#   python -m bench.metric_history --readings 200000 --batch 5000
+
+import argparse
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+
+import services
+from models import Metric
+from services import lookups
+from app.db import get_engine
+
+# Synthetic member and readings, created inside the benchmark's transaction
+_MEMBER_SQL = text("""
+    INSERT INTO "user" (email, password, first_name, last_name, sex, role)
+    VALUES ('history.bench@club.test', 'x', 'History', 'Bench', 'O', :role)
+    RETURNING id
+""")
+_READINGS_SQL = text("""
+    INSERT INTO metric (user_id, metric_type, value, logged_date)
+    SELECT :member_id, (:types)[1 + n % cardinality(:types)], 50 + (n::bigint * 7919 % 15000) / 100.0,
+           :start + (n * :step) * interval '1 second'
+    FROM generate_series(0, :readings - 1) AS n
+""")
+
+
+class _Sink:
+    """Discards output like a terminal that is never read, but still pays for the formatting."""
+
+    def write(self, line: str) -> None:
+        pass
+
+
+def legacy_history(session, member_id: int, out: _Sink) -> int:
+    """The history screen before streaming: one query per metric type, each fully materialised."""
+    rows = 0
+    for mt in lookups.all_rows(session, "metric_type"):
+        metrics = session.query(Metric).filter_by(user_id=member_id, metric_type=mt["id"]) \
+            .order_by(Metric.logged_date).all()
+        if not metrics:
+            continue
+        out.write(f"\n{mt['name']}:\n")
+        for m in metrics:
+            out.write(f"- {m.logged_date.strftime('%Y-%m-%d')}: {m.value}\n")
+        rows += len(metrics)
+        if len(metrics) >= 2:
+            out.write(f"Trend: {float(metrics[-1].value - metrics[0].value):+.2f}\n")
+    return rows
+
+
+def streamed_history(session, member_id: int, out: _Sink, batch: int) -> int:
+    """The current screen: one ordered query read in batches, statistics gathered in the same pass."""
+    rows = 0
+    for entry in services.stream_metric_history(session, member_id, batch_size=batch):
+        out.write(f"\n{entry['metric']}:\n")
+        for reading in entry["readings"]:
+            out.write(f"- {reading['logged_date'].strftime('%Y-%m-%d')}: {reading['value']}\n")
+        rows += entry["count"]
+        if entry["change"] is not None:
+            out.write(f"Trend: {float(entry['change']):+.2f}, average {entry['average']:.2f}\n")
+    return rows
+
+
+def measure(conn, session, fn: Callable[[], int]) -> Dict[str, float]:
+    """Wall time and statement count of one run, then peak Python memory of a second traced run."""
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(conn, "before_cursor_execute", count)
+    started = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - started
+    event.remove(conn, "before_cursor_execute", count)
+    session.expunge_all()
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    session.expunge_all()
+    return {"seconds": elapsed, "statements": statements[0], "rows": rows, "peak_mb": peak / 2 ** 20}
+
+
+def run(readings: int, batch: int) -> int:
+    engine = get_engine()
+    with engine.connect() as conn:
+        outer = conn.begin()
+        session = OrmSession(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            types = [mt["id"] for mt in lookups.all_rows(session, "metric_type") if mt["name"] != "Height"]
+            member_id = session.execute(_MEMBER_SQL, {"role": lookups.require_id(session, "role", "Member")}).scalar()
+            # Spread over the last three years so the readings land in the monthly partitions
+            span = timedelta(days=3 * 365)
+            started = time.perf_counter()
+            session.execute(_READINGS_SQL, {"member_id": member_id, "types": types, "readings": readings,
+                                            "start": datetime.now() - span,
+                                            "step": span.total_seconds() / readings})
+            print(f"setup: {readings:,} readings for one member in {time.perf_counter() - started:.2f}s")
+
+            results = {
+                "per-type .all()": measure(conn, session, lambda: legacy_history(session, member_id, _Sink())),
+                f"streamed ({batch:,}/batch)": measure(conn, session,
+                                                       lambda: streamed_history(session, member_id, _Sink(), batch)),
+            }
+        finally:
+            session.close()
+            outer.rollback()
+
+    print(f"\n{'history':24} {'seconds':>8} {'stmts':>6} {'rows':>10} {'peak MB':>9}")
+    for name, r in results.items():
+        print(f"{name:24} {r['seconds']:>8.2f} {r['statements']:>6} {r['rows']:>10,} {r['peak_mb']:>9.1f}")
+    legacy, streamed = results.values()
+    ok = legacy["rows"] == streamed["rows"]
+    print(f"\nsame readings: {'yes' if ok else 'NO'}; "
+          f"peak memory {legacy['peak_mb'] / max(streamed['peak_mb'], 0.1):.0f}x lower when streamed")
+    return 0 if ok else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time the metric history screen for a member with many readings.")
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=services.members.HISTORY_BATCH_SIZE,
+                        help="rows per server-side cursor fetch")
+    args = parser.parse_args(argv)
+    return run(args.readings, args.batch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Bulk metric import benchmark: COPY + staging table vs one ORM add per reading, with peak memory
+#
+# Writes a synthetic device export, imports it for a synthetic member, re-imports it (every line a
+# duplicate) and times a slice of it through log_metric for comparison. Everything is rolled back.
+#
+# Usage (from the repo root):
+#   python -m bench.metric_import                         # 10M-line CSV
+#   python -m bench.metric_import --rows 1000000 --format ndjson
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session as OrmSession
+
+import services
+from services import lookups
+from app.db import get_engine
+
+_MEMBER_SQL = text("""
+    INSERT INTO "user" (email, password, first_name, last_name, sex, role)
+    VALUES ('import.bench@club.test', 'x', 'Import', 'Bench', 'O', :role)
+    RETURNING id
+""")
+# Type names as a device would write them, our name for each, and a plausible value range
+_TYPES = [("weight", "Weight", 60, 120), ("body_fat", "Body Fat %", 8, 35), ("heart_rate", "Heart Rate", 45, 95),
+          ("bmi", "BMI", 18, 35)]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_export(path: str, rows: int, fmt: str) -> None:
+    """One reading per line over the last three years, about 1% of lines repeated."""
+    span = timedelta(days=3 * 365)
+    start = datetime.now() - span
+    step = span.total_seconds() / rows
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        if fmt == "csv":
+            fh.write("timestamp,type,value\n")
+        for n in range(rows):
+            # Every 100th line repeats the previous one, as overlapping exports do
+            i = n - 1 if n % 100 == 99 else n
+            name, _, lo, hi = _TYPES[i % len(_TYPES)]
+            logged = (start + timedelta(seconds=i * step)).isoformat(sep=" ", timespec="seconds")
+            value = lo + (i * 7919 % ((hi - lo) * 100)) / 100
+            if fmt == "csv":
+                fh.write(f"{logged},{name},{value:.2f}\n")
+            else:
+                fh.write(json.dumps({"timestamp": logged, "type": name, "value": value}) + "\n")
+
+
+def run(rows: int, fmt: str, orm_rows: int) -> int:
+    path = os.path.join(tempfile.gettempdir(), f"metric_import_bench.{fmt}")
+    started = time.perf_counter()
+    write_export(path, rows, fmt)
+    print(f"setup: wrote {rows:,} lines ({os.path.getsize(path) / 2 ** 20:,.0f} MB) "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    engine = get_engine()
+    results = {}
+    with engine.connect() as conn:
+        outer = conn.begin()
+        session = OrmSession(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            member_id = session.execute(_MEMBER_SQL, {"role": lookups.require_id(session, "role", "Member")}).scalar()
+            for label in ("import", "re-import"):
+                rss_before = _peak_rss_mb()
+                started = time.perf_counter()
+                with open(path, encoding="utf-8", newline="") as fh:
+                    result = services.import_metrics(session, member_id, fh, fmt)
+                elapsed = time.perf_counter() - started
+                results[label] = dict(result, seconds=elapsed, rss_growth=_peak_rss_mb() - rss_before)
+                # Only a real commit drops the temp tables; here the import committed a savepoint
+                session.execute(text("DROP TABLE metric_import_staging, metric_import"))
+
+            # The old path: one ORM insert and rollup upsert per reading, each its own transaction
+            type_ids = [lookups.require_id(session, "metric_type", ours) for _, ours, _, _ in _TYPES]
+            base = datetime.now() + timedelta(days=1)
+            started = time.perf_counter()
+            for n in range(orm_rows):
+                _, _, lo, hi = _TYPES[n % len(_TYPES)]
+                services.log_metric(session, member_id, type_ids[n % len(_TYPES)], lo + n % (hi - lo),
+                                    base + timedelta(seconds=n))
+            orm_rate = orm_rows / (time.perf_counter() - started)
+        finally:
+            session.close()
+            outer.rollback()
+            os.remove(path)
+
+    print(f"\n{'run':10} {'readings':>11} {'imported':>11} {'dupes':>9} {'rejected':>9} {'seconds':>8} "
+          f"{'readings/s':>11} {'+RSS MB':>8}")
+    for label, r in results.items():
+        print(f"{label:10} {r['readings']:>11,} {r['imported']:>11,} {r['duplicates']:>9,} {r['rejected']:>9,} "
+              f"{r['seconds']:>8.2f} {r['readings'] / r['seconds']:>11,.0f} {r['rss_growth']:>8.1f}")
+    first = results["import"]
+    print(f"log_metric, one reading at a time: {orm_rate:,.0f} readings/s "
+          f"({first['readings'] / first['seconds'] / orm_rate:.0f}x slower than the import)")
+    ok = first["imported"] + first["duplicates"] == first["readings"] and results["re-import"]["imported"] == 0
+    print(f"all readings accounted for, re-import added none: {'yes' if ok else 'NO'}")
+    return 0 if ok else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time a bulk metric import for one member.")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="lines in the synthetic export")
+    parser.add_argument("--format", choices=services.imports.FORMATS, default="csv")
+    parser.add_argument("--orm-rows", type=int, default=2000, help="readings timed through log_metric")
+    args = parser.parse_args(argv)
+    return run(args.rows, args.format, args.orm_rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Partitioned vs unpartitioned metric table: bulk load, single-row insert and query latency
+#
+# Builds two scratch copies of the metric table in schema bench_partitions (one plain, one with
+# monthly range partitions like the real table), fills both with the same synthetic readings and
+# times the app's metric access patterns against each. The real metric table is not touched.
+#
+# Usage (from the repo root):
+#   python -m bench.partitions                             # 100M rows (needs ~15GB free disk, takes a while)
+#   python -m bench.partitions --rows 5000000 --runs 50
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+
+from app.db import get_engine
+from app.partitions import add_months, month_start
+
+SCHEMA = "bench_partitions"
+READINGS_PER_USER = 1000
+
+# name -> SQL; :user, :since, :month_lo, :month_hi are filled per run
+QUERIES = {
+    # member.dashboard / trainer lookup without a time bound
+    "latest_5_unbounded": """
+        SELECT * FROM {table} WHERE user_id = %(user)s ORDER BY logged_date DESC LIMIT 5""",
+    # the same lookup with the services' recent window (prunes to the newest partitions)
+    "latest_5_recent": """
+        SELECT * FROM {table} WHERE user_id = %(user)s AND logged_date >= %(since)s
+        ORDER BY logged_date DESC LIMIT 5""",
+    # goal baseline: latest reading of one type before a point in time
+    "baseline_before": """
+        SELECT * FROM {table} WHERE user_id = %(user)s AND metric_type = 1 AND logged_date <= %(month_hi)s
+        ORDER BY logged_date DESC LIMIT 1""",
+    # one member's readings of a type for a month (history screen, reports)
+    "user_month_history": """
+        SELECT * FROM {table} WHERE user_id = %(user)s AND metric_type = 1
+        AND logged_date >= %(month_lo)s AND logged_date < %(month_hi)s ORDER BY logged_date""",
+    # club-wide monthly aggregate (rollups, reports)
+    "month_aggregate": """
+        SELECT metric_type, count(*), avg(value) FROM {table}
+        WHERE logged_date >= %(month_lo)s AND logged_date < %(month_hi)s GROUP BY metric_type""",
+}
+
+
+def _median_ms(samples: List[float]) -> float:
+    return round(statistics.median(samples) * 1000.0, 3)
+
+
+def _p95_ms(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000.0, 3)
+
+
+def build(cur, rows: int, months: int, first_month: date, log: Callable[[str], None]) -> Dict[str, float]:
+    """Create and fill both scratch tables; returns bulk-load seconds per table."""
+    users = max(1, rows // READINGS_PER_USER)
+    span_seconds = (add_months(first_month, months) - first_month).days * 86400
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    columns = """(id bigint GENERATED BY DEFAULT AS IDENTITY, user_id integer NOT NULL,
+                  metric_type integer NOT NULL, value numeric(10, 2) NOT NULL,
+                  logged_date timestamp NOT NULL, PRIMARY KEY (id, logged_date))"""
+    cur.execute(f"CREATE TABLE {SCHEMA}.plain {columns}")
+    cur.execute(f"CREATE TABLE {SCHEMA}.parted {columns} PARTITION BY RANGE (logged_date)")
+    for n in range(months):
+        lo, hi = add_months(first_month, n), add_months(first_month, n + 1)
+        cur.execute(f"CREATE TABLE {SCHEMA}.parted_{lo:%Y_%m} PARTITION OF {SCHEMA}.parted "
+                    f"FOR VALUES FROM ('{lo}') TO ('{hi}')")
+    cur.execute(f"CREATE TABLE {SCHEMA}.parted_default PARTITION OF {SCHEMA}.parted DEFAULT")
+
+    # Same readings in both tables: each row's user, type, value and time derive from its number
+    fill = f"""
+        INSERT INTO {SCHEMA}.{{table}} (user_id, metric_type, value, logged_date)
+        SELECT 1 + (n % {users}), 1 + (n % 4), 50 + (n * 7919 % 15000) / 100.0,
+               timestamp '{first_month}' + ((n * 2654435761) % {span_seconds}) * interval '1 second'
+        FROM generate_series(1::bigint, {rows}) AS n
+    """
+    seconds = {}
+    for table in ("plain", "parted"):
+        started = time.perf_counter()
+        cur.execute(fill.format(table=table))
+        # The real table's indexes, built after the load as datagen does
+        cur.execute(f"CREATE INDEX ON {SCHEMA}.{table} (user_id, metric_type, logged_date)")
+        cur.execute(f"CREATE INDEX ON {SCHEMA}.{table} (user_id, logged_date)")
+        cur.execute(f"ANALYZE {SCHEMA}.{table}")
+        seconds[table] = round(time.perf_counter() - started, 2)
+        log(f"  loaded {table:<7} {rows:,} rows + indexes in {seconds[table]:.2f}s")
+    return {"users": users, "load_s": seconds}
+
+
+def time_inserts(cur, count: int, users: int, rng: random.Random) -> Dict[str, Dict[str, float]]:
+    """Single-row inserts at 'now', each its own transaction, like log_metric."""
+    results = {}
+    for table in ("plain", "parted"):
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            cur.execute(f"INSERT INTO {SCHEMA}.{table} (user_id, metric_type, value, logged_date) "
+                        f"VALUES (%s, %s, %s, now()::timestamp)",
+                        (rng.randint(1, users), rng.randint(1, 4), round(rng.uniform(50, 200), 2)))
+            cur.connection.commit()
+            samples.append(time.perf_counter() - started)
+        results[table] = {"p50_ms": _median_ms(samples), "p95_ms": _p95_ms(samples)}
+    return results
+
+
+def time_queries(cur, runs: int, users: int, months: int, first_month: date,
+                 rng: random.Random) -> Dict[str, Dict[str, Dict[str, float]]]:
+    last_month = add_months(first_month, months - 1)
+    results = {}
+    for name, sql in QUERIES.items():
+        results[name] = {}
+        # The same user/month draws for both tables
+        draws = []
+        for _ in range(runs):
+            lo = add_months(first_month, rng.randrange(months))
+            draws.append({"user": rng.randint(1, users), "since": datetime.combine(last_month, datetime.min.time()),
+                          "month_lo": lo, "month_hi": add_months(lo, 1)})
+        for table in ("plain", "parted"):
+            samples = []
+            for params in draws:
+                started = time.perf_counter()
+                cur.execute(sql.format(table=f"{SCHEMA}.{table}"), params)
+                cur.fetchall()
+                samples.append(time.perf_counter() - started)
+            results[name][table] = {"p50_ms": _median_ms(samples), "p95_ms": _p95_ms(samples)}
+    return results
+
+
+def time_retention(cur, first_month: date) -> Dict[str, float]:
+    """Removing the oldest month: DELETE on the plain table vs dropping a partition."""
+    lo, hi = first_month, add_months(first_month, 1)
+    started = time.perf_counter()
+    cur.execute(f"DELETE FROM {SCHEMA}.plain WHERE logged_date >= %s AND logged_date < %s", (lo, hi))
+    cur.connection.commit()
+    plain = time.perf_counter() - started
+    started = time.perf_counter()
+    cur.execute(f"ALTER TABLE {SCHEMA}.parted DETACH PARTITION {SCHEMA}.parted_{lo:%Y_%m}")
+    cur.execute(f"DROP TABLE {SCHEMA}.parted_{lo:%Y_%m}")
+    cur.connection.commit()
+    parted = time.perf_counter() - started
+    return {"plain_delete_s": round(plain, 3), "parted_drop_s": round(parted, 3)}
+
+
+def print_report(result: Dict[str, object]) -> None:
+    print(f"\n{result['rows']:,} rows over {result['months']} months, {result['users']:,} users")
+    print(f"bulk load + indexes: plain {result['load_s']['plain']}s, partitioned {result['load_s']['parted']}s")
+    ins = result["insert"]
+    print(f"single-row insert p50/p95: plain {ins['plain']['p50_ms']}/{ins['plain']['p95_ms']}ms, "
+          f"partitioned {ins['parted']['p50_ms']}/{ins['parted']['p95_ms']}ms")
+    print(f"\n{'query':22} {'plain p50':>10} {'p95':>9} {'parted p50':>11} {'p95':>9} {'speedup':>8}")
+    for name, row in result["queries"].items():
+        plain, parted = row["plain"], row["parted"]
+        speedup = plain["p50_ms"] / parted["p50_ms"] if parted["p50_ms"] else float("inf")
+        print(f"{name:22} {plain['p50_ms']:>10.3f} {plain['p95_ms']:>9.3f} {parted['p50_ms']:>11.3f} "
+              f"{parted['p95_ms']:>9.3f} {speedup:>7.1f}x")
+    ret = result["retention"]
+    print(f"\nretire oldest month: plain DELETE {ret['plain_delete_s']}s, partition drop {ret['parted_drop_s']}s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare a range-partitioned metric table with a plain one.")
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--months", type=int, default=36, help="months of history the rows are spread over")
+    parser.add_argument("--runs", type=int, default=200, help="executions per query per table")
+    parser.add_argument("--inserts", type=int, default=1000, help="single-row inserts per table")
+    parser.add_argument("--seed", type=int, default=3005)
+    parser.add_argument("--keep", action="store_true", help=f"leave schema {SCHEMA} in place afterwards")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    first_month = add_months(month_start(date.today() + timedelta(days=1)), -(args.months - 1))
+    raw = get_engine().raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("SET synchronous_commit = off")
+        print(f"Building {SCHEMA}.plain and {SCHEMA}.parted ...")
+        built = build(cur, args.rows, args.months, first_month, print)
+        raw.commit()
+        result = {"rows": args.rows, "months": args.months, "users": built["users"], "load_s": built["load_s"]}
+        result["queries"] = time_queries(cur, args.runs, built["users"], args.months, first_month, rng)
+        result["insert"] = time_inserts(cur, args.inserts, built["users"], rng)
+        result["retention"] = time_retention(cur, first_month)
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        raw.commit()
+    finally:
+        raw.close()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
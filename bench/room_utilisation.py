@@ -0,0 +1,125 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Room utilisation benchmark: the one-statement grouped report vs loading the rows and summing in Python
+#
+# Both build the same per-room and per-hour-of-week figures for every room over the range; the results
+# are compared so the grouped query is checked as well as timed.
+#
+# Usage (from the repo root):
+#   python -m bench.room_utilisation                  # the last year, 10 runs each
+#   python -m bench.room_utilisation --days 730 --runs 5
+
+import argparse
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dtime, timedelta
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+
+import services
+from app.db import get_engine
+
+# SELECT id, room_id, size, enrolled_count, lower(slot), upper(slot) FROM session WHERE slot && [?, ?)
+_SESSIONS_SQL = text("""
+    SELECT id, room_id, size, enrolled_count, lower(slot), upper(slot) FROM session
+    WHERE room_id IS NOT NULL AND slot && tsrange(:lo, :hi)
+""")
+# SELECT session_id, attended FROM enrollment WHERE session_id IN (...)
+_ENROLLMENTS_SQL = text("SELECT session_id, attended FROM enrollment WHERE session_id = ANY(:ids)")
+
+
+def python_report(session, first: date, last: date, now: datetime):
+    """Per-room sessions, booked hours, enrolled seat-hours and no-show seat-hours, summed row by row."""
+    lo, hi = datetime.combine(first, dtime()), datetime.combine(last + timedelta(days=1), dtime())
+    capacity = {r["id"]: r["capacity"] for r in services.lookups.all_rows(session, "room")}
+    rows = session.execute(_SESSIONS_SQL, {"lo": lo, "hi": hi}).all()
+    attendance = defaultdict(lambda: [0, 0])
+    for session_id, attended in session.execute(_ENROLLMENTS_SQL, {"ids": [r[0] for r in rows]}):
+        attendance[session_id][0] += 1
+        attendance[session_id][1] += attended is not True
+    rooms = defaultdict(lambda: defaultdict(float))
+    cells = defaultdict(float)
+    for session_id, room_id, size, enrolled_count, starts, ends in rows:
+        starts, ends = max(starts, lo), min(ends, hi)
+        hour = starts.replace(minute=0, second=0, microsecond=0)
+        rooms[room_id]["sessions"] += 1
+        while hour < ends:
+            hours = (min(ends, hour + timedelta(hours=1)) - max(starts, hour)) / timedelta(hours=1)
+            figures = rooms[room_id]
+            figures["booked_hours"] += hours
+            figures["enrolled_hours"] += hours * enrolled_count
+            figures["capacity_hours"] += hours * capacity[room_id]
+            if ends <= now:
+                enrolled, absent = attendance[session_id]
+                figures["ended_hours"] += hours * enrolled
+                figures["absent_hours"] += hours * absent
+            cells[(room_id, hour.isoweekday(), hour.hour)] += hours
+            hour += timedelta(hours=1)
+    return rooms, cells
+
+
+def _pct(part, whole):
+    return round(100 * part / whole, 1) if whole else None
+
+
+def agree(report, rooms, cells) -> bool:
+    for room in report["rooms"]:
+        figures = rooms.get(room["room_id"], {})
+        expected = (int(figures.get("sessions", 0)), round(figures.get("booked_hours", 0.0), 1),
+                    _pct(figures.get("enrolled_hours", 0), figures.get("capacity_hours", 0)),
+                    _pct(figures.get("absent_hours", 0), figures.get("ended_hours", 0)))
+        got = (room["sessions"], room["booked_hours"], room["occupancy_pct"], room["no_show_pct"])
+        if expected != got:
+            print(f"  room {room['room_id']}: expected {expected}, got {got}")
+            return False
+        for cell in room["hours"]:
+            if abs(cells[(room["room_id"], cell["dow"], cell["hour"])] - cell["booked_hours"]) > 0.05:
+                print(f"  room {room['room_id']} day {cell['dow']} hour {cell['hour']} differs")
+                return False
+    return True
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time the room utilisation report against summing rows in Python.")
+    parser.add_argument("--days", type=int, default=365, help="days in the range, ending today")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    last = date.today()
+    first = last - timedelta(days=args.days - 1)
+    now = datetime.now()
+    engine = get_engine()
+    with engine.connect() as conn:
+        session = OrmSession(bind=conn)
+        statements = [0]
+        event.listen(conn, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+        services.lookups.all_rows(session, "room")
+        results = {}
+        for name, fn in (("grouped query", lambda: services.room_utilisation(session, first, last, now)),
+                         ("python sums", lambda: python_report(session, first, last, now))):
+            timings, statements[0] = [], 0
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                results[name] = fn()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name + " timing"] = (statistics.median(timings), max(timings), statements[0] / args.runs)
+        session.close()
+
+    report = results["grouped query"]
+    total = report["total"]
+    print(f"{len(report['rooms'])} rooms, {first} to {last} ({report['days']} days), {total['sessions']:,} sessions, "
+          f"{total['booked_hours']:,.0f} booked hours")
+    print(f"{'method':14} {'p50 ms':>9} {'max ms':>9} {'stmts':>6}")
+    for name in ("grouped query", "python sums"):
+        p50, worst, per_run = results[name + " timing"]
+        print(f"{name:14} {p50:9.1f} {worst:9.1f} {per_run:6.0f}")
+    ok = agree(report, *results["python sums"])
+    print(f"results agree: {'yes' if ok else 'NO'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Statement-budget check: browse, trainer schedule and unpaid bills must not issue more queries as their rows grow
+#
+# Each screen runs on the loaded database, then again after thousands of extra rows are piled onto it
+# (classes full of members for the busiest trainer, multi-line unpaid bills), all in one transaction that
+# is rolled back. A screen that goes over its budget in bench.workflows, or issues more statements once
+# the rows grow, fails the run with a non-zero exit code.
+#
+# Usage (from the repo root):
+#   python -m bench.screen_budgets                     # 2,000 extra classes and bills
+#   python -m bench.screen_budgets --rows 10000 --members 20
+
+import argparse
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session as OrmSession
+
+from app.db import get_engine
+from bench.workflows import WORKFLOWS, WorkflowFailed, pick_users, run_on
+from services import lookups
+
+SCREENS = ["member.browse_sessions", "trainer.schedule", "admin.unpaid_bills"]
+
+# :rows half-hour classes for the trainer just after midnight on each of the next :rows days (outside
+# club hours, so nothing already booked clashes), each enrolled by the first :members members and
+# open to everyone, so they lead the browse pages too
+_FILL_CLASSES_SQL = text("""
+    WITH sched AS (
+        INSERT INTO schedule (trainer_id, date, start_time, end_time, type)
+        SELECT :trainer, CURRENT_DATE + g, time '00:00', time '00:30', (SELECT min(id) FROM schedule_type)
+        FROM generate_series(1, :rows) g
+        RETURNING id
+    ), sess AS (
+        INSERT INTO session (schedule_id, size, enrolled_count, name)
+        SELECT id, :members + 5, :members, 'Budget check class' FROM sched
+        RETURNING id
+    )
+    INSERT INTO enrollment (session_id, member_id, attended)
+    SELECT sess.id, m.id, FALSE
+    FROM sess, (SELECT u.id FROM "user" u JOIN role r ON r.id = u.role WHERE r.name = 'Member'
+                ORDER BY u.id LIMIT :members) m
+""")
+# :rows unpaid bills dated before any real one, so they fill the first pages, with three lines each
+_FILL_BILLS_SQL = text("""
+    WITH member AS (
+        SELECT u.id, row_number() OVER (ORDER BY u.id) AS n
+        FROM "user" u JOIN role r ON r.id = u.role WHERE r.name = 'Member'
+    ), bill AS (
+        INSERT INTO bill (admin_id, member_id, date, paid)
+        SELECT :admin, member.id, DATE '2000-01-01', FALSE
+        FROM generate_series(1, :rows) g
+        JOIN member ON member.n = 1 + g % (SELECT count(*) FROM member)
+        RETURNING id
+    )
+    INSERT INTO item (bill_id, service_id, quantity)
+    SELECT bill.id, s.id, 1 FROM bill, (SELECT id FROM service ORDER BY id LIMIT 3) s
+""")
+
+
+def measure(conn, ids, names):
+    """Statements and rows read per screen, each the worst of two runs (None for a screen that failed)."""
+    results = {}
+    for name in names:
+        role, handler, inputs, _ = WORKFLOWS[name]
+        try:
+            runs = [run_on(conn, handler, ids[role], inputs) for _ in range(2)]
+        except WorkflowFailed as exc:
+            print(f"{name}: printed {str(exc)!r}")
+            results[name] = None
+            continue
+        results[name] = (max(r["statements"] for r in runs), max(r["rows"] for r in runs))
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that screen statement counts stay flat as their rows grow.")
+    parser.add_argument("--rows", type=int, default=2000, help="extra classes and extra unpaid bills")
+    parser.add_argument("--members", type=int, default=10, help="members enrolled in each extra class")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    # The app warms the lookup cache at startup; do the same so runs measure steady state
+    with OrmSession(bind=engine) as session:
+        lookups.warm(session)
+    with engine.connect() as conn:
+        outer = conn.begin()
+        try:
+            ids = pick_users(conn)
+            before = measure(conn, ids, SCREENS)
+            conn.execute(_FILL_CLASSES_SQL, {"trainer": ids["trainer"], "rows": args.rows, "members": args.members})
+            conn.execute(_FILL_BILLS_SQL, {"admin": ids["admin"], "rows": args.rows})
+            after = measure(conn, ids, SCREENS)
+        finally:
+            outer.rollback()
+
+    problems = []
+    print(f"{'screen':24} {'stmts':>6} {'rows':>8} {'stmts':>6} {'rows':>8} {'budget':>6}   "
+          f"(loaded, then +{args.rows:,} classes and bills)")
+    for name in SCREENS:
+        budget = WORKFLOWS[name][3]
+        if before[name] is None or after[name] is None:
+            problems.append(f"{name}: the screen reported an error")
+            continue
+        (was, was_rows), (now, now_rows) = before[name], after[name]
+        print(f"{name:24} {was:>6} {was_rows:>8,} {now:>6} {now_rows:>8,} {budget:>6}")
+        if now > budget:
+            problems.append(f"{name}: {now} statements exceeds budget of {budget}")
+        if now > was:
+            problems.append(f"{name}: statements grew from {was} to {now} with the extra rows")
+
+    if problems:
+        print("\nOver budget:")
+        for line in problems:
+            print(f"- {line}")
+        return 1
+    print("\nAll screens within budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
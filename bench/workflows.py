@@ -0,0 +1,307 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Headless benchmark of the member/trainer/admin menu workflows
+#
+# Usage (from the repo root):
+#   python -m bench.workflows                          # current database, compare with bench/baseline.json
+#   python -m bench.workflows --scales 1,3 --generate  # regenerate data at each scale before running
+#   python -m bench.workflows --save                   # record the results as the new baseline
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session as OrmSession
+
+from models import Session as TrainingSession, User
+from app.auth import build_database_url
+from app.db import get_engine
+from app.profiling import track
+from app import member, trainer, admin
+from services import lookups
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class ScriptExhausted(Exception):
+    """Raised when a workflow asks for more input than its script provides."""
+
+
+class WorkflowFailed(Exception):
+    """Raised when a workflow prints an error marker: the screen caught an exception and carried on."""
+
+
+# Screens report unexpected exceptions as "Error: ..." or "[ERROR] ..." (business-rule rejections
+# print the bare message); colour codes are stripped before matching
+_ERROR_MARKERS = ("[ERROR]", "Error:")
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")
+
+
+def _far_future(ids: Dict[str, int]) -> str:
+    # Class creation needs a slot nobody has booked yet
+    return (date.today() + timedelta(days=900)).isoformat()
+
+
+class AtPrompt:
+    """A scripted answer worked out from the workflow's session when its prompt comes up."""
+
+    def __init__(self, answer: Callable[[OrmSession], str]):
+        self.answer = answer
+
+
+RECREATED_CLASS = "Benchmark Recreated Class"
+_RECREATE_CLASS = ["2", "1", lambda ids: str(ids["room_id"]), _far_future, "06:00", "07:00",
+                   RECREATED_CLASS, "Created by bench.workflows", "10", ""]
+
+
+def cancel_and_recreate(session, user):
+    """Create a class, cancel it, then book the same trainer, room and time again."""
+    for _ in range(3):
+        admin.manage_class_schedule(session, user)
+    # SELECT count(*) FROM session WHERE name = ?
+    if session.query(TrainingSession).filter_by(name=RECREATED_CLASS).count() != 1:
+        raise WorkflowFailed("the cancelled class's slot could not be booked again")
+
+
+# name -> (role, handler, scripted inputs, max statements)
+# Inputs may be callables taking the picked IDs, so scripts can refer to real rows.
+# Statement budgets include the SAVEPOINT/RELEASE pair emitted when a workflow commits.
+WORKFLOWS: Dict[str, tuple] = {
+    "member.dashboard": ("member", member.member_dashboard, [], 4),
+    "member.metric_history": ("member", member.view_health_metrics, ["n"], 1),
+    "member.metric_readings": ("member", member.view_health_metrics, ["y"], 2),
+    "member.goal_progress": ("member", member.view_goal_progress, [], 1),
+    "member.log_metric": ("member", member.log_health_metrics, ["1", "180.5"], 3),
+    "member.browse_sessions": ("member", member.browse_and_enroll_sessions, ["0"], 1),
+    "member.enroll": ("member", member.browse_and_enroll_sessions, ["1"], 4),
+    "member.cancel_list": ("member", member.cancel_session, ["0"], 1),
+    "member.cancel": ("member", member.cancel_session, ["1"], 3),
+    "trainer.schedule": ("trainer", trainer.view_trainer_schedule, [], 1),
+    "trainer.avail_series": ("trainer", trainer.set_availability,
+                             [_far_future, "06:00", "07:00", "2", "Mon,Wed,Fri", "13", ""], 4),
+    "trainer.member_lookup": ("trainer", trainer.view_member_profiles, [""], 3),
+    "admin.class_list": ("admin", admin.manage_class_schedule, ["1"], 1),
+    "admin.create_class": ("admin", admin.manage_class_schedule,
+                           ["2", "1", lambda ids: str(ids["room_id"]), _far_future, "06:00", "07:00",
+                            "Benchmark Class", "Created by bench.workflows", "10", ""], 5),
+    "admin.class_series": ("admin", admin.manage_class_schedule,
+                           ["2", "1", lambda ids: str(ids["room_id"]), _far_future, "06:00", "07:00",
+                            "Benchmark Series", "Created by bench.workflows", "10", "Mon,Wed,Fri", "13", ""], 7),
+    "admin.cancel_recreate": ("admin", cancel_and_recreate,
+                              _RECREATE_CLASS
+                              + ["3", AtPrompt(lambda session: str(session.query(TrainingSession.id).filter_by(
+                                  name=RECREATED_CLASS).scalar()))]
+                              + _RECREATE_CLASS, 18),
+    "admin.unpaid_bills": ("admin", admin.process_billing, ["2", ""], 1),
+    "admin.receivables": ("admin", admin.process_billing, ["4", "", ""], 1),
+    "admin.goal_progress": ("admin", admin.goal_progress_report, ["Q"], 1),
+    "admin.room_utilisation": ("admin", admin.room_utilisation_report, ["", "", ""], 1),
+    "admin.equipment_list": ("admin", admin.manage_equipment, ["1"], 1),
+}
+
+
+def pick_users(conn) -> Dict[str, int]:
+    """Pick the busiest member and trainer plus an admin and a room."""
+    one = lambda sql: conn.execute(text(sql)).scalar()
+    return {
+        "member": one("SELECT member_id FROM enrollment GROUP BY member_id ORDER BY count(*) DESC, member_id LIMIT 1")
+                  or one("SELECT u.id FROM \"user\" u JOIN role r ON r.id = u.role WHERE r.name = 'Member' LIMIT 1"),
+        "trainer": one("SELECT trainer_id FROM schedule GROUP BY trainer_id ORDER BY count(*) DESC, trainer_id LIMIT 1")
+                   or one("SELECT u.id FROM \"user\" u JOIN role r ON r.id = u.role WHERE r.name = 'Trainer' LIMIT 1"),
+        "admin": one("SELECT u.id FROM \"user\" u JOIN role r ON r.id = u.role WHERE r.name = 'Admin' ORDER BY u.id LIMIT 1"),
+        "room_id": one("SELECT id FROM room ORDER BY capacity DESC, id LIMIT 1"),
+    }
+
+
+@contextlib.contextmanager
+def scripted_io(inputs: List[str], session: Optional[OrmSession] = None):
+    """Feed input() from a script (AtPrompt answers are worked out from `session`) and capture everything printed."""
+    answers = iter(inputs)
+
+    def fake_input(prompt: str = "") -> str:
+        try:
+            answer = next(answers)
+        except StopIteration:
+            raise ScriptExhausted(prompt.strip()) from None
+        return answer.answer(session) if isinstance(answer, AtPrompt) else answer
+
+    original = builtins.input
+    builtins.input = fake_input
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            yield out
+    finally:
+        builtins.input = original
+
+
+def run_on(conn, handler: Callable, user_id: int, inputs: List[str]) -> Dict[str, float]:
+    """Run one workflow inside the connection's open transaction and return its cost."""
+    # Handler commits become savepoint releases, so the caller's rollback undoes any writes
+    session = OrmSession(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        user = session.get(User, user_id)
+        with scripted_io(inputs, session) as out, track(handler.__name__, record=False) as stats:
+            handler(session, user)
+        output = _ANSI.sub("", out.getvalue())
+        failed = next((line for line in output.splitlines() if any(m in line for m in _ERROR_MARKERS)), None)
+        if failed:
+            raise WorkflowFailed(failed.strip())
+        stats = dict(stats)
+        stats["output_lines"] = output.count("\n")
+        return stats
+    finally:
+        session.close()
+
+
+def run_once(engine, handler: Callable, user_id: int, inputs: List[str]) -> Dict[str, float]:
+    """Run one workflow in a rolled-back transaction and return its cost."""
+    with engine.connect() as conn:
+        outer = conn.begin()
+        try:
+            return run_on(conn, handler, user_id, inputs)
+        finally:
+            outer.rollback()
+
+
+def run_workflows(repeat: int, only: Optional[List[str]] = None) -> Dict[str, Dict[str, object]]:
+    engine = get_engine()
+    with engine.connect() as conn:
+        ids = pick_users(conn)
+    # The app warms the lookup cache at startup; do the same so runs measure steady state
+    with OrmSession(bind=engine) as session:
+        lookups.warm(session)
+
+    results = {}
+    for name, (role, handler, script, budget) in WORKFLOWS.items():
+        if only and name not in only:
+            continue
+        inputs = [step(ids) if callable(step) else step for step in script]
+        runs = []
+        failure = None
+        for _ in range(repeat):
+            try:
+                runs.append(run_once(engine, handler, ids[role], inputs))
+            except ScriptExhausted as exc:
+                failure = f"script ran out of input at prompt {str(exc)!r}"
+                break
+            except WorkflowFailed as exc:
+                failure = f"printed {str(exc)!r}"
+                break
+        if failure or not runs:
+            results[name] = {"error": failure or "no runs"}
+            continue
+        walls = [r["wall_ms"] for r in runs]
+        results[name] = {
+            "p50_ms": round(statistics.median(walls), 3),
+            "p95_ms": round(sorted(walls)[max(0, int(len(walls) * 0.95 + 0.5) - 1)], 3),
+            "max_ms": round(max(walls), 3),
+            "db_ms": round(statistics.median(r["db_ms"] for r in runs), 3),
+            "statements": max(r["statements"] for r in runs),
+            "rows": max(r["rows"] for r in runs),
+            "output_lines": runs[-1]["output_lines"],
+            "max_statements": budget,
+        }
+    return results
+
+
+def compare(current: Dict[str, Dict[str, dict]], baseline: Dict[str, Dict[str, dict]],
+            tolerance: float) -> List[str]:
+    """Return human-readable regressions of current vs baseline (and statement budgets)."""
+    problems = []
+    for scale, workflows in current.items():
+        for name, now in workflows.items():
+            if "error" in now:
+                problems.append(f"[scale {scale}] {name}: {now['error']}")
+                continue
+            if now["max_statements"] is not None and now["statements"] > now["max_statements"]:
+                problems.append(f"[scale {scale}] {name}: {now['statements']} statements "
+                                f"exceeds budget of {now['max_statements']}")
+            before = baseline.get(scale, {}).get(name)
+            if not before or "error" in before:
+                continue
+            if now["statements"] > before["statements"]:
+                problems.append(f"[scale {scale}] {name}: statements {before['statements']} -> {now['statements']}")
+            limit = before["p50_ms"] * (1.0 + tolerance)
+            # Ignore sub-millisecond jitter
+            if now["p50_ms"] > limit and now["p50_ms"] - before["p50_ms"] > 1.0:
+                problems.append(f"[scale {scale}] {name}: p50 {before['p50_ms']:.1f}ms -> {now['p50_ms']:.1f}ms "
+                                f"(+{(now['p50_ms'] / before['p50_ms'] - 1) * 100:.0f}%)")
+    return problems
+
+
+def print_results(scale: str, results: Dict[str, dict]) -> None:
+    print(f"\nScale {scale}")
+    print(f"{'workflow':24} {'p50 ms':>9} {'p95 ms':>9} {'db ms':>9} {'stmts':>6} {'rows':>8}")
+    for name, row in results.items():
+        if "error" in row:
+            print(f"{name:24} ERROR: {row['error']}")
+            continue
+        print(f"{name:24} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['db_ms']:>9.2f} "
+              f"{row['statements']:>6} {row['rows']:>8}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run every menu workflow headlessly and record latency/query counts.")
+    parser.add_argument("--scales", default="current",
+                        help="comma-separated scale factors; 'current' uses the loaded database as-is")
+    parser.add_argument("--generate", action="store_true",
+                        help="regenerate the dataset (app.datagen) before running each scale")
+    parser.add_argument("--seed", type=int, default=3005, help="seed for --generate")
+    parser.add_argument("--today", type=date.fromisoformat,
+                        help="date --generate places the data around (default: today), to reproduce a baseline's data")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per workflow")
+    parser.add_argument("--only", help="comma-separated workflow names to run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against / save to")
+    parser.add_argument("--save", action="store_true", help="write these results to the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p50 slowdown before flagging a regression (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    only = args.only.split(",") if args.only else None
+    current: Dict[str, Dict[str, dict]] = {}
+    for scale in args.scales.split(","):
+        scale = scale.strip()
+        if args.generate and scale != "current":
+            from app.datagen import generate
+            print(f"Generating scale {scale} dataset...")
+            started = time.perf_counter()
+            generate(build_database_url(), int(scale), seed=args.seed, log=lambda msg: None, today=args.today)
+            print(f"  loaded in {time.perf_counter() - started:.1f}s")
+        current[scale] = run_workflows(args.repeat, only)
+        print_results(scale, current[scale])
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+
+    problems = compare(current, baseline, args.tolerance)
+    if problems:
+        print("\nRegressions:")
+        for line in problems:
+            print(f"- {line}")
+    else:
+        print("\nNo regressions.")
+
+    if args.save:
+        baseline.update(current)
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,9 +6,11 @@ from .models import (
     User,
     Service,
     Bill,
+    Subscription,
     Item,
     MetricType,
     Metric,
+    MetricRollup,
     Goal,
     Room,
     EquipmentStatus,
@@ -16,7 +18,8 @@ from .models import (
     ScheduleType,
     Schedule,
     Session,
-    Enrollment
+    Enrollment,
+    BusyBitmap
 )
 
 __all__ = [
@@ -25,9 +28,11 @@ __all__ = [
     'User',
     'Service',
     'Bill',
+    'Subscription',
     'Item',
     'MetricType',
     'Metric',
+    'MetricRollup',
     'Goal',
     'Room',
     'EquipmentStatus',
@@ -35,6 +40,7 @@ __all__ = [
     'ScheduleType',
     'Schedule',
     'Session',
-    'Enrollment'
+    'Enrollment',
+    'BusyBitmap'
 ]
 
@@ -2,9 +2,10 @@
 # Afaq Virk 101338854
 # Database Models
 
-from sqlalchemy import Column, Integer, String, Date, Time, Boolean, DECIMAL, CHAR, Text, DateTime, ForeignKey, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, Time, Boolean, DECIMAL, CHAR, Text, DateTime, ForeignKey, CheckConstraint, UniqueConstraint, Index, DDL, Computed, FetchedValue, event, text
+from sqlalchemy.dialects.postgresql import BIT, ExcludeConstraint, TSRANGE
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 
 Base = declarative_base()
@@ -32,7 +33,7 @@ class User(Base):
     date_of_birth = Column(Date)
     sex = Column(CHAR(1), CheckConstraint("sex IN ('M', 'F', 'O')"))
     phone = Column(String(20))
-    role = Column(Integer, ForeignKey('role.id'), nullable=False)
+    role = Column(Integer, ForeignKey('role.id'), nullable=False, index=True)
     
     role_obj = relationship("Role", back_populates="users")
     metrics = relationship("Metric", back_populates="user", cascade="all, delete-orphan")
@@ -40,6 +41,8 @@ class User(Base):
     enrollments = relationship("Enrollment", back_populates="member")
     bills_as_member = relationship("Bill", back_populates="member", foreign_keys="Bill.member_id")
     bills_as_admin = relationship("Bill", back_populates="admin", foreign_keys="Bill.admin_id")
+    subscriptions = relationship("Subscription", back_populates="member", cascade="all, delete-orphan")
+    goals = relationship("Goal", back_populates="user", cascade="all, delete-orphan")
 
 
 class Service(Base):
@@ -56,24 +59,53 @@ class Service(Base):
 class Bill(Base):
     """Billing records"""
     __tablename__ = 'bill'
+    __table_args__ = (
+        # Unpaid bills are a small, hot slice of the table: "View Unpaid Bills" and receivables
+        Index('ix_bill_unpaid_member_date', 'member_id', 'date', postgresql_where=text('paid = false')),
+        # Oldest-first pages of unpaid bills (keyset on date, id)
+        Index('ix_bill_unpaid_date', 'date', 'id', postgresql_where=text('paid = false')),
+        # One recurring bill per member per cycle; billing runs insert with ON CONFLICT DO NOTHING
+        UniqueConstraint('member_id', 'cycle', name='uq_bill_member_cycle'),
+    )
     
     id = Column(Integer, primary_key=True)
     admin_id = Column(Integer, ForeignKey('user.id'), nullable=False)
-    member_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    member_id = Column(Integer, ForeignKey('user.id'), nullable=False, index=True)
     date = Column(Date, nullable=False)
     paid = Column(Boolean, default=False)
+    # First day of the billing month for recurring bills; NULL for one-off bills
+    cycle = Column(Date)
     
     admin = relationship("User", back_populates="bills_as_admin", foreign_keys=[admin_id])
     member = relationship("User", back_populates="bills_as_member", foreign_keys=[member_id])
     items = relationship("Item", back_populates="bill", cascade="all, delete-orphan")
 
 
+class Subscription(Base):
+    """Recurring services (membership and add-ons) billed every cycle"""
+    __tablename__ = 'subscription'
+    __table_args__ = (
+        CheckConstraint('quantity >= 1', name='ck_subscription_quantity'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    member_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    service_id = Column(Integer, ForeignKey('service.id'), nullable=False)
+    quantity = Column(Integer, nullable=False, default=1)
+    start_date = Column(Date, nullable=False)
+    # Last day covered; NULL while the subscription is open-ended
+    end_date = Column(Date)
+    
+    member = relationship("User", back_populates="subscriptions")
+    service = relationship("Service")
+
+
 class Item(Base):
     """Line items on bills"""
     __tablename__ = 'item'
     
     id = Column(Integer, primary_key=True)
-    bill_id = Column(Integer, ForeignKey('bill.id', ondelete='CASCADE'), nullable=False)
+    bill_id = Column(Integer, ForeignKey('bill.id', ondelete='CASCADE'), nullable=False, index=True)
     service_id = Column(Integer, ForeignKey('service.id'), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
     
@@ -90,32 +122,74 @@ class MetricType(Base):
     metric_desc = Column(Text)
     
     metrics = relationship("Metric", back_populates="metric_type_obj")
+    goals = relationship("Goal", back_populates="metric_type_obj")
 
 
 class Metric(Base):
-    """Health metrics logged by members"""
+    """Health metrics logged by members (range-partitioned by month on logged_date)"""
     __tablename__ = 'metric'
+    __table_args__ = (
+        # History/goal lookups filter by user + type and order by time; value is carried so they
+        # can be answered from the index alone
+        Index('ix_metric_user_type_logged', 'user_id', 'metric_type', 'logged_date', postgresql_include=['value']),
+        # Dashboard / trainer lookup: latest metrics of any type for a user
+        Index('ix_metric_user_logged', 'user_id', 'logged_date'),
+        # Monthly partitions are managed by app/partitions.py; metric_default catches anything outside them
+        {'postgresql_partition_by': 'RANGE (logged_date)'},
+    )
     
-    id = Column(Integer, primary_key=True)
+    # The partition key has to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     metric_type = Column(Integer, ForeignKey('metric_type.id'), nullable=False)
     value = Column(DECIMAL(10, 2), nullable=False)
-    logged_date = Column(DateTime, nullable=False, default=datetime.now)
+    logged_date = Column(DateTime, primary_key=True, nullable=False, default=datetime.now)
     
     user = relationship("User", back_populates="metrics")
     metric_type_obj = relationship("MetricType", back_populates="metrics")
-    goals = relationship("Goal", back_populates="target_metric")
+
+
+class MetricRollup(Base):
+    """Per-member summaries of metric readings by day, week, month and all time"""
+    __tablename__ = 'metric_rollup'
+    __table_args__ = (
+        CheckConstraint("period IN ('day', 'week', 'month', 'all')", name='ck_metric_rollup_period'),
+    )
+    
+    # Derived from metric and rebuilt at will, so no FKs: their per-row checks doubled backfill time.
+    # A trigger on user clears a deleted member's buckets instead (USER_ROLLUP_DDL).
+    # Trend screens read one member's buckets by type and period, so the key doubles as their index.
+    user_id = Column(Integer, primary_key=True)
+    metric_type = Column(Integer, primary_key=True)
+    period = Column(String(5), primary_key=True)
+    # First day of the bucket (Monday for weeks); a fixed date for the 'all' bucket
+    period_start = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(DECIMAL(14, 2), nullable=False)
+    min_value = Column(DECIMAL(10, 2), nullable=False)
+    max_value = Column(DECIMAL(10, 2), nullable=False)
+    first_value = Column(DECIMAL(10, 2), nullable=False)
+    first_logged = Column(DateTime, nullable=False)
+    last_value = Column(DECIMAL(10, 2), nullable=False)
+    last_logged = Column(DateTime, nullable=False)
 
 
 class Goal(Base):
-    """Fitness goals set by members"""
+    """Fitness goals set by members (one per metric type)"""
     __tablename__ = 'goal'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'metric_type', name='uq_goal_user_type'),
+    )
     
     id = Column(Integer, primary_key=True)
-    metric_id = Column(Integer, ForeignKey('metric.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    metric_type = Column(Integer, ForeignKey('metric_type.id'), nullable=False)
+    target_value = Column(DECIMAL(10, 2), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
     goal_date = Column(Date, nullable=False)
     
-    target_metric = relationship("Metric", back_populates="goals")
+    user = relationship("User", back_populates="goals")
+    metric_type_obj = relationship("MetricType", back_populates="goals")
 
 
 class Room(Base):
@@ -163,9 +237,22 @@ class ScheduleType(Base):
     schedules = relationship("Schedule", back_populates="schedule_type_obj")
 
 
+SCHEDULE_SLOT_SQL = 'tsrange("date" + start_time, "date" + end_time)'
+
+
 class Schedule(Base):
     """Trainer availability and session schedules"""
     __tablename__ = 'schedule'
+    __table_args__ = (
+        # Trainer schedule screen and trainer overlap checks
+        Index('ix_schedule_trainer_date_start', 'trainer_id', 'date', 'start_time'),
+        # Upcoming session/class listings ordered by date and time
+        Index('ix_schedule_date_start', 'date', 'start_time'),
+        # A trainer is never booked twice at once. Equality is an overlap of one-value ranges so the
+        # built-in GiST range support is enough (no btree_gist); the index also serves overlap lookups.
+        ExcludeConstraint((text("int4range(trainer_id, trainer_id, '[]')"), '&&'), ('slot', '&&'),
+                          using='gist', name='ex_schedule_trainer_slot'),
+    )
     
     id = Column(Integer, primary_key=True)
     trainer_id = Column(Integer, ForeignKey('user.id'), nullable=False)
@@ -173,24 +260,42 @@ class Schedule(Base):
     start_time = Column(Time, nullable=False)
     end_time = Column(Time, nullable=False)
     type = Column(Integer, ForeignKey('schedule_type.id'), nullable=False)
+    # [start, end) as one value; back-to-back slots do not overlap. Deferred: screens never read it,
+    # and parsing a range per row roughly doubled the cost of loading schedules
+    slot = deferred(Column(TSRANGE, Computed(SCHEDULE_SLOT_SQL, persisted=True), nullable=False))
     
     trainer = relationship("User", back_populates="schedules", foreign_keys=[trainer_id])
     schedule_type_obj = relationship("ScheduleType", back_populates="schedules")
     session = relationship("Session", back_populates="schedule", uselist=False, cascade="all, delete-orphan")
 
+# Which sessions occupy a room: the predicate of ex_session_room_slot. Queries that read room bookings
+# use it as-is so they count exactly what the constraint does (int4range(NULL, NULL) is unbounded)
+ROOM_BOOKED_SQL = 'room_id IS NOT NULL'
+
 
 class Session(Base):
     """Training sessions and group classes"""
     __tablename__ = 'session'
+    __table_args__ = (
+        # Maintained by the enroll/cancel services so capacity checks never count enrollment rows
+        CheckConstraint('enrolled_count >= 0 AND enrolled_count <= size', name='ck_session_enrolled_count'),
+        # A room never hosts two sessions at once. Partial: int4range(NULL, NULL) is unbounded and would
+        # make a session without a room clash with every room
+        ExcludeConstraint((text("int4range(room_id, room_id, '[]')"), '&&'), ('slot', '&&'),
+                          using='gist', name='ex_session_room_slot', where=text(ROOM_BOOKED_SQL)),
+    )
     
     id = Column(Integer, primary_key=True)
-    schedule_id = Column(Integer, ForeignKey('schedule.id', ondelete='CASCADE'), nullable=False)
+    schedule_id = Column(Integer, ForeignKey('schedule.id', ondelete='CASCADE'), nullable=False, index=True)
     size = Column(Integer, nullable=False)
+    enrolled_count = Column(Integer, nullable=False, default=0, server_default=text('0'))
     name = Column(String(100), nullable=False)
     desc = Column(Text)
     location = Column(String(255))
-    room_id = Column(Integer, ForeignKey('room.id'))
+    room_id = Column(Integer, ForeignKey('room.id'), index=True)
     sex_restrict = Column(CHAR(1), CheckConstraint("sex_restrict IN ('M', 'F', 'A')"))
+    # Copy of schedule.slot kept by triggers, so the room constraint can live on this table (deferred like it)
+    slot = deferred(Column(TSRANGE, nullable=False, server_default=FetchedValue(), server_onupdate=FetchedValue()))
     
     schedule = relationship("Schedule", back_populates="session")
     enrollments = relationship("Enrollment", back_populates="session", cascade="all, delete-orphan")
@@ -204,9 +309,149 @@ class Enrollment(Base):
     
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('session.id', ondelete='CASCADE'), nullable=False)
-    member_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    member_id = Column(Integer, ForeignKey('user.id'), nullable=False, index=True)
     attended = Column(Boolean, default=False)
     
     session = relationship("Session", back_populates="enrollments")
     member = relationship("User", back_populates="enrollments")
 
+
+# Busy bitmaps split each day into slots of this many minutes
+BITMAP_SLOT_MINUTES = 15
+BITMAP_DAY_SLOTS = 24 * 60 // BITMAP_SLOT_MINUTES
+
+
+class BusyBitmap(Base):
+    """One trainer's ('T') or room's ('R') bookings on one day as a bitset of fixed-length slots"""
+    __tablename__ = 'busy_bitmap'
+    __table_args__ = (
+        CheckConstraint("kind IN ('T', 'R')", name='ck_busy_bitmap_kind'),
+    )
+    
+    # Derived from schedule and session by triggers and rebuilt at will, so no FKs (owner_id is a
+    # trainer or a room depending on kind). Free-slot searches read a range of days by the key.
+    kind = Column(CHAR(1), primary_key=True)
+    owner_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    # Bit i (from the left) is set when anything is booked during slot i; days without a row are free
+    busy = Column(BIT(BITMAP_DAY_SLOTS), nullable=False)
+
+
+# A partitioned table accepts no rows until it has a partition; the default one takes anything
+# that falls outside the monthly partitions
+event.listen(Metric.__table__, "after_create", DDL("CREATE TABLE metric_default PARTITION OF metric DEFAULT"))
+
+# metric_rollup has no FK to cascade through, so a deleted member's buckets go with the statement
+# that deleted them (their readings go with metric's ON DELETE CASCADE)
+USER_ROLLUP_DDL = [
+    """CREATE OR REPLACE FUNCTION user_drop_rollups() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM metric_rollup r USING old_users o WHERE r.user_id = o.id;
+        RETURN NULL;
+    END $$""",
+    """CREATE TRIGGER tg_user_drop_rollups AFTER DELETE ON "user" REFERENCING OLD TABLE AS old_users
+    FOR EACH STATEMENT EXECUTE FUNCTION user_drop_rollups()""",
+]
+for statement in USER_ROLLUP_DDL:
+    event.listen(User.__table__, "after_create", DDL(statement))
+
+# session.slot follows its schedule: filled on insert (or a schedule change) and updated when the
+# schedule's times move. Bulk loads that skip triggers write it themselves.
+SESSION_SLOT_DDL = [
+    """CREATE OR REPLACE FUNCTION session_slot() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        SELECT slot INTO NEW.slot FROM schedule WHERE id = NEW.schedule_id;
+        RETURN NEW;
+    END $$""",
+    """CREATE TRIGGER tg_session_slot BEFORE INSERT OR UPDATE OF schedule_id, slot ON session
+    FOR EACH ROW EXECUTE FUNCTION session_slot()""",
+    """CREATE OR REPLACE FUNCTION schedule_session_slot() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE session SET slot = NEW.slot WHERE schedule_id = NEW.id;
+        RETURN NULL;
+    END $$""",
+    """CREATE TRIGGER tg_schedule_session_slot AFTER UPDATE OF date, start_time, end_time ON schedule
+    FOR EACH ROW WHEN (OLD.slot IS DISTINCT FROM NEW.slot) EXECUTE FUNCTION schedule_session_slot()""",
+]
+for statement in SESSION_SLOT_DDL:
+    event.listen(Session.__table__, "after_create", DDL(statement))
+
+# busy_bitmap follows schedule (trainers) and session (rooms). Inserts and deletes refresh every
+# touched day in one set-based pass per statement, so bulk series and planner writes stay cheap;
+# updates refresh per row and only when the booking moved. A refresh locks the days' bitmap rows
+# (in key order) before counting the bookings, so concurrent bookings on the same day cannot
+# overwrite each other's bits.
+BUSY_BITMAP_DDL = [
+    """CREATE OR REPLACE FUNCTION slot_mask(slot tsrange, day date) RETURNS bit(<N>)
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT CASE WHEN b > a THEN (repeat('0', a) || repeat('1', b - a) || repeat('0', <N> - b))::bit(<N>)
+                    ELSE repeat('0', <N>)::bit(<N>) END
+        FROM (SELECT greatest(0, floor(extract(epoch FROM lower(slot) - day) / <S>))::int AS a,
+                     least(<N>, ceil(extract(epoch FROM upper(slot) - day) / <S>))::int AS b) bounds
+    $$""",
+    """CREATE OR REPLACE FUNCTION refresh_busy_bitmaps(bitmap_kind char, owners integer[], days date[])
+    RETURNS void LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO busy_bitmap (kind, owner_id, day, busy)
+        SELECT DISTINCT bitmap_kind, o, d, repeat('0', <N>)::bit(<N>) FROM unnest(owners, days) AS k(o, d)
+        WHERE o IS NOT NULL ORDER BY 2, 3 ON CONFLICT DO NOTHING;
+        PERFORM 1 FROM busy_bitmap WHERE kind = bitmap_kind AND (owner_id, day) IN (SELECT * FROM unnest(owners, days))
+        ORDER BY owner_id, day FOR UPDATE;
+        IF bitmap_kind = 'T' THEN
+            UPDATE busy_bitmap b SET busy = coalesce((SELECT bit_or(slot_mask(s.slot, b.day)) FROM schedule s
+                                                      WHERE s.trainer_id = b.owner_id AND s.date = b.day),
+                                                     repeat('0', <N>)::bit(<N>))
+            WHERE b.kind = 'T' AND (b.owner_id, b.day) IN (SELECT * FROM unnest(owners, days));
+        ELSE
+            UPDATE busy_bitmap b SET busy = coalesce((SELECT bit_or(slot_mask(s.slot, b.day)) FROM session s
+                                                      WHERE s.room_id IS NOT NULL
+                                                        AND int4range(s.room_id, s.room_id, '[]')
+                                                            && int4range(b.owner_id, b.owner_id, '[]')
+                                                        AND s.slot && tsrange(b.day, b.day + 1)),
+                                                     repeat('0', <N>)::bit(<N>))
+            WHERE b.kind = 'R' AND (b.owner_id, b.day) IN (SELECT * FROM unnest(owners, days));
+        END IF;
+    END $$""",
+    """CREATE OR REPLACE FUNCTION schedule_busy_bitmap() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_LEVEL = 'ROW' THEN
+            PERFORM refresh_busy_bitmaps('T', ARRAY[OLD.trainer_id, NEW.trainer_id], ARRAY[OLD.date, NEW.date]);
+        ELSIF TG_OP = 'INSERT' THEN
+            PERFORM refresh_busy_bitmaps('T', array_agg(trainer_id), array_agg(date)) FROM new_rows;
+        ELSE
+            PERFORM refresh_busy_bitmaps('T', array_agg(trainer_id), array_agg(date)) FROM old_rows;
+        END IF;
+        RETURN NULL;
+    END $$""",
+    """CREATE TRIGGER tg_schedule_busy_insert AFTER INSERT ON schedule REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION schedule_busy_bitmap()""",
+    """CREATE TRIGGER tg_schedule_busy_delete AFTER DELETE ON schedule REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION schedule_busy_bitmap()""",
+    """CREATE TRIGGER tg_schedule_busy_update AFTER UPDATE OF trainer_id, date, start_time, end_time ON schedule
+    FOR EACH ROW WHEN (OLD.trainer_id IS DISTINCT FROM NEW.trainer_id OR OLD.slot IS DISTINCT FROM NEW.slot)
+    EXECUTE FUNCTION schedule_busy_bitmap()""",
+    """CREATE OR REPLACE FUNCTION session_busy_bitmap() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_LEVEL = 'ROW' THEN
+            PERFORM refresh_busy_bitmaps('R', ARRAY[OLD.room_id, NEW.room_id],
+                                         ARRAY[lower(OLD.slot)::date, lower(NEW.slot)::date]);
+        ELSIF TG_OP = 'INSERT' THEN
+            PERFORM refresh_busy_bitmaps('R', array_agg(room_id), array_agg(lower(slot)::date)) FROM new_rows;
+        ELSE
+            PERFORM refresh_busy_bitmaps('R', array_agg(room_id), array_agg(lower(slot)::date)) FROM old_rows;
+        END IF;
+        RETURN NULL;
+    END $$""",
+    """CREATE TRIGGER tg_session_busy_insert AFTER INSERT ON session REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION session_busy_bitmap()""",
+    """CREATE TRIGGER tg_session_busy_delete AFTER DELETE ON session REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION session_busy_bitmap()""",
+    """CREATE TRIGGER tg_session_busy_update AFTER UPDATE OF room_id, slot ON session
+    FOR EACH ROW WHEN (OLD.room_id IS DISTINCT FROM NEW.room_id OR OLD.slot IS DISTINCT FROM NEW.slot)
+    EXECUTE FUNCTION session_busy_bitmap()""",
+]
+BUSY_BITMAP_DDL = [statement.replace("<N>", str(BITMAP_DAY_SLOTS)).replace("<S>", str(BITMAP_SLOT_MINUTES * 60))
+                   for statement in BUSY_BITMAP_DDL]
+# Attached to session, the last of the tables the triggers watch to be created
+for statement in BUSY_BITMAP_DDL:
+    event.listen(Session.__table__, "after_create", DDL(statement))
@@ -0,0 +1,147 @@
+# Services Package
+# Business operations that take and return plain data; the CLI is a thin adapter over these.
+
+from .common import ServiceError, transaction
+from . import lookups
+from .bookings import weekly_dates
+from .availability import (
+    next_free_slots,
+    rebuild_busy_bitmaps
+)
+from .utilisation import room_utilisation
+from .planner import (
+    class_requests,
+    plan_classes,
+    schedule_classes
+)
+from .rollups import (
+    metric_trends,
+    rebuild_metric_rollups
+)
+from .imports import (
+    detect_format,
+    import_metrics
+)
+from .accounts import (
+    user_to_dict,
+    authenticate,
+    register_member,
+    get_account,
+    update_phone,
+    change_password
+)
+from .members import (
+    list_metric_types,
+    dashboard,
+    log_metric,
+    stream_metric_history,
+    metric_history,
+    find_goal,
+    set_goal,
+    goal_progress,
+    club_goal_progress,
+    browse_sessions,
+    enroll,
+    refresh_enrolled_counts,
+    upcoming_enrollments,
+    cancel_enrollment
+)
+from .trainers import (
+    list_schedule_types,
+    trainer_schedule,
+    add_availability,
+    add_availability_series,
+    list_assigned_members,
+    filter_members,
+    member_summaries,
+    assigned_members
+)
+from .admin import (
+    list_equipment,
+    get_equipment,
+    list_equipment_statuses,
+    update_equipment_status,
+    list_classes,
+    list_trainers,
+    list_members,
+    list_rooms,
+    create_class,
+    create_class_series,
+    cancel_class,
+    list_services,
+    create_bill,
+    unpaid_bills,
+    receivables,
+    billing_cycle,
+    list_subscriptions,
+    subscribe,
+    end_subscription,
+    run_billing_cycle,
+    mark_paid
+)
+
+__all__ = [
+    'ServiceError',
+    'transaction',
+    'lookups',
+    'weekly_dates',
+    'next_free_slots',
+    'rebuild_busy_bitmaps',
+    'room_utilisation',
+    'class_requests',
+    'plan_classes',
+    'schedule_classes',
+    'metric_trends',
+    'rebuild_metric_rollups',
+    'detect_format',
+    'import_metrics',
+    'user_to_dict',
+    'authenticate',
+    'register_member',
+    'get_account',
+    'update_phone',
+    'change_password',
+    'list_metric_types',
+    'dashboard',
+    'log_metric',
+    'stream_metric_history',
+    'metric_history',
+    'find_goal',
+    'set_goal',
+    'goal_progress',
+    'club_goal_progress',
+    'browse_sessions',
+    'enroll',
+    'refresh_enrolled_counts',
+    'upcoming_enrollments',
+    'cancel_enrollment',
+    'list_schedule_types',
+    'trainer_schedule',
+    'add_availability',
+    'add_availability_series',
+    'list_assigned_members',
+    'filter_members',
+    'member_summaries',
+    'assigned_members',
+    'list_equipment',
+    'get_equipment',
+    'list_equipment_statuses',
+    'update_equipment_status',
+    'list_classes',
+    'list_trainers',
+    'list_members',
+    'list_rooms',
+    'create_class',
+    'create_class_series',
+    'cancel_class',
+    'list_services',
+    'create_bill',
+    'unpaid_bills',
+    'receivables',
+    'billing_cycle',
+    'list_subscriptions',
+    'subscribe',
+    'end_subscription',
+    'run_billing_cycle',
+    'mark_paid'
+]
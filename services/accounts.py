@@ -0,0 +1,84 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Account services (login, registration, profile)
+
+from datetime import date
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import User
+from services import lookups
+from services.common import ServiceError, pg_error_code, transaction
+
+
+def user_to_dict(session: Session, user: User) -> Dict[str, object]:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "date_of_birth": user.date_of_birth,
+        "sex": user.sex,
+        "phone": user.phone,
+        "role": lookups.by_id(session, "role", user.role)["name"],
+    }
+
+
+def authenticate(session: Session, email: str, password: str) -> Optional[Dict[str, object]]:
+    """Return the user matching the credentials, or None."""
+    # SELECT * FROM user WHERE email = ? AND password = ? LIMIT 1
+    user = session.query(User).filter_by(email=email, password=password).first()
+    return user_to_dict(session, user) if user else None
+
+
+def register_member(session: Session, email: str, password: str, first_name: str, last_name: str,
+                    date_of_birth: Optional[date], sex: Optional[str], phone: Optional[str]) -> Dict[str, object]:
+    """Create a new member account."""
+    if sex and sex not in ("M", "F", "O"):
+        raise ServiceError("Sex must be M, F or O.")
+    member_role_id = lookups.require_id(session, "role", "Member")
+    try:
+        with transaction(session):
+            new_user = User(
+                email=email,
+                password=password,
+                first_name=first_name,
+                last_name=last_name,
+                date_of_birth=date_of_birth,
+                sex=sex,
+                phone=phone,
+                role=member_role_id
+            )
+            session.add(new_user)
+            session.flush()
+            return user_to_dict(session, new_user)
+    except IntegrityError as e:
+        # The unique email constraint, also when two sign-ups race for the same address
+        if pg_error_code(e) == "23505":
+            raise ServiceError("An account with this email already exists.")
+        raise
+
+
+def _get_user(session: Session, user_id: int) -> User:
+    user = session.get(User, user_id)
+    if not user:
+        raise ServiceError("User not found.")
+    return user
+
+
+def get_account(session: Session, user_id: int) -> Dict[str, object]:
+    return user_to_dict(session, _get_user(session, user_id))
+
+
+def update_phone(session: Session, user_id: int, phone: str) -> None:
+    with transaction(session):
+        _get_user(session, user_id).phone = phone
+
+
+def change_password(session: Session, user_id: int, new_password: str) -> None:
+    if not new_password:
+        raise ServiceError("Password cannot be empty.")
+    with transaction(session):
+        _get_user(session, user_id).password = new_password
@@ -0,0 +1,112 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Free-slot search over the per-day busy bitmaps of trainers and rooms
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models.models import BITMAP_DAY_SLOTS, BITMAP_SLOT_MINUTES, ROOM_BOOKED_SQL
+from services.common import ServiceError
+
+# Free slots are only offered inside club hours
+OPEN_TIME = time(6, 0)
+CLOSE_TIME = time(22, 0)
+# How many days ahead a search looks
+SEARCH_DAYS = 28
+MAX_SLOTS = 50
+
+# SELECT kind, day, busy FROM busy_bitmap WHERE (kind, owner_id) IN (...) AND day BETWEEN ? AND ?
+_BITMAPS_SQL = text("""
+    SELECT kind, day, busy::text FROM busy_bitmap
+    WHERE ((kind = 'T' AND owner_id = :trainer_id) OR (kind = 'R' AND owner_id = :room_id))
+      AND day BETWEEN :first AND :last
+""")
+
+# Every trainer's and room's bitmaps from the bookings, in one pass (after bulk loads or a migration)
+_REBUILD_SQL = [
+    text("TRUNCATE busy_bitmap"),
+    text("""
+        INSERT INTO busy_bitmap (kind, owner_id, day, busy)
+        SELECT 'T', trainer_id, date, bit_or(slot_mask(slot, date)) FROM schedule GROUP BY trainer_id, date
+    """),
+    text(f"""
+        INSERT INTO busy_bitmap (kind, owner_id, day, busy)
+        SELECT 'R', room_id, lower(slot)::date, bit_or(slot_mask(slot, lower(slot)::date)) FROM session
+        WHERE {ROOM_BOOKED_SQL} GROUP BY room_id, lower(slot)::date
+    """),
+]
+
+
+def _slot(t: time, round_up: bool = False) -> int:
+    """Slot index of a time of day, rounded down (or up) to the slot grid."""
+    minutes = t.hour * 60 + t.minute + (t.second > 0 or t.microsecond > 0)
+    return -(-minutes // BITMAP_SLOT_MINUTES) if round_up else minutes // BITMAP_SLOT_MINUTES
+
+
+def _bits(busy: str) -> int:
+    """A bit(n) value as an int whose bit i is slot i (Postgres writes slot 0 leftmost)."""
+    return int(busy[::-1], 2)
+
+
+def _runs(free: int, length: int) -> int:
+    """Bit i set where slots i .. i + length - 1 are all free (shift-and, doubling the run each step)."""
+    run, width = free, 1
+    while width < length:
+        step = min(width, length - width)
+        run &= run >> step
+        width += step
+    return run
+
+
+def rebuild_busy_bitmaps(session: Union[Session, Connection]) -> int:
+    """Recompute every bitmap from schedule and session in the caller's transaction; returns their number."""
+    for statement in _REBUILD_SQL:
+        session.execute(statement)
+    # SELECT count(*) FROM busy_bitmap
+    return session.execute(text("SELECT count(*) FROM busy_bitmap")).scalar()
+
+
+def next_free_slots(session: Session, length_minutes: int, count: int = 5, trainer_id: Optional[int] = None,
+                    room_id: Optional[int] = None, after: Optional[datetime] = None,
+                    days: int = SEARCH_DAYS) -> List[Dict[str, object]]:
+    """The next `count` non-overlapping free slots of `length_minutes` for a trainer, a room or both.
+
+    One keyed read fetches the bitmaps for the whole search; each day is then answered with
+    bitwise operations (free = open hours minus the trainer's and room's busy bits). Lengths are
+    rounded up to whole slots. Returns [{"date", "start_time", "end_time"}], earliest first.
+    """
+    if trainer_id is None and room_id is None:
+        raise ServiceError("Pick a trainer or a room.")
+    if length_minutes < 1 or count < 1 or count > MAX_SLOTS:
+        raise ServiceError(f"Length must be positive and count between 1 and {MAX_SLOTS}.")
+    length = -(-length_minutes // BITMAP_SLOT_MINUTES)
+    after = after or datetime.now()
+    first = after.date()
+    busy: Dict[date, int] = {}
+    for _, day, bits in session.execute(_BITMAPS_SQL, {"trainer_id": trainer_id, "room_id": room_id,
+                                                       "first": first, "last": first + timedelta(days=days - 1)}):
+        busy[day] = busy.get(day, 0) | _bits(bits)
+
+    open_hours = ((1 << _slot(CLOSE_TIME)) - 1) & ~((1 << _slot(OPEN_TIME, round_up=True)) - 1)
+    everything = (1 << BITMAP_DAY_SLOTS) - 1
+    slots = []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        free = open_hours & ~busy.get(day, 0) & everything
+        if offset == 0:
+            free &= ~((1 << _slot(after.time(), round_up=True)) - 1)
+        starts = _runs(free, length)
+        while starts and len(slots) < count:
+            i = (starts & -starts).bit_length() - 1
+            start = datetime.combine(day, time()) + timedelta(minutes=i * BITMAP_SLOT_MINUTES)
+            end = start + timedelta(minutes=length * BITMAP_SLOT_MINUTES)
+            slots.append({"date": day, "start_time": start.time(), "end_time": end.time()})
+            # Slots are offered back to back, not overlapping
+            starts &= ~((1 << (i + length)) - 1)
+        if len(slots) == count:
+            break
+    return slots
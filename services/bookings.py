@@ -0,0 +1,154 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Recurring bookings: weekly date rules and one-pass conflict checks against existing bookings
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import DefaultDict, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from models import Schedule, Session as TrainingSession
+from models.models import ROOM_BOOKED_SQL
+from services import lookups
+from services.common import BOOKING_CONFLICTS, ServiceError
+
+# Upper bound on slots created by one series (a year of daily slots)
+MAX_SERIES_SLOTS = 366
+# A series is re-planned this many times if a booking made meanwhile trips the exclusion constraints
+SERIES_ATTEMPTS = 3
+
+# SELECT lower(slot), upper(slot) FROM schedule WHERE trainer_id = ? AND slot && [?, ?)
+# Written like ex_schedule_trainer_slot so the constraint's GiST index answers it
+_TRAINER_BOOKINGS_SQL = text("""
+    SELECT lower(slot), upper(slot) FROM schedule
+    WHERE int4range(trainer_id, trainer_id, '[]') && int4range(:id, :id, '[]') AND slot && tsrange(:lo, :hi)
+""")
+# SELECT lower(slot), upper(slot) FROM session WHERE room_id = ? AND slot && [?, ?)
+# ROOM_BOOKED_SQL matches the partial ex_session_room_slot, so its index answers this too
+_ROOM_BOOKINGS_SQL = text(f"""
+    SELECT lower(slot), upper(slot) FROM session
+    WHERE {ROOM_BOOKED_SQL} AND int4range(room_id, room_id, '[]') && int4range(:id, :id, '[]')
+      AND slot && tsrange(:lo, :hi)
+""")
+# Every trainer's and room's bookings in a time range, for planners working across all of them
+# SELECT trainer_id, lower(slot), upper(slot) FROM schedule WHERE slot && [?, ?)
+_ALL_TRAINER_BOOKINGS_SQL = text("""
+    SELECT trainer_id, lower(slot), upper(slot) FROM schedule WHERE slot && tsrange(:lo, :hi)
+""")
+# SELECT room_id, lower(slot), upper(slot) FROM session WHERE room_id IS NOT NULL AND slot && [?, ?)
+_ALL_ROOM_BOOKINGS_SQL = text(f"""
+    SELECT room_id, lower(slot), upper(slot) FROM session WHERE {ROOM_BOOKED_SQL} AND slot && tsrange(:lo, :hi)
+""")
+
+
+def weekly_dates(first_date: date, weekdays: Iterable[int], weeks: int,
+                 skip_dates: Iterable[date] = ()) -> List[date]:
+    """Dates falling on `weekdays` (0 = Monday) in the `weeks` weeks from first_date, minus skip_dates."""
+    days = set(weekdays)
+    if weeks < 1:
+        raise ServiceError("Number of weeks must be at least 1.")
+    if not days or not days <= set(range(7)):
+        raise ServiceError("Pick at least one weekday.")
+    skip = set(skip_dates)
+    dates = [d for d in (first_date + timedelta(days=n) for n in range(weeks * 7))
+             if d.weekday() in days and d not in skip]
+    if not dates:
+        raise ServiceError("The recurrence does not produce any dates.")
+    if len(dates) > MAX_SERIES_SLOTS:
+        raise ServiceError(f"A series can create at most {MAX_SERIES_SLOTS} slots.")
+    return dates
+
+
+class _Intervals:
+    """One trainer's or room's bookings as disjoint [start, end) intervals sorted by start.
+
+    The exclusion constraints keep them disjoint, so their ends are sorted as well and only the
+    last interval starting before a candidate ends can overlap it: one binary search per check.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[datetime, datetime]]):
+        ordered = sorted(intervals)
+        self.starts = [start for start, _ in ordered]
+        self.ends = [end for _, end in ordered]
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.ends[i - 1] > start
+
+    def add(self, start: datetime, end: datetime) -> None:
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def _bookings(session: Session, sql, key_id: int, lo: datetime, hi: datetime) -> _Intervals:
+    return _Intervals(tuple(row) for row in session.execute(sql, {"id": key_id, "lo": lo, "hi": hi}))
+
+
+def all_bookings(session: Session, lo: datetime, hi: datetime) -> Tuple[DefaultDict[int, _Intervals],
+                                                                         DefaultDict[int, _Intervals]]:
+    """Every trainer's and every room's bookings overlapping [lo, hi), by trainer id and by room id."""
+    grouped = []
+    for sql in (_ALL_TRAINER_BOOKINGS_SQL, _ALL_ROOM_BOOKINGS_SQL):
+        rows = defaultdict(list)
+        for key_id, start, end in session.execute(sql, {"lo": lo, "hi": hi}):
+            rows[key_id].append((start, end))
+        intervals = defaultdict(lambda: _Intervals(()))
+        intervals.update((key_id, _Intervals(pairs)) for key_id, pairs in rows.items())
+        grouped.append(intervals)
+    return grouped[0], grouped[1]
+
+
+def plan_series(session: Session, dates: List[date], start_time: time, end_time: time, trainer_id: int,
+                room_id: Optional[int] = None) -> Tuple[List[date], List[Dict[str, object]]]:
+    """Split a series into the dates that are free and the conflicts to skip.
+
+    The trainer's (and room's) bookings over the whole series are read once, then every candidate
+    is checked in memory. Returns (free dates, [{"date", "reason"}]).
+    """
+    if end_time <= start_time:
+        raise ServiceError("End time must be after start time.")
+    lo = datetime.combine(min(dates), start_time)
+    hi = datetime.combine(max(dates), end_time)
+    checks = [(_bookings(session, _TRAINER_BOOKINGS_SQL, trainer_id, lo, hi),
+               BOOKING_CONFLICTS["ex_schedule_trainer_slot"])]
+    if room_id is not None:
+        checks.append((_bookings(session, _ROOM_BOOKINGS_SQL, room_id, lo, hi),
+                       BOOKING_CONFLICTS["ex_session_room_slot"]))
+
+    free, skipped = [], []
+    for day in sorted(set(dates)):
+        start, end = datetime.combine(day, start_time), datetime.combine(day, end_time)
+        reason = next((message for intervals, message in checks if intervals.overlaps(start, end)), None)
+        if reason:
+            skipped.append({"date": day, "reason": reason})
+            continue
+        for intervals, _ in checks:
+            intervals.add(start, end)
+        free.append(day)
+    return free, skipped
+
+
+def insert_classes(session: Session, classes: List[Dict[str, object]]) -> List[int]:
+    """Insert group classes with one multi-row INSERT per table; returns the new session ids in order.
+
+    Each class has trainer_id, date, start_time, end_time, room_id, location, name, desc, size and
+    sex_restrict. Overlaps are left to the exclusion constraints.
+    """
+    group_class_type_id = lookups.require_id(session, "schedule_type", "Group Class")
+    # INSERT INTO schedule (...) VALUES (...), (...) RETURNING id
+    schedule_ids = session.execute(
+        insert(Schedule).returning(Schedule.id, sort_by_parameter_order=True),
+        [{"trainer_id": c["trainer_id"], "date": c["date"], "start_time": c["start_time"],
+          "end_time": c["end_time"], "type": group_class_type_id} for c in classes]
+    ).scalars().all()
+    # INSERT INTO session (...) VALUES (...), (...) RETURNING id
+    return session.execute(
+        insert(TrainingSession).returning(TrainingSession.id, sort_by_parameter_order=True),
+        [{"schedule_id": schedule_id, "size": c["size"], "name": c["name"], "desc": c["desc"],
+          "location": c["location"], "room_id": c["room_id"], "sex_restrict": c["sex_restrict"]}
+         for schedule_id, c in zip(schedule_ids, classes)]
+    ).scalars().all()
@@ -0,0 +1,62 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Shared service helpers
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+
+class ServiceError(Exception):
+    """A business rule rejected the operation; the message is safe to show to users."""
+
+
+def pg_error_code(exc: Exception) -> Optional[str]:
+    """SQLSTATE of a DBAPI error wrapped by SQLAlchemy (psycopg2 or asyncpg), e.g. '23505'."""
+    orig = getattr(exc, "orig", exc)
+    return getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+
+
+def pg_constraint_name(exc: Exception) -> Optional[str]:
+    """Name of the constraint a wrapped DBAPI error violated, if the driver reports it."""
+    orig = getattr(exc, "orig", exc)
+    diag = getattr(orig, "diag", None)
+    if diag is not None:
+        return diag.constraint_name
+    return getattr(getattr(orig, "__cause__", None), "constraint_name", None)
+
+
+# Exclusion constraints that keep bookings apart, and what to tell the user when one fires
+BOOKING_CONFLICTS = {
+    "ex_schedule_trainer_slot": "This time slot overlaps with an existing schedule!",
+    "ex_session_room_slot": "Room is already booked for an overlapping time slot.",
+}
+
+
+def booking_conflict(exc: Exception) -> Optional[ServiceError]:
+    """A friendly error for an overlapping trainer or room booking (SQLSTATE 23P01), else None."""
+    if pg_error_code(exc) != "23P01":
+        return None
+    return ServiceError(BOOKING_CONFLICTS.get(pg_constraint_name(exc), "This booking overlaps another one."))
+
+
+# Latest-reading lookups search this many days back first, so the planner prunes to the newest
+# monthly metric partitions; only members with no recent readings fall back to a full search
+RECENT_METRIC_DAYS = 90
+
+
+def recent_metric_since() -> datetime:
+    return datetime.now() - timedelta(days=RECENT_METRIC_DAYS)
+
+
+@contextmanager
+def transaction(session: Session) -> Iterator[Session]:
+    """Commit the enclosed writes as one unit, rolling back on any error."""
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
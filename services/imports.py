@@ -0,0 +1,280 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Bulk metric import from device exports (CSV or NDJSON), loaded with COPY through a staging table
+
+import csv
+import io
+import json
+import math
+import re
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services import lookups, rollups
+from services.common import ServiceError, transaction
+
+FORMATS = ("csv", "ndjson")
+# Lines sent per COPY; the file itself is never held in memory
+COPY_CHUNK_ROWS = 100_000
+# Rejected lines described in the result (all of them are counted)
+MAX_REPORTED_ERRORS = 10
+# numeric(10, 2)
+MAX_VALUE = 10 ** 8
+# Readings older than this are taken to be misread times, not history
+EARLIEST_READING = datetime(1990, 1, 1)
+
+# Columns that hold the reading's time, and the type/value pair of one-reading-per-line exports
+TIME_COLUMNS = ("logged_date", "timestamp", "datetime", "date_time", "time", "date", "recorded_at", "start_date")
+TYPE_COLUMNS = ("metric_type", "metric", "type", "name")
+VALUE_COLUMNS = ("value", "qty", "quantity")
+# Device names for our metric types, normalised as by _normalise()
+ALIASES = {
+    "weightkg": "weight", "weightlb": "weight", "weightlbs": "weight", "bodymass": "weight", "mass": "weight",
+    "fat": "bodyfat", "bodyfatpercent": "bodyfat", "bodyfatpercentage": "bodyfat", "fatpercent": "bodyfat",
+    "bodymassindex": "bmi",
+    "hr": "heartrate", "bpm": "heartrate", "pulse": "heartrate", "restingheartrate": "heartrate",
+    "restinghr": "heartrate", "heartratebpm": "heartrate",
+    "heightcm": "height", "heightin": "height",
+}
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+_STAGING_SQL = text("""
+    CREATE TEMP TABLE metric_import_staging (
+        line bigint NOT NULL, metric_type integer NOT NULL, value numeric(10, 2) NOT NULL,
+        logged_date timestamp NOT NULL
+    ) ON COMMIT DROP
+""")
+# One row per (metric type, time), the file's last line winning, minus readings the member already has
+_DEDUP_SQL = text("""
+    CREATE TEMP TABLE metric_import ON COMMIT DROP AS
+    SELECT DISTINCT ON (s.metric_type, s.logged_date) s.line, s.metric_type, s.value, s.logged_date
+    FROM metric_import_staging s
+    WHERE NOT EXISTS (SELECT 1 FROM metric m WHERE m.user_id = :member_id AND m.metric_type = s.metric_type
+                                                AND m.logged_date = s.logged_date)
+    ORDER BY s.metric_type, s.logged_date, s.line DESC
+""")
+# INSERT INTO metric SELECT FROM metric_import, in time order so each partition is filled in one run
+_INSERT_SQL = text("""
+    INSERT INTO metric (user_id, metric_type, value, logged_date)
+    SELECT :member_id, metric_type, value, logged_date FROM metric_import ORDER BY logged_date
+""")
+# The new readings as a rollup source; they are unique per type and time, so line stands in for id
+_ROLLUP_SOURCE = """(
+    SELECT line AS id, CAST(:member_id AS integer) AS user_id, metric_type, value, logged_date FROM metric_import
+)"""
+
+
+def _normalise(name: str) -> str:
+    key = _NON_ALNUM.sub("", str(name).lower())
+    return ALIASES.get(key, key)
+
+
+def _metric_type_ids(session: Session) -> Dict[str, int]:
+    """Metric type id by normalised name, alias and id."""
+    ids = {}
+    for mt in lookups.all_rows(session, "metric_type"):
+        ids[_normalise(mt["name"])] = mt["id"]
+        ids[str(mt["id"])] = mt["id"]
+    for alias, name in ALIASES.items():
+        if name in ids:
+            ids[alias] = ids[name]
+    return ids
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "ndjson" if name.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+def _records(fh: TextIO, fmt: str) -> Iterator[Tuple[int, object]]:
+    """(line number, dict or error message) for each data line of the file."""
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, "not valid JSON"
+            continue
+        yield number, record if isinstance(record, dict) else "not a JSON object"
+
+
+def _find(columns: Iterable[str], wanted: Tuple[str, ...]) -> Optional[str]:
+    by_name = {_normalise(c): c for c in columns}
+    for name in wanted:
+        if _normalise(name) in by_name:
+            return by_name[_normalise(name)]
+    return None
+
+
+def _parse_time(raw, latest: datetime) -> datetime:
+    """A reading's time from an ISO string, a compact YYYYMMDD date, or epoch seconds or milliseconds.
+
+    Rejects anything before EARLIEST_READING or after `latest` (normally now).
+    """
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        raw = repr(raw)
+    text_value = str(raw).strip()
+    digits = len(text_value.partition(".")[0])
+    if text_value.replace(".", "", 1).isdigit():
+        if digits == 8 and text_value.isdigit():
+            logged = datetime.strptime(text_value, "%Y%m%d")
+        elif digits == 10:
+            logged = datetime.fromtimestamp(float(text_value))
+        elif digits == 13:
+            # Epoch milliseconds are common in device exports
+            logged = datetime.fromtimestamp(float(text_value) / 1000)
+        else:
+            raise ValueError(f"time {raw!r} is neither YYYYMMDD nor epoch seconds or milliseconds")
+    else:
+        logged = datetime.fromisoformat(text_value)
+        # Readings are stored in local time like everything else the club logs
+        logged = logged.astimezone().replace(tzinfo=None) if logged.tzinfo else logged
+    if not EARLIEST_READING <= logged <= latest:
+        raise ValueError(f"time {raw!r} is before {EARLIEST_READING:%Y} or in the future")
+    return logged
+
+
+def _parse_value(raw) -> str:
+    value = float(raw)
+    if not math.isfinite(value) or value <= 0 or value >= MAX_VALUE:
+        raise ValueError(f"value {raw!r} out of range")
+    return f"{value:.2f}"
+
+
+class _Layout:
+    """Where a file keeps its readings, worked out from the first record's columns.
+
+    Either one reading per line (a type column and a value column) or one column per metric type.
+    """
+
+    def __init__(self, columns: List[str], type_ids: Dict[str, int], mapping: Dict[str, str]):
+        self.time_column = _find(columns, TIME_COLUMNS)
+        if self.time_column is None:
+            raise ServiceError(f"No time column found (expected one of: {', '.join(TIME_COLUMNS)}).")
+        self.type_ids = type_ids
+        self.type_column = _find(columns, TYPE_COLUMNS)
+        self.value_column = _find(columns, VALUE_COLUMNS)
+        self.columns: Dict[str, int] = {}
+        if not (self.type_column and self.value_column):
+            for column in columns:
+                name = mapping.get(column, column)
+                if column != self.time_column and _normalise(name) in type_ids:
+                    self.columns[column] = type_ids[_normalise(name)]
+            if not self.columns:
+                raise ServiceError("No column matches a metric type; map them with column=Metric Name.")
+        for column, name in mapping.items():
+            if column not in columns:
+                raise ServiceError(f"Mapped column '{column}' is not in the file.")
+            if _normalise(name) not in type_ids:
+                raise ServiceError(f"Unknown metric type '{name}'.")
+
+    def readings(self, record: Dict[str, object]) -> Iterator[Tuple[int, str]]:
+        """(metric type id, value) pairs in one record; blank cells are skipped."""
+        if not self.columns:
+            raw_type = record.get(self.type_column)
+            type_id = self.type_ids.get(_normalise(raw_type)) if raw_type not in (None, "") else None
+            if type_id is None:
+                raise ValueError(f"unknown metric type {raw_type!r}")
+            yield type_id, _parse_value(record.get(self.value_column))
+            return
+        for column, type_id in self.columns.items():
+            raw = record.get(column)
+            if raw not in (None, ""):
+                yield type_id, _parse_value(raw)
+
+
+def _copy_lines(cursor, lines: Iterable[str]) -> int:
+    """COPY formatted lines into the staging table, COPY_CHUNK_ROWS at a time."""
+    sql = "COPY metric_import_staging (line, metric_type, value, logged_date) FROM STDIN"
+    buf = io.StringIO()
+    pending = total = 0
+    for line in lines:
+        buf.write(line)
+        pending += 1
+        if pending >= COPY_CHUNK_ROWS:
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+            total += pending
+            buf = io.StringIO()
+            pending = 0
+    if pending:
+        buf.seek(0)
+        cursor.copy_expert(sql, buf)
+        total += pending
+    return total
+
+
+def import_metrics(session: Session, member_id: int, fh: TextIO, fmt: str = "csv",
+                   mapping: Optional[Dict[str, str]] = None,
+                   before_insert: Optional[Callable[[datetime, datetime], None]] = None) -> Dict[str, object]:
+    """Import a member's readings from a CSV or NDJSON export in one transaction.
+
+    The file is parsed as it streams into a staging table, so memory stays flat whatever its size.
+    Readings are deduplicated on (member, metric type, time): within the file the last line wins,
+    and readings the member already has are skipped. Rollups are merged for the new readings only.
+    `mapping` maps file columns to metric type names where automatic matching is not enough.
+    `before_insert` is called with the earliest and latest new reading before they are written.
+    """
+    if fmt not in FORMATS:
+        raise ServiceError(f"Unknown format '{fmt}' (expected {' or '.join(FORMATS)}).")
+    type_ids = _metric_type_ids(session)
+    result = {"rows_read": 0, "readings": 0, "rejected": 0, "errors": [], "duplicates": 0, "imported": 0,
+              "first_logged": None, "last_logged": None}
+
+    def staged_lines() -> Iterator[str]:
+        layout = None
+        latest = datetime.now()
+        for number, record in _records(fh, fmt):
+            result["rows_read"] += 1
+            try:
+                if isinstance(record, str):
+                    raise ValueError(record)
+                if layout is None:
+                    layout = _Layout(list(record), type_ids, mapping or {})
+                logged = _parse_time(record.get(layout.time_column), latest)
+                # A line is taken whole or not at all
+                readings = list(layout.readings(record))
+            except (ValueError, TypeError, OverflowError, OSError) as e:
+                result["rejected"] += 1
+                if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                    result["errors"].append(f"line {number}: {e}")
+                continue
+            for type_id, value in readings:
+                yield f"{number}\t{type_id}\t{value}\t{logged}\n"
+
+    with transaction(session):
+        # SELECT id FROM user WHERE id = ? FOR UPDATE (one import per member at a time)
+        if session.execute(text('SELECT id FROM "user" WHERE id = :member_id FOR UPDATE'),
+                           {"member_id": member_id}).scalar() is None:
+            raise ServiceError("Member not found.")
+        session.execute(_STAGING_SQL)
+        cursor = session.connection().connection.cursor()
+        result["readings"] = _copy_lines(cursor, staged_lines())
+        if not result["readings"]:
+            return result
+        # Temp tables are never auto-analyzed; the dedup plan needs real row counts
+        session.execute(text("ANALYZE metric_import_staging"))
+        session.execute(_DEDUP_SQL, {"member_id": member_id})
+        # SELECT count(*), min(logged_date), max(logged_date) FROM metric_import
+        count, first, last = session.execute(text(
+            "SELECT count(*), min(logged_date), max(logged_date) FROM metric_import")).one()
+        result["duplicates"] = result["readings"] - count
+        if count:
+            if before_insert:
+                before_insert(first, last)
+            result["imported"] = session.execute(_INSERT_SQL, {"member_id": member_id}).rowcount
+            rollups.merge_metric_rollups(session, _ROLLUP_SOURCE, {"member_id": member_id})
+            result["first_logged"], result["last_logged"] = first, last
+    return result
@@ -0,0 +1,148 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# In-process cache for the small lookup tables (roles, metric types, rooms, ...)
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Role, MetricType, ScheduleType, EquipmentStatus, Service, Room
+from services.common import ServiceError
+
+# table -> (model, dict key used by by_name(), row -> dict)
+LOOKUPS: Dict[str, Tuple[type, str, Callable]] = {
+    "role": (Role, "name", lambda r: {"id": r.id, "name": r.name}),
+    "metric_type": (MetricType, "name", lambda mt: {"id": mt.id, "name": mt.metric_name, "desc": mt.metric_desc}),
+    "schedule_type": (ScheduleType, "type", lambda st: {"id": st.id, "type": st.type}),
+    "equipment_status": (EquipmentStatus, "type", lambda s: {"id": s.id, "type": s.type}),
+    "service": (Service, "name", lambda s: {"id": s.id, "name": s.name, "price": s.price}),
+    "room": (Room, "name", lambda r: {"id": r.id, "name": r.name, "capacity": r.capacity}),
+}
+_MODEL_TABLES = {model: table for table, (model, _, _) in LOOKUPS.items()}
+
+
+def _ttl() -> float:
+    # Seconds before an entry is reloaded anyway (covers edits made by other processes); 0 = never
+    value = os.getenv("LOOKUP_CACHE_TTL")
+    return float(value) if value not in (None, "") else 300.0
+
+
+class _Entry:
+    __slots__ = ("rows", "by_id", "by_name", "loaded_at")
+
+    def __init__(self, rows: List[Dict[str, object]], name_key: str):
+        self.rows = rows
+        self.by_id = {row["id"]: row for row in rows}
+        self.by_name = {row[name_key]: row for row in rows}
+        self.loaded_at = time.monotonic()
+
+
+_lock = threading.Lock()
+# (database url, table) -> _Entry
+_entries: Dict[Tuple[str, str], _Entry] = {}
+_counters: Dict[str, Dict[str, int]] = {table: {"hits": 0, "misses": 0, "invalidations": 0} for table in LOOKUPS}
+
+
+def _db_key(session: Session) -> str:
+    # Bind may be an Engine or a Connection (benchmarks); both expose .engine
+    return str(session.get_bind().engine.url)
+
+
+def _entry(session: Session, table: str) -> _Entry:
+    key = (_db_key(session), table)
+    ttl = _ttl()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and (ttl <= 0 or time.monotonic() - entry.loaded_at < ttl):
+            _counters[table]["hits"] += 1
+            return entry
+        _counters[table]["misses"] += 1
+
+    model, name_key, to_dict = LOOKUPS[table]
+    # SELECT * FROM <table> ORDER BY id
+    rows = [to_dict(obj) for obj in session.query(model).order_by(model.id).all()]
+    entry = _Entry(rows, name_key)
+    with _lock:
+        _entries[key] = entry
+    return entry
+
+
+def all_rows(session: Session, table: str) -> List[Dict[str, object]]:
+    """Every row of a lookup table, ordered by id."""
+    return [dict(row) for row in _entry(session, table).rows]
+
+
+def by_id(session: Session, table: str, row_id: int) -> Optional[Dict[str, object]]:
+    row = _entry(session, table).by_id.get(row_id)
+    return dict(row) if row else None
+
+
+def by_name(session: Session, table: str, name: str) -> Optional[Dict[str, object]]:
+    row = _entry(session, table).by_name.get(name)
+    return dict(row) if row else None
+
+
+def require_id(session: Session, table: str, name: str) -> int:
+    """ID of a named lookup row that the app depends on (e.g. the 'Member' role)."""
+    row = _entry(session, table).by_name.get(name)
+    if not row:
+        raise ServiceError(f"Missing {table.replace('_', ' ')} '{name}'; reseed the database.")
+    return row["id"]
+
+
+def warm(session: Session) -> None:
+    """Load every lookup table (call once at startup)."""
+    for table in LOOKUPS:
+        _entry(session, table)
+
+
+def invalidate(*tables: str) -> None:
+    """Drop cached rows for the given tables (all tables if none given), for every database."""
+    targets = tables or tuple(LOOKUPS)
+    with _lock:
+        for key in [k for k in _entries if k[1] in targets]:
+            del _entries[key]
+        for table in targets:
+            _counters[table]["invalidations"] += 1
+
+
+def stats() -> Dict[str, Dict[str, object]]:
+    """Hit/miss/invalidation counters per table."""
+    with _lock:
+        result = {}
+        for table, counts in _counters.items():
+            lookups = counts["hits"] + counts["misses"]
+            result[table] = dict(counts, hit_rate=round(counts["hits"] / lookups, 3) if lookups else None)
+        return result
+
+
+def reset_stats() -> None:
+    with _lock:
+        for counts in _counters.values():
+            counts.update(hits=0, misses=0, invalidations=0)
+
+
+# Invalidate when an ORM edit to a lookup table commits -----------------------
+
+@event.listens_for(Session, "after_flush")
+def _collect_lookup_edits(session, flush_context):
+    touched = {_MODEL_TABLES[type(obj)] for obj in (*session.new, *session.dirty, *session.deleted)
+               if type(obj) in _MODEL_TABLES}
+    if touched:
+        session.info.setdefault("lookup_edits", set()).update(touched)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    touched = session.info.pop("lookup_edits", None)
+    if touched:
+        invalidate(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("lookup_edits", None)
@@ -0,0 +1,445 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Member services (metrics, goals, sessions)
+
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import or_, select, text, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager, joinedload
+
+from models import Metric, Goal, Enrollment, Session as TrainingSession, Schedule, User, Room
+from services import lookups, rollups
+from services.common import ServiceError, pg_error_code, recent_metric_since, transaction
+from services.imports import MAX_VALUE
+
+
+def _latest_metrics(query, limit: int) -> List[Metric]:
+    """Newest-first rows of a metric query, looking in the recent partitions before all of them."""
+    rows = query.filter(Metric.logged_date >= recent_metric_since()).order_by(Metric.logged_date.desc()).limit(limit).all()
+    if len(rows) < limit:
+        rows = query.order_by(Metric.logged_date.desc()).limit(limit).all()
+    return rows
+
+
+def list_metric_types(session: Session) -> List[Dict[str, object]]:
+    return lookups.all_rows(session, "metric_type")
+
+
+def dashboard(session: Session, member_id: int) -> Dict[str, object]:
+    """Recent metrics, goals, attendance count and next sessions for a member."""
+    # SELECT * FROM metric WHERE user_id = ? AND logged_date >= <recent> ORDER BY logged_date DESC LIMIT 5
+    recent_metrics = _latest_metrics(session.query(Metric).filter_by(user_id=member_id)
+                                     .options(joinedload(Metric.metric_type_obj)), 5)
+
+    # SELECT * FROM goal WHERE user_id = ? ORDER BY id
+    goals = session.query(Goal).filter_by(user_id=member_id).order_by(Goal.id).all()
+
+    today = date.today()
+    # Past classes attended count
+    past_count = (session.query(Enrollment)
+                  .join(TrainingSession)
+                  .join(Schedule)
+                  .filter(Enrollment.member_id == member_id,
+                          Schedule.date < today,
+                          Enrollment.attended == True)
+                  .count())
+
+    return {
+        "recent_metrics": [{"metric": m.metric_type_obj.metric_name, "value": m.value, "logged_date": m.logged_date}
+                           for m in recent_metrics],
+        "goals": [_goal_to_dict(session, g) for g in goals],
+        "past_attended": past_count,
+        "upcoming": upcoming_enrollments(session, member_id, limit=5),
+    }
+
+
+def _metric_value(session: Session, metric_type_id: int, value, what: str) -> Decimal:
+    """Check the metric type exists and the value fits numeric(10, 2); returns the value as a Decimal."""
+    if not lookups.by_id(session, "metric_type", metric_type_id):
+        raise ServiceError("Invalid metric type!")
+    value = Decimal(str(value))
+    if not value.is_finite() or abs(value) >= MAX_VALUE:
+        raise ServiceError(f"{what} must be below {MAX_VALUE:,}.")
+    return value
+
+
+def log_metric(session: Session, member_id: int, metric_type_id: int, value,
+               logged_date: Optional[datetime] = None) -> Dict[str, object]:
+    """Record one health metric reading."""
+    value = _metric_value(session, metric_type_id, value, "The value")
+    with transaction(session):
+        new_metric = Metric(
+            user_id=member_id,
+            metric_type=metric_type_id,
+            value=value,
+            logged_date=logged_date or datetime.now()
+        )
+        session.add(new_metric)
+        session.flush()
+        rollups.record_metric(session, new_metric.id, member_id, metric_type_id, new_metric.value,
+                              new_metric.logged_date)
+        return {"id": new_metric.id, "metric_type": metric_type_id, "value": new_metric.value,
+                "logged_date": new_metric.logged_date}
+
+
+# Rows fetched per round trip by the server-side cursor behind stream_metric_history()
+HISTORY_BATCH_SIZE = 2000
+
+
+def _tracked_readings(rows: Iterator, entry: Dict[str, object]) -> Iterator[Dict[str, object]]:
+    """Yield one type's readings, updating the entry's running statistics as each passes through."""
+    total = Decimal(0)
+    for row in rows:
+        value = row.value
+        total += value
+        if entry["count"] == 0:
+            entry["first_value"] = entry["min"] = entry["max"] = value
+        entry["count"] += 1
+        entry["min"] = min(entry["min"], value)
+        entry["max"] = max(entry["max"], value)
+        entry["last_value"] = value
+        entry["average"] = total / entry["count"]
+        if entry["count"] >= 2:
+            entry["change"] = value - entry["first_value"]
+        yield {"logged_date": row.logged_date, "value": value}
+
+
+def stream_metric_history(session: Session, member_id: int,
+                          batch_size: int = HISTORY_BATCH_SIZE) -> Iterator[Dict[str, object]]:
+    """Every metric reading per type, oldest first, from one query read through a server-side cursor.
+
+    Yields one entry per metric type whose "readings" is a lazy iterator. Consume it before moving
+    to the next entry; the entry's count, min, max, average and change are complete once it is
+    exhausted. Memory stays at one batch however long the history is.
+    """
+    names = {mt["id"]: mt["name"] for mt in lookups.all_rows(session, "metric_type")}
+    # SELECT metric_type, logged_date, value FROM metric WHERE user_id = ? ORDER BY metric_type, logged_date
+    query = (select(Metric.metric_type, Metric.logged_date, Metric.value)
+             .where(Metric.user_id == member_id)
+             .order_by(Metric.metric_type, Metric.logged_date))
+    rows = session.execute(query, execution_options={"yield_per": batch_size})
+    for metric_type_id, group in groupby(rows, key=lambda row: row.metric_type):
+        entry = {"metric_type": metric_type_id, "metric": names[metric_type_id],
+                 "count": 0, "first_value": None, "last_value": None, "min": None, "max": None,
+                 "average": None, "change": None}
+        entry["readings"] = _tracked_readings(group, entry)
+        yield entry
+
+
+def metric_history(session: Session, member_id: int) -> List[Dict[str, object]]:
+    """Every metric reading per type, oldest first, with the first-to-last change (materialised)."""
+    history = []
+    for entry in stream_metric_history(session, member_id):
+        readings = list(entry["readings"])
+        history.append(dict(entry, readings=readings))
+    return history
+
+
+def _goal_to_dict(session: Session, goal: Goal) -> Dict[str, object]:
+    return {
+        "id": goal.id,
+        "metric_type": goal.metric_type,
+        "metric": lookups.by_id(session, "metric_type", goal.metric_type)["name"],
+        "target_value": goal.target_value,
+        "goal_date": goal.goal_date,
+        "created_at": goal.created_at,
+    }
+
+
+def find_goal(session: Session, member_id: int, metric_type_id: int) -> Optional[Dict[str, object]]:
+    """Return the member's goal for a metric type, if any."""
+    # SELECT * FROM goal WHERE user_id = ? AND metric_type = ?
+    goal = session.query(Goal).filter_by(user_id=member_id, metric_type=metric_type_id).first()
+    return _goal_to_dict(session, goal) if goal else None
+
+
+# A replaced goal starts over: new target, date and creation time (so a new baseline)
+_SET_GOAL_SQL = text("""
+    INSERT INTO goal (user_id, metric_type, target_value, created_at, goal_date)
+    VALUES (:user_id, :metric_type, :target_value, :created_at, :goal_date)
+    ON CONFLICT (user_id, metric_type) DO UPDATE
+        SET target_value = EXCLUDED.target_value, created_at = EXCLUDED.created_at, goal_date = EXCLUDED.goal_date
+    RETURNING id
+""")
+
+
+def set_goal(session: Session, member_id: int, metric_type_id: int, target_value,
+             goal_date: date) -> Dict[str, object]:
+    """Create the member's goal for a metric type, replacing any existing one."""
+    target_value = _metric_value(session, metric_type_id, target_value, "The target")
+    with transaction(session):
+        goal_id = session.execute(_SET_GOAL_SQL, {
+            "user_id": member_id, "metric_type": metric_type_id, "target_value": target_value,
+            "created_at": datetime.now(), "goal_date": goal_date,
+        }).scalar_one()
+        return _goal_to_dict(session, session.get(Goal, goal_id, populate_existing=True))
+
+
+# Target, latest reading and baseline for every goal matched by {where}, in one statement. Each goal
+# gets two LATERAL lookups on (user_id, metric_type, logged_date): the newest reading, and the newest
+# at or before the goal was set. Percent is capped to 0-100.
+_GOAL_PROGRESS_SQL = """
+    SELECT g.id, g.goal_date, g.user_id AS member_id, u.first_name, u.last_name, g.metric_type,
+           g.target_value, g.created_at,
+           latest.value AS latest_value, latest.logged_date AS latest_date,
+           CASE WHEN latest.value IS NOT NULL AND baseline.value <> g.target_value THEN baseline.value END
+               AS baseline_value,
+           CASE WHEN latest.value IS NOT NULL AND baseline.value <> g.target_value
+                THEN greatest(0, least(1, (latest.value - baseline.value) / (g.target_value - baseline.value))) * 100
+           END AS percent
+    FROM goal g
+    JOIN "user" u ON u.id = g.user_id
+    LEFT JOIN LATERAL (
+        SELECT m.value, m.logged_date FROM metric m
+        WHERE m.user_id = g.user_id AND m.metric_type = g.metric_type
+        ORDER BY m.logged_date DESC LIMIT 1
+    ) latest ON true
+    LEFT JOIN LATERAL (
+        SELECT m.value FROM metric m
+        WHERE m.user_id = g.user_id AND m.metric_type = g.metric_type AND m.logged_date <= g.created_at
+        ORDER BY m.logged_date DESC LIMIT 1
+    ) baseline ON true
+    {where}
+    ORDER BY {order}
+"""
+_MEMBER_GOAL_PROGRESS_SQL = text(_GOAL_PROGRESS_SQL.format(where="WHERE g.user_id = :member_id", order="g.id"))
+_BULK_ORDER = "u.last_name, u.first_name, g.user_id, g.id"
+_CLUB_GOAL_PROGRESS_SQL = text(_GOAL_PROGRESS_SQL.format(where="", order=_BULK_ORDER))
+_SOME_GOAL_PROGRESS_SQL = text(_GOAL_PROGRESS_SQL.format(where="WHERE g.user_id = ANY(:member_ids)",
+                                                         order=_BULK_ORDER))
+
+
+def _progress_to_dict(session: Session, row) -> Dict[str, object]:
+    return {
+        "id": row.id,
+        "member_id": row.member_id,
+        "member": f"{row.first_name} {row.last_name}",
+        "metric_type": row.metric_type,
+        "metric": lookups.by_id(session, "metric_type", row.metric_type)["name"],
+        "target_value": row.target_value,
+        "goal_date": row.goal_date,
+        "created_at": row.created_at,
+        "latest_value": row.latest_value,
+        "latest_date": row.latest_date,
+        "baseline_value": row.baseline_value,
+        "percent": float(row.percent) if row.percent is not None else None,
+    }
+
+
+def goal_progress(session: Session, member_id: int) -> List[Dict[str, object]]:
+    """Target, latest reading, baseline and percent complete for each of a member's goals (one statement)."""
+    rows = session.execute(_MEMBER_GOAL_PROGRESS_SQL, {"member_id": member_id}).all()
+    return [_progress_to_dict(session, row) for row in rows]
+
+
+def club_goal_progress(session: Session, member_ids: Optional[List[int]] = None) -> List[Dict[str, object]]:
+    """Goal progress for every member in the club, or just the given members, in one statement."""
+    if member_ids is None:
+        rows = session.execute(_CLUB_GOAL_PROGRESS_SQL).all()
+    elif not member_ids:
+        return []
+    else:
+        rows = session.execute(_SOME_GOAL_PROGRESS_SQL, {"member_ids": list(member_ids)}).all()
+    return [_progress_to_dict(session, row) for row in rows]
+
+
+SESSION_PAGE_SIZE = 20
+
+
+def _session_cursor(row) -> str:
+    """Opaque keyset position of a listed session: date_start_id."""
+    return f"{row['date'].isoformat()}_{row['start_time'].isoformat()}_{row['id']}"
+
+
+def _parse_session_cursor(cursor: str) -> tuple:
+    try:
+        day, start, session_id = cursor.split("_")
+        return date.fromisoformat(day), time.fromisoformat(start), int(session_id)
+    except (AttributeError, ValueError):
+        raise ServiceError("Invalid page cursor.")
+
+
+def browse_sessions(session: Session, after: Optional[str] = None, limit: int = SESSION_PAGE_SIZE,
+                    date_from: Optional[date] = None, date_to: Optional[date] = None,
+                    trainer_id: Optional[int] = None, room_id: Optional[int] = None,
+                    schedule_type: Optional[int] = None, sex: Optional[str] = None,
+                    open_only: bool = False) -> Dict[str, object]:
+    """One page of upcoming sessions, soonest first, filtered in SQL.
+
+    Pages are keyed on (date, start_time, session id): pass the returned "next" cursor as `after`
+    to get the following page. `sex` hides sessions restricted to the other sex; `open_only`
+    hides full sessions.
+    """
+    if limit < 1:
+        raise ServiceError("Page size must be at least 1.")
+    date_from = max(date_from or date.today(), date.today())
+
+    # SELECT session.*, schedule.date/start/end, trainer name, room name FROM session
+    # JOIN schedule JOIN user LEFT JOIN room WHERE <filters> AND (date, start_time, session.id) > cursor
+    # ORDER BY date, start_time, session.id LIMIT n + 1
+    query = (session.query(TrainingSession.id, TrainingSession.name, TrainingSession.size,
+                           TrainingSession.enrolled_count, TrainingSession.sex_restrict,
+                           TrainingSession.location, Schedule.date, Schedule.start_time, Schedule.end_time,
+                           User.first_name, User.last_name, Room.name.label("room"))
+             .join(Schedule, Schedule.id == TrainingSession.schedule_id)
+             .join(User, User.id == Schedule.trainer_id)
+             .outerjoin(Room, Room.id == TrainingSession.room_id)
+             .filter(Schedule.date >= date_from))
+    if date_to:
+        query = query.filter(Schedule.date <= date_to)
+    if trainer_id:
+        query = query.filter(Schedule.trainer_id == trainer_id)
+    if room_id:
+        query = query.filter(TrainingSession.room_id == room_id)
+    if schedule_type:
+        query = query.filter(Schedule.type == schedule_type)
+    if sex:
+        query = query.filter(or_(TrainingSession.sex_restrict.is_(None),
+                                 TrainingSession.sex_restrict.in_(('A', sex))))
+    if open_only:
+        query = query.filter(TrainingSession.enrolled_count < TrainingSession.size)
+    if after:
+        query = query.filter(tuple_(Schedule.date, Schedule.start_time, TrainingSession.id)
+                             > tuple_(*_parse_session_cursor(after)))
+
+    # One extra row tells us whether another page exists
+    rows = (query.order_by(Schedule.date, Schedule.start_time, TrainingSession.id)
+            .limit(limit + 1).all())
+    sessions = [{
+        "id": r.id,
+        "name": r.name,
+        "date": r.date,
+        "start_time": r.start_time,
+        "end_time": r.end_time,
+        "trainer": f"{r.first_name} {r.last_name}",
+        "location": r.room or r.location or "TBA",
+        "size": r.size,
+        "enrolled": r.enrolled_count,
+        "spots_left": max(0, r.size - r.enrolled_count),
+        "sex_restrict": r.sex_restrict,
+    } for r in rows[:limit]]
+    return {
+        "sessions": sessions,
+        "next": _session_cursor(sessions[-1]) if len(rows) > limit else None,
+    }
+
+
+# Claim a seat and insert the enrollment in one statement. The UPDATE row-locks the session, so
+# concurrent bookers queue on it and re-check enrolled_count < size after the lock is released.
+# It applies the same sex_restrict rule as browse_sessions, with the member's sex read from user.
+# INSERT INTO enrollment ... SELECT FROM (UPDATE session SET enrolled_count = enrolled_count + 1 WHERE ... RETURNING id)
+_ENROLL_SQL = text("""
+    WITH seat AS (
+        UPDATE session SET enrolled_count = enrolled_count + 1
+        WHERE id = :session_id
+          AND enrolled_count < size
+          AND EXISTS (SELECT 1 FROM schedule sc WHERE sc.id = session.schedule_id AND sc.date >= :today)
+          AND (sex_restrict IS NULL OR sex_restrict IN ('A', (SELECT sex FROM "user" WHERE id = :member_id)))
+          AND NOT EXISTS (SELECT 1 FROM enrollment WHERE session_id = :session_id AND member_id = :member_id)
+        RETURNING id
+    )
+    INSERT INTO enrollment (session_id, member_id, attended)
+    SELECT id, :member_id, false FROM seat
+    RETURNING id
+""")
+
+# DELETE FROM enrollment ... then UPDATE session SET enrolled_count = enrolled_count - 1, in one statement.
+# Only upcoming sessions can be cancelled; past enrollments hold the attendance history.
+_CANCEL_SQL = text("""
+    WITH gone AS (
+        DELETE FROM enrollment e WHERE e.id = :enrollment_id AND e.member_id = :member_id
+          AND EXISTS (SELECT 1 FROM session s JOIN schedule sc ON sc.id = s.schedule_id
+                      WHERE s.id = e.session_id AND sc.date >= :today)
+        RETURNING e.session_id
+    )
+    UPDATE session SET enrolled_count = enrolled_count - 1
+    FROM gone WHERE session.id = gone.session_id
+    RETURNING session.id
+""")
+
+
+def _enroll_rejection(session: Session, member_id: int, session_id: int) -> ServiceError:
+    """Explain why the atomic enroll statement claimed no seat."""
+    # SELECT size, enrolled_count, EXISTS(enrollment for member), schedule.date, sex_restrict, member's sex
+    # FROM session JOIN schedule WHERE id = ?
+    row = session.execute(text("""
+        SELECT s.size, s.enrolled_count,
+               EXISTS (SELECT 1 FROM enrollment e WHERE e.session_id = s.id AND e.member_id = :member_id),
+               sc.date, s.sex_restrict, (SELECT sex FROM "user" WHERE id = :member_id)
+        FROM session s JOIN schedule sc ON sc.id = s.schedule_id WHERE s.id = :session_id
+    """), {"session_id": session_id, "member_id": member_id}).first()
+    if not row:
+        return ServiceError("Session not found.")
+    if row[2]:
+        return ServiceError("You are already enrolled in this session.")
+    if row[3] < date.today():
+        return ServiceError("This session has already taken place.")
+    if row[4] not in (None, 'A', row[5]):
+        return ServiceError(f"This session is for {'women' if row[4] == 'F' else 'men'} only.")
+    return ServiceError("This session is full.")
+
+
+def enroll(session: Session, member_id: int, session_id: int) -> Dict[str, object]:
+    """Atomically enroll a member in an upcoming session if they are not already in it and a seat is free."""
+    params = {"session_id": session_id, "member_id": member_id, "today": date.today()}
+    try:
+        with transaction(session):
+            enrollment_id = session.execute(_ENROLL_SQL, params).scalar()
+            if enrollment_id is None:
+                raise _enroll_rejection(session, member_id, session_id)
+    except IntegrityError as e:
+        # The same member booking twice at once: the unique (session_id, member_id) constraint wins
+        if pg_error_code(e) == "23505":
+            raise ServiceError("You are already enrolled in this session.")
+        raise
+    return {"id": enrollment_id, "session_id": session_id, "member_id": member_id}
+
+
+def refresh_enrolled_counts(session: Session) -> int:
+    """Recompute session.enrolled_count from enrollment rows (after bulk loads); returns rows fixed."""
+    with transaction(session):
+        # UPDATE session SET enrolled_count = (SELECT COUNT(*) FROM enrollment ...) WHERE it differs
+        return session.execute(text("""
+            UPDATE session s SET enrolled_count = c.n
+            FROM (SELECT s2.id, count(e.id) AS n
+                  FROM session s2 LEFT JOIN enrollment e ON e.session_id = s2.id
+                  GROUP BY s2.id) c
+            WHERE c.id = s.id AND s.enrolled_count <> c.n
+        """)).rowcount
+
+
+def upcoming_enrollments(session: Session, member_id: int, limit: Optional[int] = None) -> List[Dict[str, object]]:
+    """A member's enrollments from today on, soonest first."""
+    today = date.today()
+    # SELECT * FROM enrollment JOIN session ON enrollment.session_id = session.id JOIN schedule ON session.schedule_id = schedule.id WHERE enrollment.member_id = ? AND schedule.date >= ? ORDER BY schedule.date, schedule.start_time
+    query = session.query(Enrollment).join(TrainingSession).join(Schedule).options(
+        contains_eager(Enrollment.session).contains_eager(TrainingSession.schedule)
+    ).filter(
+        Enrollment.member_id == member_id,
+        Schedule.date >= today
+    ).order_by(Schedule.date, Schedule.start_time)
+    if limit:
+        query = query.limit(limit)
+    return [{
+        "id": e.id,
+        "session_id": e.session_id,
+        "name": e.session.name,
+        "date": e.session.schedule.date,
+        "start_time": e.session.schedule.start_time,
+    } for e in query.all()]
+
+
+def cancel_enrollment(session: Session, member_id: int, enrollment_id: int) -> None:
+    """Remove one of the member's enrollments in an upcoming session and release its seat."""
+    with transaction(session):
+        released = session.execute(_CANCEL_SQL, {"enrollment_id": enrollment_id, "member_id": member_id,
+                                                 "today": date.today()}).scalar()
+        if released is None:
+            # SELECT 1 FROM enrollment WHERE id = ? AND member_id = ?
+            if session.query(Enrollment.id).filter_by(id=enrollment_id, member_id=member_id).first():
+                raise ServiceError("Past sessions cannot be cancelled.")
+            raise ServiceError("Enrollment not found.")
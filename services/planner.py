@@ -0,0 +1,195 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Class planner: assigns trainers, rooms and times to a batch of requested group classes
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import User
+from services import lookups
+from services.bookings import SERIES_ATTEMPTS, all_bookings, insert_classes
+from services.common import ServiceError, booking_conflict, transaction
+
+# Candidate start times inside a window are this many minutes apart
+STEP_MINUTES = 15
+# Largest batch one call will plan
+MAX_REQUESTS = 5000
+
+
+def _parse_window(raw: str) -> Tuple[datetime, datetime]:
+    """'YYYY-MM-DD HH:MM-HH:MM' as (start, end) on that day."""
+    day, _, times = str(raw).strip().partition(" ")
+    start, _, end = times.partition("-")
+    return (datetime.strptime(f"{day} {start.strip()}", "%Y-%m-%d %H:%M"),
+            datetime.strptime(f"{day} {end.strip()}", "%Y-%m-%d %H:%M"))
+
+
+def class_requests(session: Session, records: Iterable[Dict[str, object]],
+                   now: Optional[datetime] = None) -> List[Dict[str, object]]:
+    """Validate requested classes as read from JSON and resolve their trainers.
+
+    Each record has a name, an expected `size`, a `duration` in minutes and `windows` it may run in
+    ("YYYY-MM-DD HH:MM-HH:MM", none starting before `now`). Optional: `desc`, `sex_restrict`, `trainers` (ids or emails, most
+    preferred first) and `any_trainer` (default true: fall back to other trainers when they are busy).
+    """
+    # SELECT id, email FROM user WHERE role = <Trainer>
+    trainer_ids = {}
+    for trainer_id, email in session.query(User.id, User.email).filter_by(
+            role=lookups.require_id(session, "role", "Trainer")):
+        trainer_ids[str(trainer_id)] = trainer_ids[email.lower()] = trainer_id
+
+    now = now or datetime.now()
+    requests = []
+    for n, record in enumerate(records, 1):
+        if len(requests) == MAX_REQUESTS:
+            raise ServiceError(f"At most {MAX_REQUESTS} classes can be planned at once.")
+        try:
+            if not isinstance(record, dict) or not str(record.get("name") or "").strip():
+                raise ValueError("needs a name")
+            size, duration = int(record["size"]), timedelta(minutes=int(record["duration"]))
+            if size < 1 or duration <= timedelta(0):
+                raise ValueError("size and duration must be positive")
+            windows = sorted(_parse_window(w) for w in record.get("windows") or [])
+            if not windows or any(end - start < duration for start, end in windows):
+                raise ValueError("needs windows at least as long as the class")
+            if windows[0][0] < now:
+                raise ValueError(f"window {windows[0][0]:%Y-%m-%d %H:%M} has already started")
+            trainers = []
+            for trainer in record.get("trainers") or []:
+                if str(trainer).lower() not in trainer_ids:
+                    raise ValueError(f"unknown trainer {trainer!r}")
+                trainers.append(trainer_ids[str(trainer).lower()])
+            sex_restrict = str(record.get("sex_restrict") or "A").upper()
+            if sex_restrict not in ("A", "M", "F"):
+                raise ValueError("sex_restrict must be A, M or F")
+            any_trainer = bool(record.get("any_trainer", True))
+            if not trainers and not any_trainer:
+                raise ValueError("any_trainer is false but no trainers are listed")
+        except (KeyError, TypeError, ValueError) as e:
+            raise ServiceError(f"Class {n}: {e}.") from None
+        requests.append({
+            "name": str(record["name"]).strip(), "desc": str(record.get("desc") or ""), "size": size,
+            "duration": duration, "windows": windows, "trainers": trainers, "any_trainer": any_trainer,
+            "sex_restrict": sex_restrict,
+        })
+    return requests
+
+
+def _starts(request: Dict[str, object], step: timedelta) -> Iterator[datetime]:
+    """Candidate start times, earliest first, on a `step` grid inside each window."""
+    for start, end in request["windows"]:
+        while start + request["duration"] <= end:
+            yield start
+            start += step
+
+
+def plan_classes(session: Session, requests: List[Dict[str, object]],
+                 step_minutes: int = STEP_MINUTES) -> Dict[str, List[Dict[str, object]]]:
+    """Assign a trainer, a room and a start time to each request without writing anything.
+
+    Greedy, ordered like graph-colouring heuristics: the most constrained requests (fewest
+    combinations of fitting room, start time and allowed trainer) are placed first, while the most
+    choices remain. Each gets its earliest start at which an allowed trainer and a fitting room are
+    both free, trying preferred trainers first, then the others, least wanted by other requests and
+    least loaded first. Rooms act as the colours: the smallest fitting free room is taken, keeping
+    large rooms for large classes. Existing bookings and those planned so far are checked with the
+    same interval index as recurring series.
+    Returns {"placed": [...], "unplaced": [...]} in request order (`request` counts from 1).
+    """
+    step = timedelta(minutes=step_minutes)
+    if step <= timedelta(0):
+        raise ServiceError("The start time step must be positive.")
+    if not requests:
+        return {"placed": [], "unplaced": []}
+    # Best fit: smallest rooms first
+    rooms = sorted(lookups.all_rows(session, "room"), key=lambda r: (r["capacity"], r["id"]))
+    # SELECT id FROM user WHERE role = <Trainer>
+    trainers = [t for (t,) in session.query(User.id).filter_by(
+        role=lookups.require_id(session, "role", "Trainer")).order_by(User.id)]
+    trainer_busy, room_busy = all_bookings(session, min(start for r in requests for start, _ in r["windows"]),
+                                           max(end for r in requests for _, end in r["windows"]))
+    # Minutes planned per trainer, to spread the classes nobody asked for
+    load = dict.fromkeys(trainers, 0)
+    # Requests naming each trainer; fallback assignments go to the least wanted first
+    wanted = dict.fromkeys(trainers, 0)
+    for r in requests:
+        for t in set(r["trainers"]):
+            wanted[t] += 1
+
+    def constrainedness(i: int) -> tuple:
+        r = requests[i]
+        fitting = sum(1 for room in rooms if room["capacity"] >= r["size"])
+        starts = sum(1 for _ in _starts(r, step))
+        allowed = len(trainers) if r["any_trainer"] else len(r["trainers"])
+        return fitting * starts * allowed, -r["size"], -r["duration"], i
+
+    placed, unplaced = [], []
+    for i in sorted(range(len(requests)), key=constrainedness):
+        r = requests[i]
+        fitting = [room for room in rooms if room["capacity"] >= r["size"]]
+        if not fitting:
+            unplaced.append({"request": i + 1, "name": r["name"], "reason": f"No room holds {r['size']} people."})
+            continue
+        preferred = list(dict.fromkeys(r["trainers"]))
+        tiers = [preferred]
+        if r["any_trainer"]:
+            tiers.append(sorted((t for t in trainers if t not in preferred), key=lambda t: (wanted[t], load[t], t)))
+        choice, trainer_free = None, False
+        for tier in tiers:
+            for start in _starts(r, step):
+                end = start + r["duration"]
+                trainer = next((t for t in tier if not trainer_busy[t].overlaps(start, end)), None)
+                if trainer is None:
+                    continue
+                trainer_free = True
+                room = next((room for room in fitting if not room_busy[room["id"]].overlaps(start, end)), None)
+                if room is not None:
+                    choice = trainer, room, start, end
+                    break
+            if choice:
+                break
+        if choice is None:
+            reason = ("No fitting room is free while an allowed trainer is." if trainer_free
+                      else "No allowed trainer is free in its windows.")
+            unplaced.append({"request": i + 1, "name": r["name"], "reason": reason})
+            continue
+        trainer, room, start, end = choice
+        trainer_busy[trainer].add(start, end)
+        room_busy[room["id"]].add(start, end)
+        load[trainer] += r["duration"] // timedelta(minutes=1)
+        placed.append({
+            "request": i + 1, "name": r["name"], "desc": r["desc"], "size": r["size"],
+            "sex_restrict": r["sex_restrict"], "trainer_id": trainer, "room_id": room["id"],
+            "location": room["name"], "date": start.date(), "start_time": start.time(), "end_time": end.time(),
+        })
+    placed.sort(key=lambda p: p["request"])
+    unplaced.sort(key=lambda u: u["request"])
+    return {"placed": placed, "unplaced": unplaced}
+
+
+def schedule_classes(session: Session, requests: List[Dict[str, object]], dry_run: bool = False,
+                     step_minutes: int = STEP_MINUTES) -> Dict[str, List[Dict[str, object]]]:
+    """Plan the requested classes and create every placed one in a single transaction.
+
+    Placed classes gain the id of their new session. If a booking made meanwhile trips the
+    exclusion constraints, the batch is planned again, up to SERIES_ATTEMPTS times.
+    """
+    if dry_run:
+        return plan_classes(session, requests, step_minutes)
+    for attempt in range(1, SERIES_ATTEMPTS + 1):
+        try:
+            with transaction(session):
+                plan = plan_classes(session, requests, step_minutes)
+                if plan["placed"]:
+                    for placed, session_id in zip(plan["placed"], insert_classes(session, plan["placed"])):
+                        placed["id"] = session_id
+                return plan
+        except IntegrityError as e:
+            conflict = booking_conflict(e)
+            if conflict is None:
+                raise
+            if attempt == SERIES_ATTEMPTS:
+                raise conflict
@@ -0,0 +1,208 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Metric rollups: day/week/month/all-time summaries per (member, metric type), kept current as readings arrive
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from services import lookups
+from services.common import transaction
+
+PERIODS = ("day", "week", "month", "all")
+# period_start of the single all-time bucket
+ALL_TIME = date(1970, 1, 1)
+# Buckets returned per metric type by metric_trends(), ending at the member's latest reading
+TREND_WINDOWS = {"day": 7, "week": 8, "month": 12}
+
+# Folds a set of readings into the rollups; the same statement serves one new reading and a full
+# backfill. {source} is any relation with id, user_id, metric_type, value and logged_date.
+# GROUPING SETS aggregates all four periods in one pass over the readings.
+_MERGE_SQL = """
+    INSERT INTO metric_rollup AS r (user_id, metric_type, period, period_start, count, total,
+                                    min_value, max_value, first_value, first_logged, last_value, last_logged)
+    SELECT user_id, metric_type,
+           CASE WHEN GROUPING(day) = 0 THEN 'day' WHEN GROUPING(week) = 0 THEN 'week'
+                WHEN GROUPING(month) = 0 THEN 'month' ELSE 'all' END,
+           coalesce(day, week, month, DATE '1970-01-01'),
+           count(*), sum(value), min(value), max(value),
+           (array_agg(value ORDER BY logged_date, id))[1], min(logged_date),
+           (array_agg(value ORDER BY logged_date DESC, id DESC))[1], max(logged_date)
+    FROM (
+        SELECT id, user_id, metric_type, value, logged_date, date_trunc('day', logged_date)::date AS day,
+               date_trunc('week', logged_date)::date AS week, date_trunc('month', logged_date)::date AS month
+        FROM {source} s
+    ) m
+    GROUP BY GROUPING SETS ((user_id, metric_type, day), (user_id, metric_type, week),
+                            (user_id, metric_type, month), (user_id, metric_type))
+"""
+# Appended when merging into existing buckets. A full rebuild after TRUNCATE leaves it off: nothing
+# can conflict there, and the speculative-insert path more than doubles its time.
+_ON_CONFLICT_SQL = """
+    ON CONFLICT (user_id, metric_type, period, period_start) DO UPDATE SET
+        count = r.count + EXCLUDED.count,
+        total = r.total + EXCLUDED.total,
+        min_value = least(r.min_value, EXCLUDED.min_value),
+        max_value = greatest(r.max_value, EXCLUDED.max_value),
+        first_value = CASE WHEN EXCLUDED.first_logged < r.first_logged THEN EXCLUDED.first_value ELSE r.first_value END,
+        first_logged = least(r.first_logged, EXCLUDED.first_logged),
+        last_value = CASE WHEN EXCLUDED.last_logged >= r.last_logged THEN EXCLUDED.last_value ELSE r.last_value END,
+        last_logged = greatest(r.last_logged, EXCLUDED.last_logged)
+"""
+
+_RECORD_SQL = text(_MERGE_SQL.format(source="""(
+    SELECT CAST(:id AS integer) AS id, CAST(:user_id AS integer) AS user_id,
+           CAST(:metric_type AS integer) AS metric_type, CAST(:value AS numeric) AS value,
+           CAST(:logged_date AS timestamp) AS logged_date
+)""") + _ON_CONFLICT_SQL)
+
+_READINGS = """(
+    SELECT id, user_id, metric_type, value, logged_date FROM metric {where}
+)"""
+
+# Taking readings out again (partitions detached or dropped): min, max, first and last cannot be
+# subtracted, so the touched buckets are rolled up again from the finer buckets that remain. Day
+# buckets in the removed ranges go; weeks and months overlapping them are rebuilt from their days,
+# and all-time buckets from their months. {removed} is the removed days as one datemultirange.
+_REMOVED = "(SELECT range_agg(daterange(lo, hi)) FROM unnest(CAST(:los AS date[]), CAST(:his AS date[])) AS r(lo, hi))"
+_ROLLED_UP = """sum(count) AS count, sum(total) AS total, min(min_value) AS min_value, max(max_value) AS max_value,
+           (array_agg(first_value ORDER BY first_logged))[1] AS first_value, min(first_logged) AS first_logged,
+           (array_agg(last_value ORDER BY last_logged DESC))[1] AS last_value, max(last_logged) AS last_logged"""
+_FORGET_SQL = [
+    f"DELETE FROM metric_rollup WHERE period = 'day' AND period_start <@ {_REMOVED}",
+    *(statement for unit in ("week", "month") for statement in (
+        f"""DELETE FROM metric_rollup WHERE period = '{unit}'
+            AND daterange(period_start, (period_start + interval '1 {unit}')::date) && {_REMOVED}""",
+        f"""INSERT INTO metric_rollup (user_id, metric_type, period, period_start, count, total, min_value,
+                                       max_value, first_value, first_logged, last_value, last_logged)
+            SELECT user_id, metric_type, '{unit}', bucket, {_ROLLED_UP}
+            FROM (SELECT *, date_trunc('{unit}', period_start)::date AS bucket FROM metric_rollup
+                  WHERE period = 'day') d
+            WHERE daterange(bucket, (bucket + interval '1 {unit}')::date) && {_REMOVED}
+            GROUP BY user_id, metric_type, bucket""",
+    )),
+    f"""DELETE FROM metric_rollup a WHERE a.period = 'all'
+        AND daterange(a.first_logged::date, a.last_logged::date, '[]') && {_REMOVED}
+        AND NOT EXISTS (SELECT 1 FROM metric_rollup m WHERE m.user_id = a.user_id
+                        AND m.metric_type = a.metric_type AND m.period = 'month')""",
+    f"""UPDATE metric_rollup a SET count = m.count, total = m.total, min_value = m.min_value,
+            max_value = m.max_value, first_value = m.first_value, first_logged = m.first_logged,
+            last_value = m.last_value, last_logged = m.last_logged
+        FROM (SELECT user_id, metric_type, {_ROLLED_UP} FROM metric_rollup WHERE period = 'month'
+              GROUP BY user_id, metric_type) m
+        WHERE a.period = 'all' AND a.user_id = m.user_id AND a.metric_type = m.metric_type
+          AND daterange(a.first_logged::date, a.last_logged::date, '[]') && {_REMOVED}""",
+]
+
+# SELECT the all-time row plus the last N day/week/month buckets up to each type's latest reading
+_TRENDS_SQL = text("""
+    SELECT r.metric_type, r.period, r.period_start, r.count, r.total, r.min_value, r.max_value,
+           r.first_value, r.first_logged, r.last_value, r.last_logged
+    FROM metric_rollup a
+    JOIN metric_rollup r ON r.user_id = a.user_id AND r.metric_type = a.metric_type AND (
+        r.period = 'all'
+        OR (r.period = 'month' AND r.period_start >= date_trunc('month', a.last_logged) - make_interval(months => :months - 1))
+        OR (r.period = 'week' AND r.period_start >= date_trunc('week', a.last_logged) - make_interval(weeks => :weeks - 1))
+        OR (r.period = 'day' AND r.period_start >= date_trunc('day', a.last_logged) - make_interval(days => :days - 1)))
+    WHERE a.user_id = :member_id AND a.period = 'all'
+    ORDER BY r.metric_type, r.period, r.period_start
+""")
+
+
+def record_metric(session: Session, metric_id: int, member_id: int, metric_type_id: int, value,
+                  logged_date: datetime) -> None:
+    """Fold one new reading into its day, week, month and all-time buckets (caller's transaction)."""
+    session.execute(_RECORD_SQL, {"id": metric_id, "user_id": member_id, "metric_type": metric_type_id,
+                                  "value": value, "logged_date": logged_date})
+
+
+def merge_metric_rollups(session: Session, source: str, params: Dict[str, object]) -> int:
+    """Fold a batch of new readings into existing buckets (caller's transaction); returns buckets touched.
+
+    `source` is a parenthesised SELECT with id, user_id, metric_type, value and logged_date columns.
+    """
+    return session.execute(text(_MERGE_SQL.format(source=source) + _ON_CONFLICT_SQL), params).rowcount
+
+
+def rebuild_metric_rollups(session: Session, member_id: Optional[int] = None) -> int:
+    """Recompute rollups from the raw readings, for one member or everyone; returns the bucket count."""
+    with transaction(session):
+        if member_id is None:
+            # TRUNCATE locks the table, so no reading can be merged in concurrently
+            session.execute(text("TRUNCATE metric_rollup"))
+            sql, params = _MERGE_SQL.format(source=_READINGS.format(where="")), {}
+        else:
+            session.execute(text("DELETE FROM metric_rollup WHERE user_id = :member_id"), {"member_id": member_id})
+            sql = _MERGE_SQL.format(source=_READINGS.format(where="WHERE user_id = :member_id")) + _ON_CONFLICT_SQL
+            params = {"member_id": member_id}
+        return session.execute(text(sql), params).rowcount
+
+
+def forget_metric_ranges(session: Union[Session, Connection], ranges: List[Tuple[date, date]]) -> int:
+    """Take every reading in the [start, end) date ranges out of the rollups (caller's transaction).
+
+    For readings that are gone from metric as a whole, such as detached or dropped partitions; the
+    ranges must be whole days. Returns the number of buckets deleted or rewritten.
+    """
+    if not ranges:
+        return 0
+    params = {"los": [lo for lo, _ in ranges], "his": [hi for _, hi in ranges]}
+    return sum(session.execute(text(statement), params).rowcount for statement in _FORGET_SQL)
+
+
+def _bucket_starts(period: str, latest: datetime, count: int) -> List[date]:
+    """The last `count` bucket start dates of a period, oldest first, ending at the bucket holding `latest`."""
+    day = latest.date()
+    if period == "month":
+        index = day.year * 12 + day.month - 1
+        return [date((index - n) // 12, (index - n) % 12 + 1, 1) for n in reversed(range(count))]
+    step = 7 if period == "week" else 1
+    end = day.toordinal() - (day.weekday() if period == "week" else 0)
+    return [date.fromordinal(end - n * step) for n in reversed(range(count))]
+
+
+def _bucket(row) -> Dict[str, object]:
+    return {"start": row.period_start, "count": row.count, "average": row.total / row.count,
+            "min": row.min_value, "max": row.max_value, "last": row.last_value}
+
+
+def metric_trends(session: Session, member_id: int) -> List[Dict[str, object]]:
+    """All-time summary and recent day/week/month buckets per metric type, read from the rollups.
+
+    Buckets with no readings are returned as None so the windows stay evenly spaced. The work is
+    bounded by TREND_WINDOWS, however many readings the member has logged.
+    """
+    rows = session.execute(_TRENDS_SQL, {"member_id": member_id, "months": TREND_WINDOWS["month"],
+                                         "weeks": TREND_WINDOWS["week"], "days": TREND_WINDOWS["day"]}).all()
+    by_type: Dict[int, Dict[str, Dict[date, object]]] = {}
+    for row in rows:
+        by_type.setdefault(row.metric_type, {}).setdefault(row.period, {})[row.period_start] = row
+
+    trends = []
+    for mt in lookups.all_rows(session, "metric_type"):
+        periods = by_type.get(mt["id"])
+        if not periods:
+            continue
+        overall = periods["all"][ALL_TIME]
+        entry = {
+            "metric_type": mt["id"],
+            "metric": mt["name"],
+            "count": overall.count,
+            "average": overall.total / overall.count,
+            "min": overall.min_value,
+            "max": overall.max_value,
+            "first_value": overall.first_value,
+            "first_logged": overall.first_logged,
+            "last_value": overall.last_value,
+            "last_logged": overall.last_logged,
+            "change": (overall.last_value - overall.first_value) if overall.count >= 2 else None,
+        }
+        for period, count in TREND_WINDOWS.items():
+            buckets = periods.get(period, {})
+            entry[period + "s"] = [_bucket(buckets[start]) if start in buckets else None
+                                   for start in _bucket_starts(period, overall.last_logged, count)]
+        trends.append(entry)
+    return trends
@@ -0,0 +1,195 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Trainer services (schedule, availability, member lookup)
+
+from datetime import date, time
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from models import Schedule, Session as TrainingSession, Enrollment, User, Metric
+from services import lookups
+from services.bookings import SERIES_ATTEMPTS, plan_series
+from services.common import ServiceError, booking_conflict, recent_metric_since, transaction
+from services.members import club_goal_progress
+
+
+def list_schedule_types(session: Session) -> List[Dict[str, object]]:
+    return lookups.all_rows(session, "schedule_type")
+
+
+def trainer_schedule(session: Session, trainer_id: int) -> List[Dict[str, object]]:
+    """Upcoming schedule entries with any booked session and its participants."""
+    today = date.today()
+    # SELECT * FROM schedule WHERE trainer_id = ? AND date >= ? ORDER BY date, start_time
+    # Session, type, enrollments and members are joined into the same statement
+    schedules = session.query(Schedule).options(
+        joinedload(Schedule.schedule_type_obj),
+        joinedload(Schedule.session)
+        .joinedload(TrainingSession.enrollments)
+        .joinedload(Enrollment.member),
+    ).filter(
+        Schedule.trainer_id == trainer_id,
+        Schedule.date >= today
+    ).order_by(Schedule.date, Schedule.start_time).all()
+
+    entries = []
+    for sched in schedules:
+        entry = {
+            "id": sched.id,
+            "date": sched.date,
+            "start_time": sched.start_time,
+            "end_time": sched.end_time,
+            "type": sched.schedule_type_obj.type,
+            "session": None,
+        }
+        if sched.session:
+            sess = sched.session
+            entry["session"] = {
+                "id": sess.id,
+                "name": sess.name,
+                "size": sess.size,
+                "enrolled": sess.enrolled_count,
+                "participants": [{
+                    "member_id": e.member_id,
+                    "name": f"{e.member.first_name} {e.member.last_name}",
+                    "attended": bool(e.attended),
+                } for e in sess.enrollments],
+            }
+        entries.append(entry)
+    return entries
+
+
+def add_availability(session: Session, trainer_id: int, schedule_date: date, start_time: time,
+                     end_time: time, schedule_type_id: int) -> Dict[str, object]:
+    """Add an availability slot unless it overlaps the trainer's existing schedule."""
+    if end_time <= start_time:
+        raise ServiceError("End time must be after start time.")
+    if not lookups.by_id(session, "schedule_type", schedule_type_id):
+        raise ServiceError("Invalid schedule type!")
+    new_schedule = Schedule(
+        trainer_id=trainer_id,
+        date=schedule_date,
+        start_time=start_time,
+        end_time=end_time,
+        type=schedule_type_id
+    )
+    try:
+        with transaction(session):
+            # The ex_schedule_trainer_slot constraint rejects overlaps with one GiST probe, race-free
+            session.add(new_schedule)
+            session.flush()
+            return {"id": new_schedule.id, "date": schedule_date, "start_time": start_time, "end_time": end_time}
+    except IntegrityError as e:
+        conflict = booking_conflict(e)
+        if conflict:
+            raise conflict
+        raise
+
+
+def add_availability_series(session: Session, trainer_id: int, dates: List[date], start_time: time,
+                            end_time: time, schedule_type_id: int) -> Dict[str, object]:
+    """Add the same slot on many dates in one transaction, skipping those that overlap.
+
+    Returns the new schedule ids and the skipped dates with the reason for each.
+    """
+    if not lookups.by_id(session, "schedule_type", schedule_type_id):
+        raise ServiceError("Invalid schedule type!")
+    for attempt in range(1, SERIES_ATTEMPTS + 1):
+        try:
+            with transaction(session):
+                free, skipped = plan_series(session, dates, start_time, end_time, trainer_id)
+                ids = []
+                if free:
+                    # INSERT INTO schedule (...) VALUES (...), (...) RETURNING id
+                    ids = session.execute(
+                        insert(Schedule).returning(Schedule.id, sort_by_parameter_order=True),
+                        [{"trainer_id": trainer_id, "date": day, "start_time": start_time,
+                          "end_time": end_time, "type": schedule_type_id} for day in free]
+                    ).scalars().all()
+                return {"ids": ids, "skipped": skipped}
+        except IntegrityError as e:
+            # Someone booked one of the free slots after they were read; plan again with theirs
+            conflict = booking_conflict(e)
+            if conflict is None:
+                raise
+            if attempt == SERIES_ATTEMPTS:
+                raise conflict
+
+
+def list_assigned_members(session: Session, trainer_id: int) -> List[Dict[str, object]]:
+    """Members enrolled in any of this trainer's sessions."""
+    # Get all members who have sessions with this trainer
+    # SELECT DISTINCT user.* FROM user JOIN enrollment ON user.id = enrollment.member_id JOIN session ON enrollment.session_id = session.id JOIN schedule ON session.schedule_id = schedule.id WHERE schedule.trainer_id = ?
+    members = session.query(User).join(Enrollment).join(TrainingSession).join(Schedule).filter(
+        Schedule.trainer_id == trainer_id
+    ).distinct().all()
+    return [{"id": m.id, "first_name": m.first_name, "last_name": m.last_name,
+             "email": m.email, "phone": m.phone} for m in members]
+
+
+def filter_members(members: List[Dict[str, object]], search: str) -> List[Dict[str, object]]:
+    """Case-insensitive first/last name match."""
+    needle = search.lower()
+    return [m for m in members
+            if needle in m["first_name"].lower() or needle in m["last_name"].lower()]
+
+
+def member_summaries(session: Session, members: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    """Attach each member's most recent metric and a goal with its progress (two statements in total)."""
+    if not members:
+        return []
+    member_ids = [m["id"] for m in members]
+
+    # Last (most recent) metric per member, searching the recent metric partitions first
+    # SELECT DISTINCT ON (user_id) * FROM metric WHERE user_id IN (...) AND logged_date >= <recent>
+    # ORDER BY user_id, logged_date DESC
+    def last_metric_per_member(ids, since=None):
+        query = (session.query(Metric)
+                 .options(joinedload(Metric.metric_type_obj))
+                 .filter(Metric.user_id.in_(ids)))
+        if since:
+            query = query.filter(Metric.logged_date >= since)
+        return {m.user_id: m for m in query.distinct(Metric.user_id)
+                .order_by(Metric.user_id, Metric.logged_date.desc()).all()}
+
+    last_metrics = last_metric_per_member(member_ids, since=recent_metric_since())
+    stale = [mid for mid in member_ids if mid not in last_metrics]
+    if stale:
+        last_metrics.update(last_metric_per_member(stale))
+
+    # First goal per member, with its progress, from the bulk goal-progress statement
+    goals = {}
+    for goal in club_goal_progress(session, member_ids):
+        goals.setdefault(goal["member_id"], goal)
+
+    results = []
+    for member in members:
+        last_metric = last_metrics.get(member["id"])
+        goal = goals.get(member["id"])
+        results.append(dict(
+            member,
+            last_metric={
+                "metric": last_metric.metric_type_obj.metric_name,
+                "value": last_metric.value,
+                "logged_date": last_metric.logged_date,
+            } if last_metric else None,
+            goal={
+                "metric": goal["metric"],
+                "target_value": goal["target_value"],
+                "goal_date": goal["goal_date"],
+                "latest_value": goal["latest_value"],
+                "percent": goal["percent"],
+            } if goal else None,
+        ))
+    return results
+
+
+def assigned_members(session: Session, trainer_id: int, search: Optional[str] = None) -> List[Dict[str, object]]:
+    """Assigned members (optionally filtered by name) with last metric and goal."""
+    members = list_assigned_members(session, trainer_id)
+    if search:
+        members = filter_members(members, search)
+    return member_summaries(session, members)
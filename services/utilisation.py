@@ -0,0 +1,124 @@
+# Raymond Liu 101264487
+# Afaq Virk 101338854
+# Room utilisation: booked hours, occupancy and no-shows per room and per hour of the week
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services import lookups
+from services.availability import CLOSE_TIME, OPEN_TIME
+from services.common import ServiceError
+
+# Longest range one report covers
+MAX_REPORT_DAYS = 731
+
+# Every session overlapping the range, clipped to it and split into the clock hours it covers, then
+# summed per room and hour of the week, per room, per hour of the week and overall in one pass.
+# Attendance only counts once a session has ended; enrolled members not marked attended are no-shows.
+# Hours booked outside club hours are summed separately too, so they cannot push a room past 100%.
+# SELECT room_id, isodow, hour, COUNT(sessions), SUM(hours), SUM(hours in club hours), SUM(hours * enrolled_count),
+#        SUM(hours * size), SUM(hours * capacity), SUM(hours * enrolled), SUM(hours * absent)
+# FROM session JOIN room, LATERAL (enrollment counts), generate_series(hours)
+# WHERE slot && [?, ?) GROUP BY GROUPING SETS ((room_id, isodow, hour), (room_id), (isodow, hour), ())
+_UTILISATION_SQL = text("""
+    WITH booked AS (
+        SELECT s.room_id, r.capacity, s.size, s.enrolled_count, a.enrolled, a.absent,
+               greatest(lower(s.slot), :lo) AS starts, least(upper(s.slot), :hi) AS ends
+        FROM session s
+        JOIN room r ON r.id = s.room_id
+        LEFT JOIN LATERAL (SELECT count(*) AS enrolled, count(*) FILTER (WHERE e.attended IS NOT TRUE) AS absent
+                           FROM enrollment e WHERE e.session_id = s.id) a ON upper(s.slot) <= :now
+        WHERE s.slot && tsrange(:lo, :hi)
+    ), hourly AS (
+        SELECT b.*, h, h = date_trunc('hour', b.starts) AS first_hour,
+               extract(epoch FROM least(b.ends, h + interval '1 hour') - greatest(b.starts, h))::float8 / 3600 AS hours
+        FROM booked b,
+             generate_series(date_trunc('hour', b.starts), b.ends - interval '1 microsecond', interval '1 hour') AS h
+    )
+    SELECT room_id, extract(isodow FROM h)::int AS dow, extract(hour FROM h)::int AS hour,
+           count(*) FILTER (WHERE first_hour) AS sessions, sum(hours) AS booked_hours,
+           coalesce(sum(hours) FILTER (WHERE extract(hour FROM h) >= :open_hour
+                                         AND extract(hour FROM h) < :close_hour), 0) AS club_booked_hours,
+           sum(hours * enrolled_count) AS enrolled_hours, sum(hours * size) AS size_hours,
+           sum(hours * capacity) AS capacity_hours, sum(hours * enrolled) AS ended_hours,
+           sum(hours * absent) AS absent_hours
+    FROM hourly
+    GROUP BY GROUPING SETS ((room_id, dow, hour), (room_id), (dow, hour), ())
+""")
+
+
+def _pct(part: Optional[float], whole: Optional[float]) -> Optional[float]:
+    return round(100 * (part or 0) / whole, 1) if whole else None
+
+
+def _figures(row, open_hours: float, club_only: bool = False) -> Dict[str, object]:
+    """Counts and percentages for one group of the report (all seat figures weighted by hours booked).
+
+    With `club_only`, booked_pct counts only the hours booked inside club hours, as `open_hours` does.
+    """
+    booked = (row.club_booked_hours if club_only else row.booked_hours) if row else 0.0
+    return {
+        "sessions": row.sessions if row else 0,
+        "booked_hours": round(row.booked_hours, 1) if row else 0.0,
+        "club_booked_hours": round(row.club_booked_hours, 1) if row else 0.0,
+        "open_hours": open_hours,
+        "booked_pct": _pct(booked, open_hours) if row else 0.0,
+        # Enrolled vs class size, enrolled vs room capacity, class size vs room capacity
+        "fill_pct": _pct(row.enrolled_hours, row.size_hours) if row else None,
+        "occupancy_pct": _pct(row.enrolled_hours, row.capacity_hours) if row else None,
+        "size_pct": _pct(row.size_hours, row.capacity_hours) if row else None,
+        "no_show_pct": _pct(row.absent_hours, row.ended_hours) if row else None,
+    }
+
+
+def room_utilisation(session: Session, first: date, last: date,
+                     now: Optional[datetime] = None) -> Dict[str, object]:
+    """How well each room is used from `first` to `last` (inclusive), overall and per hour of the week.
+
+    Everything comes from one grouped query. For a room, the hours booked inside club hours are
+    compared with club hours; for its cells, booked hours are compared with the number of times that
+    hour of the week occurs in the range. Occupancy
+    compares enrolments with the room's capacity; no-shows count ended sessions only. Every room is
+    listed, booked or not; "hours" lists the booked cells as {"dow" (1 = Monday), "hour", ...}.
+    """
+    if last < first:
+        raise ServiceError("The last date must not be before the first.")
+    days = (last - first).days + 1
+    if days > MAX_REPORT_DAYS:
+        raise ServiceError(f"A report covers at most {MAX_REPORT_DAYS} days.")
+    rooms = lookups.all_rows(session, "room")
+    lo, hi = datetime.combine(first, time()), datetime.combine(last + timedelta(days=1), time())
+
+    totals, cells = {}, {}
+    params = {"lo": lo, "hi": hi, "now": now or datetime.now(),
+              "open_hour": OPEN_TIME.hour, "close_hour": CLOSE_TIME.hour}
+    for row in session.execute(_UTILISATION_SQL, params):
+        if row.dow is None:
+            totals[row.room_id] = row
+        else:
+            cells.setdefault(row.room_id, []).append(row)
+
+    # Each hour of the week occurs once for every matching weekday in the range
+    weekdays = [0] * 8
+    for offset in range(min(days, 7)):
+        weekdays[(first + timedelta(days=offset)).isoweekday()] = len(range(offset, days, 7))
+    club_hours = (CLOSE_TIME.hour - OPEN_TIME.hour) * days
+
+    def report(room_id: Optional[int], room_count: int) -> Dict[str, object]:
+        hours = sorted(cells.get(room_id, ()), key=lambda c: (c.dow, c.hour))
+        return {
+            **_figures(totals.get(room_id), club_hours * room_count, club_only=True),
+            "hours": [{"dow": c.dow, "hour": c.hour, **_figures(c, weekdays[c.dow] * room_count)} for c in hours],
+        }
+
+    return {
+        "first": first,
+        "last": last,
+        "days": days,
+        "rooms": [{"room_id": r["id"], "room": r["name"], "capacity": r["capacity"], **report(r["id"], 1)}
+                  for r in rooms],
+        "total": report(None, len(rooms)),
+    }